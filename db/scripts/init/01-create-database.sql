@@ -53,6 +53,17 @@ ENGINE = InnoDB
 DEFAULT CHARACTER SET = utf8;
 
 
+-- -----------------------------------------------------
+-- Table `catalog_version`
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `catalog_version` (
+  `catalog` VARCHAR(64) NOT NULL,
+  `version` INT(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`catalog`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+
 -- -----------------------------------------------------
 -- Table `it_asset_category`
 -- -----------------------------------------------------
@@ -126,6 +137,9 @@ CREATE TABLE IF NOT EXISTS `organization` (
   `tax_id` VARCHAR(16) NOT NULL,
   `legal_name` VARCHAR(128) NOT NULL,
   `trade_name` VARCHAR(128) NULL DEFAULT NULL,
+  `risk_formula` TEXT NULL DEFAULT NULL,
+  `graph_version` INT(11) NOT NULL DEFAULT 0,
+  `totals_version` INT(11) NOT NULL DEFAULT 0,
   `created_on` DATETIME(3) NOT NULL,
   `last_modified_on` DATETIME(3) NOT NULL,
   PRIMARY KEY (`organization_id`),
@@ -144,10 +158,19 @@ CREATE TABLE IF NOT EXISTS `organization_analysis` (
   `organization_analysis_id` INT(11) NOT NULL AUTO_INCREMENT,
   `organization_id` INT(11) NOT NULL,
   `description` VARCHAR(1024) NULL DEFAULT NULL,
+  `scopes` TEXT NULL DEFAULT NULL,
+  `fingerprint` CHAR(64) NULL DEFAULT NULL,
+  `details_format` VARCHAR(16) NULL DEFAULT NULL,
+  `risk_formula` TEXT NULL DEFAULT NULL,
+  `peak_rss_kb` INT(11) NULL DEFAULT NULL,
+  `total_details` INT(11) NULL DEFAULT NULL,
+  `archived_on` DATETIME(3) NULL DEFAULT NULL,
   `created_on` DATETIME(3) NOT NULL,
   `last_modified_on` DATETIME(3) NOT NULL,
   PRIMARY KEY (`organization_analysis_id`),
   INDEX `IX_organization_id` (`organization_id` ASC),
+  INDEX `IX_organization_id_fingerprint` (`organization_id` ASC, `fingerprint` ASC),
+  INDEX `IX_organization_id_created_on` (`organization_id` ASC, `created_on` ASC),
   CONSTRAINT `FK_organization_analysis__organization`
     FOREIGN KEY (`organization_id`)
     REFERENCES `organization` (`organization_id`)
@@ -157,28 +180,57 @@ ENGINE = InnoDB
 DEFAULT CHARACTER SET = utf8;
 
 
+-- -----------------------------------------------------
+-- Table `organization_analysis_archive`
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `organization_analysis_archive` (
+  `organization_analysis_id` INT(11) NOT NULL,
+  `total_details` INT(11) NOT NULL,
+  `content` LONGBLOB NOT NULL,
+  `created_on` DATETIME(3) NOT NULL,
+  PRIMARY KEY (`organization_analysis_id`),
+  CONSTRAINT `FK_organization_analysis_archive__organization_analysis`
+    FOREIGN KEY (`organization_analysis_id`)
+    REFERENCES `organization_analysis` (`organization_analysis_id`)
+    ON DELETE CASCADE
+    ON UPDATE NO ACTION)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+
 -- -----------------------------------------------------
 -- Table `organization_analysis_detail`
 -- -----------------------------------------------------
 CREATE TABLE IF NOT EXISTS `organization_analysis_detail` (
   `organization_analysis_detail_id` INT(11) NOT NULL AUTO_INCREMENT,
   `organization_analysis_id` INT(11) NOT NULL,
-  `department_name` VARCHAR(128) NOT NULL,
-  `macroprocess_name` VARCHAR(128) NOT NULL,
-  `process_name` VARCHAR(128) NOT NULL,
+  `organization_it_service_id` INT(11) NULL DEFAULT NULL,
+  `organization_it_asset_id` INT(11) NULL DEFAULT NULL,
+  `organization_security_threat_id` INT(11) NULL DEFAULT NULL,
+  `department_name` VARCHAR(128) NULL DEFAULT NULL,
+  `department_name_id` MEDIUMINT UNSIGNED NULL DEFAULT NULL,
+  `macroprocess_name` VARCHAR(128) NULL DEFAULT NULL,
+  `macroprocess_name_id` MEDIUMINT UNSIGNED NULL DEFAULT NULL,
+  `process_name` VARCHAR(128) NULL DEFAULT NULL,
+  `process_name_id` MEDIUMINT UNSIGNED NULL DEFAULT NULL,
   `process_relevance` INT(11) NOT NULL,
-  `it_service_name` VARCHAR(128) NOT NULL,
+  `it_service_name` VARCHAR(128) NULL DEFAULT NULL,
+  `it_service_name_id` MEDIUMINT UNSIGNED NULL DEFAULT NULL,
   `it_service_relevance` INT(11) NOT NULL,
-  `it_asset_name` VARCHAR(128) NOT NULL,
+  `it_asset_name` VARCHAR(128) NULL DEFAULT NULL,
+  `it_asset_name_id` MEDIUMINT UNSIGNED NULL DEFAULT NULL,
   `it_asset_relevance` INT(11) NOT NULL,
   `calculated_impact` DECIMAL(5,4) NOT NULL,
-  `security_threat_name` VARCHAR(128) NOT NULL,
+  `security_threat_name` VARCHAR(128) NULL DEFAULT NULL,
+  `security_threat_name_id` MEDIUMINT UNSIGNED NULL DEFAULT NULL,
   `security_threat_level` INT(11) NOT NULL,
   `it_asset_vulnerability_level` INT(11) NOT NULL,
   `calculated_probability` DECIMAL(5,4) NOT NULL,
   `calculated_risk` DECIMAL(5,4) NOT NULL,
+  `risk_rank` INT(11) NULL DEFAULT NULL,
   PRIMARY KEY (`organization_analysis_detail_id`),
-  INDEX `IX_organization_analysis_id` (`organization_analysis_id` ASC),
+  INDEX `IX_organization_analysis_id_risk_rank` (`organization_analysis_id` ASC, `risk_rank` ASC),
+  INDEX `IX_organization_analysis_id_path` (`organization_analysis_id` ASC, `organization_it_service_id` ASC, `organization_it_asset_id` ASC, `organization_security_threat_id` ASC),
   CONSTRAINT `FK_organization_analysis_detail__organization_analysis`
     FOREIGN KEY (`organization_analysis_id`)
     REFERENCES `organization_analysis` (`organization_analysis_id`)
@@ -188,6 +240,77 @@ ENGINE = InnoDB
 DEFAULT CHARACTER SET = utf8;
 
 
+-- -----------------------------------------------------
+-- Table `organization_analysis_job`
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `organization_analysis_job` (
+  `organization_analysis_job_id` INT(11) NOT NULL AUTO_INCREMENT,
+  `organization_id` INT(11) NOT NULL,
+  `organization_analysis_id` INT(11) NULL DEFAULT NULL,
+  `status` VARCHAR(16) NOT NULL,
+  `total_processed_items` INT(11) NULL DEFAULT NULL,
+  `errors` TEXT NULL DEFAULT NULL,
+  `created_on` DATETIME(3) NOT NULL,
+  `started_on` DATETIME(3) NULL DEFAULT NULL,
+  `finished_on` DATETIME(3) NULL DEFAULT NULL,
+  `last_modified_on` DATETIME(3) NOT NULL,
+  PRIMARY KEY (`organization_analysis_job_id`),
+  INDEX `IX_organization_id` (`organization_id` ASC),
+  INDEX `IX_organization_analysis_id` (`organization_analysis_id` ASC),
+  CONSTRAINT `FK_organization_analysis_job__organization`
+    FOREIGN KEY (`organization_id`)
+    REFERENCES `organization` (`organization_id`)
+    ON DELETE CASCADE
+    ON UPDATE NO ACTION,
+  CONSTRAINT `FK_organization_analysis_job__organization_analysis`
+    FOREIGN KEY (`organization_analysis_id`)
+    REFERENCES `organization_analysis` (`organization_analysis_id`)
+    ON DELETE SET NULL
+    ON UPDATE NO ACTION)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+
+-- -----------------------------------------------------
+-- Table `organization_analysis_name`
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `organization_analysis_name` (
+  `organization_analysis_id` INT(11) NOT NULL,
+  `organization_analysis_name_id` MEDIUMINT UNSIGNED NOT NULL,
+  `name` VARCHAR(128) NOT NULL,
+  PRIMARY KEY (`organization_analysis_id`, `organization_analysis_name_id`),
+  CONSTRAINT `FK_organization_analysis_name__organization_analysis`
+    FOREIGN KEY (`organization_analysis_id`)
+    REFERENCES `organization_analysis` (`organization_analysis_id`)
+    ON DELETE CASCADE
+    ON UPDATE NO ACTION)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+
+-- -----------------------------------------------------
+-- Table `organization_analysis_rollup`
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `organization_analysis_rollup` (
+  `organization_analysis_rollup_id` INT(11) NOT NULL AUTO_INCREMENT,
+  `organization_analysis_id` INT(11) NOT NULL,
+  `level` VARCHAR(16) NOT NULL,
+  `name` VARCHAR(128) NOT NULL,
+  `max_risk` DECIMAL(5,4) NOT NULL,
+  `sum_risk` DECIMAL(15,4) NOT NULL,
+  `mean_risk` DECIMAL(5,4) NOT NULL,
+  `total_details` INT(11) NOT NULL,
+  PRIMARY KEY (`organization_analysis_rollup_id`),
+  INDEX `IX_organization_analysis_id_level` (`organization_analysis_id` ASC, `level` ASC),
+  CONSTRAINT `FK_organization_analysis_rollup__organization_analysis`
+    FOREIGN KEY (`organization_analysis_id`)
+    REFERENCES `organization_analysis` (`organization_analysis_id`)
+    ON DELETE CASCADE
+    ON UPDATE NO ACTION)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+
 -- -----------------------------------------------------
 -- Table `organization_department`
 -- -----------------------------------------------------
@@ -226,6 +349,7 @@ CREATE TABLE IF NOT EXISTS `organization_it_asset` (
   PRIMARY KEY (`organization_it_asset_id`),
   INDEX `IX_it_asset_id` (`it_asset_id` ASC),
   INDEX `IX_organization_id` (`organization_id` ASC),
+  INDEX `IX_organization_id_created_on` (`organization_id` ASC, `created_on` ASC),
   CONSTRAINT `FK_organization_it_asset__it_asset`
     FOREIGN KEY (`it_asset_id`)
     REFERENCES `it_asset` (`it_asset_id`)
@@ -374,6 +498,7 @@ CREATE TABLE IF NOT EXISTS `organization_macroprocess` (
   PRIMARY KEY (`organization_macroprocess_id`),
   INDEX `IX_business_macroprocess_id` (`business_macroprocess_id` ASC),
   INDEX `IX_organization_department_id` (`organization_id` ASC, `business_department_id` ASC),
+  INDEX `IX_organization_id_created_on` (`organization_id` ASC, `created_on` ASC),
   CONSTRAINT `FK_organization_macroprocess__business_macroprocess`
     FOREIGN KEY (`business_macroprocess_id`)
     REFERENCES `business_macroprocess` (`business_macroprocess_id`)
@@ -404,6 +529,7 @@ CREATE TABLE IF NOT EXISTS `organization_process` (
   INDEX `IX_relevance_level_id` (`relevance_level_id` ASC),
   INDEX `IX_organization_macroprocess_id` (`organization_macroprocess_id` ASC),
   INDEX `IX_organization_id` (`organization_id` ASC),
+  INDEX `IX_organization_id_created_on` (`organization_id` ASC, `created_on` ASC),
   CONSTRAINT `FK_organization_process__basic_classification_level`
     FOREIGN KEY (`relevance_level_id`)
     REFERENCES `rating_level` (`rating_level_id`)
@@ -444,6 +570,7 @@ CREATE TABLE IF NOT EXISTS `organization_it_service` (
   INDEX `IX_relevance_level_id` (`relevance_level_id` ASC),
   INDEX `IX_organization_process_id` (`organization_process_id` ASC),
   INDEX `IX_organization_id` (`organization_id` ASC),
+  INDEX `IX_organization_id_created_on` (`organization_id` ASC, `created_on` ASC),
   CONSTRAINT `FK_organization_it_service__it_service`
     FOREIGN KEY (`it_service_id`)
     REFERENCES `it_service` (`it_service_id`)
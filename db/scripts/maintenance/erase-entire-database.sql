@@ -10,6 +10,7 @@ delete from it_service where it_service_id > 0;
 delete from it_asset where it_asset_id > 0;
 delete from security_threat where security_threat_id > 0;
 delete from mitigation_control where mitigation_control_id > 0;
+update catalog_version set version = version + 1 where catalog <> '';
 
 -- Erase seed data
 delete from it_asset_category where it_asset_category_id > 0;
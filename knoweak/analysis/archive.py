@@ -0,0 +1,247 @@
+"""
+Cold storage of old analyses.
+
+Details of analyses are rarely read once they get old, but they are most of the
+database. Compaction moves all details of an analysis into a single compressed
+blob in ``organization_analysis_archive`` and deletes their rows. The blob keeps
+the details column by column (in the order of risk), each column as a NumPy array
+compressed separately, so numbers compress well and repeated names are kept once.
+Names of the dictionary and rollups of the analysis are kept as they are.
+
+Archived details are decompressed in memory when read (as arrays, made objects
+only for the range of details read) and kept in a cache of this process limited
+in size, so paging through an archived analysis decompresses it once.
+
+    > python -m knoweak.analysis.archive --older-than-days 365
+"""
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import islice
+
+import numpy as np
+from sqlalchemy import inspect, select
+
+from knoweak.analysis import rollups
+from knoweak.api import constants, paging
+from knoweak.db.models.organization import (
+    OrganizationAnalysis, OrganizationAnalysisArchive, OrganizationAnalysisDetail
+)
+from knoweak.settings import ANALYSIS
+
+# Attributes of details kept in archives. The risk rank is the position of each detail.
+ATTRIBUTES = [attribute for attribute in inspect(OrganizationAnalysisDetail).column_attrs
+              if attribute.key not in ('organization_analysis_id', 'risk_rank')]
+
+# Value that NULL integers are stored as (ids and levels are always positive)
+NULL_INTEGER = -1
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+class ArchivedDetails:
+    """Details of an archived analysis, decompressed into one NumPy array per attribute.
+    Names are kept as codes of the list of names of their attribute (see ``encode``).
+    Details are made Python objects only when they are read, a range at a time.
+    """
+
+    def __init__(self, arrays, names):
+        self.arrays = arrays
+        self.names = names
+        self.size = len(arrays['id'])
+        self.nbytes = sum(values.nbytes for values in arrays.values()) + \
+            sum(sys.getsizeof(name) for names_of_key in names.values() for name in names_of_key)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for start in range(0, self.size, constants.STREAM_BATCH_SIZE):
+            yield from self.get_details(start, start + constants.STREAM_BATCH_SIZE)
+
+    def get_details(self, start, stop):
+        """Gets the details in a range of positions (risk rank - 1) as ``OrganizationAnalysisDetail``
+        objects, which are not added to any session.
+        """
+        values_by_key = {}
+        for attribute in ATTRIBUTES:
+            array = self.arrays[attribute.key][start:stop]
+            values = array.tolist()
+            if attribute.key in self.names:
+                names = self.names[attribute.key]
+                values = [None if code == NULL_INTEGER else names[code] for code in values]
+            elif array.dtype.kind == 'i':
+                values = [None if value == NULL_INTEGER else value for value in values]
+            values_by_key[attribute.key] = values
+
+        keys = list(values_by_key)
+        details = []
+        for position, values in enumerate(zip(*values_by_key.values()), start=start + 1):
+            detail = OrganizationAnalysisDetail(**dict(zip(keys, values)))
+            detail.risk_rank = position
+            details.append(detail)
+        return details
+
+
+def encode(records):
+    """Encodes details as a compressed columnar blob.
+
+    :param records: Rows with the values of ``ATTRIBUTES`` (in that order).
+    :return: The content of the archive (bytes).
+    """
+    arrays = {}
+    for i, attribute in enumerate(ATTRIBUTES):
+        values = [record[i] for record in records]
+        column_type = attribute.columns[0].type.python_type
+        if column_type is str:
+            names = sorted({value for value in values if value is not None})
+            codes_by_name = {name: code for code, name in enumerate(names)}
+            arrays[attribute.key] = np.array([NULL_INTEGER if value is None else codes_by_name[value]
+                                              for value in values], dtype=np.int32)
+            arrays[attribute.key + '.names'] = np.frombuffer(json.dumps(names).encode(), dtype=np.uint8)
+        elif column_type is float:
+            arrays[attribute.key] = np.array(values, dtype=np.float64)
+        else:
+            arrays[attribute.key] = np.array([NULL_INTEGER if value is None else value for value in values],
+                                             dtype=np.int64)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode(content):
+    """Decodes the content of an archive into an ``ArchivedDetails`` object."""
+    arrays, names = {}, {}
+    with np.load(io.BytesIO(content), allow_pickle=False) as archive_arrays:
+        for attribute in ATTRIBUTES:
+            values = archive_arrays[attribute.key]
+            column_type = attribute.columns[0].type.python_type
+            if column_type is str:
+                names[attribute.key] = json.loads(archive_arrays[attribute.key + '.names'].tobytes().decode())
+            elif column_type is not float:
+                # Integer columns are 32 bits in database
+                values = values.astype(np.int32)
+            arrays[attribute.key] = values
+    return ArchivedDetails(arrays, names)
+
+
+def compact(session, analysis):
+    """Moves the details of an analysis into its archive. Nothing is committed.
+
+    :param session: The database session.
+    :param analysis: The ``OrganizationAnalysis`` (not archived yet).
+    :return: The ``OrganizationAnalysisArchive`` created.
+    """
+    detail_table = OrganizationAnalysisDetail.__table__
+
+    # Rollups are computed from details, so they must exist before details are gone
+    if not rollups.has_rollups(session, analysis.id):
+        rollups.compute_rollups(session, analysis)
+
+    if analysis.total_details is None:
+        # Analyses created before ranks are kept in the order they are shown
+        order_by = [detail_table.c.calculated_risk.desc(), detail_table.c.calculated_impact.desc(),
+                    detail_table.c.calculated_probability.desc(), detail_table.c.organization_analysis_detail_id]
+    else:
+        order_by = [detail_table.c.risk_rank]
+
+    query = select([attribute.columns[0] for attribute in ATTRIBUTES]) \
+        .where(detail_table.c.organization_analysis_id == analysis.id) \
+        .order_by(*order_by)
+    records = session.execute(query).fetchall()
+
+    archive = OrganizationAnalysisArchive(organization_analysis_id=analysis.id, total_details=len(records),
+                                          content=encode(records), created_on=datetime.utcnow())
+    session.add(archive)
+    session.execute(detail_table.delete().where(detail_table.c.organization_analysis_id == analysis.id))
+
+    analysis.total_details = len(records)
+    analysis.archived_on = archive.created_on
+    analysis.last_modified_on = archive.created_on
+    paging.invalidate_totals(session, analysis.organization_id)
+    session.flush()
+    return archive
+
+
+def load(session, analysis_id):
+    """Gets the details of an archived analysis, from cache when it was already decompressed.
+
+    :param session: The database session.
+    :param analysis_id: The id of the analysis.
+    :return: An ``ArchivedDetails`` object.
+    """
+    global _cache_bytes
+    with _cache_lock:
+        details = _cache.get(analysis_id)
+        if details is not None:
+            _cache.move_to_end(analysis_id)
+            return details
+
+    content = session \
+        .query(OrganizationAnalysisArchive.content) \
+        .filter(OrganizationAnalysisArchive.organization_analysis_id == analysis_id) \
+        .scalar()
+    details = decode(content)
+
+    # Archives never change, so cached details are never stale
+    with _cache_lock:
+        if analysis_id not in _cache:
+            _cache[analysis_id] = details
+            _cache_bytes += details.nbytes
+        while _cache and _cache_bytes > ANALYSIS['archive_cache_mb'] * 1024 * 1024:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= evicted.nbytes
+    return details
+
+
+def find_analyses_to_compact(session, older_than, organization_id=None):
+    """Gets the ids of analyses created before a date that are not archived yet (oldest first)."""
+    query = session \
+        .query(OrganizationAnalysis.id) \
+        .filter(OrganizationAnalysis.archived_on.is_(None)) \
+        .filter(OrganizationAnalysis.created_on < older_than) \
+        .order_by(OrganizationAnalysis.id)
+    if organization_id is not None:
+        query = query.filter(OrganizationAnalysis.organization_id == organization_id)
+    return [analysis_id for analysis_id, in query]
+
+
+def main():
+    from knoweak.db import Session
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--older-than-days', type=int, default=ANALYSIS['archive_after_days'],
+                        help='Compact analyses created more than these days ago (default from settings).')
+    parser.add_argument('--organization', type=int, help='Compact only the analyses of this organization.')
+    parser.add_argument('--limit', type=int, help='Max number of analyses to compact.')
+    args = parser.parse_args()
+
+    older_than = datetime.utcnow() - timedelta(days=args.older_than_days)
+    session = Session()
+    try:
+        analysis_ids = find_analyses_to_compact(session, older_than, args.organization)
+        total_compacted = 0
+        for analysis_id in islice(analysis_ids, args.limit):
+            # Each analysis is compacted in its own transaction
+            start = time.perf_counter()
+            analysis = session.query(OrganizationAnalysis).get(analysis_id)
+            archive = compact(session, analysis)
+            session.commit()
+            total_compacted += 1
+            print(f'Analysis {analysis_id:<8} {time.perf_counter() - start:>9.4f}s  '
+                  f'{archive.total_details} details in {len(archive.content)} bytes')
+        print(f'Compacted: {total_compacted} analyses created before {older_than.isoformat()}')
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
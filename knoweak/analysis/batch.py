@@ -0,0 +1,125 @@
+"""
+Batch analysis of many organizations at once.
+
+Each organization is analyzed by ``create_analysis`` (as in ``POST /analyses``) in
+a pool of worker processes, sized to the available cores by default, so the total
+time scales with the number of cores instead of the number of organizations.
+Every worker creates its own database engine, as connections cannot be shared
+between processes.
+
+    > python -m knoweak.analysis.batch 1 2 3 --description "Quarter end"
+"""
+import argparse
+import logging
+import os
+import time
+from multiprocessing import Pool
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from knoweak import db
+from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.resources.organization_analysis import create_analysis
+from knoweak.db.models.organization import Organization
+
+logger = logging.getLogger(__name__)
+
+_session_factory = None
+
+
+def init_worker():
+    """Creates the engine of a worker process. The engine inherited from the parent
+    process (when forked) is left untouched, so its connections are not shared.
+    """
+    global _session_factory
+    _session_factory = sessionmaker(bind=create_engine(db.engine.url))
+
+
+def run_organization_analysis(organization_id, description=None, force=False):
+    """Creates an analysis for an organization in the session of the current worker.
+
+    :param organization_id: The code of the organization.
+    :param description: (Optional) The description of the analysis.
+    :param force: (Optional) See ``create_analysis``.
+    :return: A dict with the result of the organization (see ``run_batch``).
+    """
+    result = {
+        'organization_id': organization_id,
+        'succeeded': False,
+        'analysis_id': None,
+        'total_processed_items': None,
+        'elapsed_seconds': None,
+        'errors': None
+    }
+
+    start = time.perf_counter()
+    session = _session_factory()
+    try:
+        if session.query(Organization).get(organization_id) is None:
+            result['errors'] = [build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='organizationId')]
+        else:
+            analysis = create_analysis(session, organization_id, {'description': description}, force)
+            result['succeeded'] = True
+            result['analysis_id'] = analysis.id
+            result['total_processed_items'] = analysis.total_processed_items
+    except HTTPUnprocessableEntity as e:
+        session.rollback()
+        result['errors'] = e.errors
+    except Exception:
+        session.rollback()
+        logger.exception('Analysis of organization %s failed.', organization_id)
+        result['errors'] = [build_error(Message.ERR_ANALYSIS_JOB_FAILED)]
+    finally:
+        session.close()
+
+    result['elapsed_seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(organization_ids, description=None, force=False, workers=None):
+    """Creates an analysis for each organization informed using a pool of processes.
+
+    :param organization_ids: The codes of the organizations.
+    :param description: (Optional) The description of every analysis.
+    :param force: (Optional) See ``create_analysis``.
+    :param workers: (Optional) Number of worker processes. Defaults to the number of cores.
+    :return: A list with a dict per organization (in the order informed) with the keys
+        'organization_id', 'succeeded', 'analysis_id', 'total_processed_items',
+        'elapsed_seconds' and 'errors'.
+    """
+    workers = min(workers or os.cpu_count() or 1, max(len(organization_ids), 1))
+    with Pool(processes=workers, initializer=init_worker) as pool:
+        async_results = [pool.apply_async(run_organization_analysis, (organization_id, description, force))
+                         for organization_id in organization_ids]
+        return [async_result.get() for async_result in async_results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('organizations', type=int, nargs='+', help='Codes of the organizations to analyze.')
+    parser.add_argument('--description', help='Description of the analyses.')
+    parser.add_argument('--force', action='store_true', help='Calculate details even when nothing changed.')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (default is the number of cores).')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_batch(args.organizations, args.description, args.force, args.workers)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        if result['succeeded']:
+            outcome = f"analysis {result['analysis_id']} with {result['total_processed_items']} items"
+        else:
+            outcome = 'failed: ' + '; '.join(error['message'] for error in result['errors'])
+        print(f"Organization {result['organization_id']:<8} {result['elapsed_seconds']:>9.4f}s  {outcome}")
+
+    total_succeeded = sum(1 for result in results if result['succeeded'])
+    print(f'Succeeded: {total_succeeded}/{len(results)} in {elapsed:.4f}s')
+    if total_succeeded < len(results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Bulk persistence of analysis details.
+
+Details are written with SQLAlchemy Core in batches of multiple rows. They are
+neither built as ORM objects nor tracked by the session (no identity map, no
+unit of work flush), which keeps memory and time low for large analyses.
+"""
+from itertools import islice
+
+from sqlalchemy import inspect, literal, select
+
+from knoweak.db.models.organization import OrganizationAnalysisDetail
+
+# Attributes of the model mapped to columns with a different name
+_RENAMED_ATTRIBUTES = [
+    (attribute.key, attribute.columns[0].key)
+    for attribute in inspect(OrganizationAnalysisDetail).column_attrs
+    if attribute.key != attribute.columns[0].key
+]
+
+
+def insert_details(session, analysis_id, details, batch_size):
+    """Inserts details of an analysis in batches within the session transaction.
+
+    :param session: The database session.
+    :param analysis_id: The id of the analysis that owns the details.
+    :param details: An iterable of dicts with the fields of ``OrganizationAnalysisDetail``.
+        The dicts are changed in place to match the names of table columns.
+    :param batch_size: Max number of rows sent to database at once.
+    :return: The number of inserted details.
+    """
+    statement = OrganizationAnalysisDetail.__table__.insert().values(organization_analysis_id=analysis_id)
+
+    total_inserted = 0
+    iterator = iter(details)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        for values in batch:
+            use_column_names(values)
+        session.execute(statement, batch)
+        total_inserted += len(batch)
+
+    return total_inserted
+
+
+def use_column_names(values):
+    for attribute_key, column_key in _RENAMED_ATTRIBUTES:
+        if attribute_key in values:
+            values[column_key] = values.pop(attribute_key)
+
+
+def get_copied_columns():
+    """Gets the columns of details that are copied when details are copied to another analysis."""
+    table = OrganizationAnalysisDetail.__table__
+    return [column for column in table.columns
+            if column.name not in ('organization_analysis_detail_id', 'organization_analysis_id')]
+
+
+def copy_details(session, source_analysis_id, target_analysis_id):
+    """Copies all details of an analysis to another one with a single statement.
+
+    :param session: The database session.
+    :param source_analysis_id: The id of the analysis from which details are copied.
+    :param target_analysis_id: The id of the analysis that will receive the copies.
+    :return: The number of copied details.
+    """
+    table = OrganizationAnalysisDetail.__table__
+    copied_columns = get_copied_columns()
+    query = select([literal(target_analysis_id).label('organization_analysis_id')] + copied_columns) \
+        .where(table.c.organization_analysis_id == source_analysis_id)
+
+    column_names = ['organization_analysis_id'] + [column.name for column in copied_columns]
+    result = session.execute(table.insert().from_select(column_names, query))
+    return result.rowcount
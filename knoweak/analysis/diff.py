@@ -0,0 +1,340 @@
+"""
+Differences between the details of two analyses of an organization.
+
+Details are matched by their path as named in the analyses: the names of its
+department, macroprocess, process, IT service, IT asset and security threat.
+Names are what any two analyses have in common: older analyses don't keep the
+instances of their paths and items that are deleted and created again get new
+instances. A detail is 'new' when only the other analysis has it, 'removed' when
+only the base analysis has it and 'changed' when both have it but with different
+levels or calculated values. Details of the same path in an analysis are paired
+in the order of risk.
+
+Ids of names in dictionary format only mean something in their own analysis, so
+the database can't match them. Instead, each analysis is read once in the order
+of risk (from its archive when archived), its names are coded as integers shared
+by both analyses and details are matched with NumPy. The diff is kept as arrays
+in the order of change, risk rank (in the analysis that has the detail) and id,
+in a cache of this process limited in size. Details of analyses don't change, so
+cached diffs are never stale. Pages read only the details in their range, which
+is found from the page or from the cursor of the previous page.
+"""
+import base64
+import json
+import threading
+from collections import OrderedDict
+from itertools import islice
+
+import numpy as np
+
+from knoweak.analysis import archive
+from knoweak.analysis.names import NAME_ID_FIELDS, NameDictionary
+from knoweak.api import constants
+from knoweak.db.models.organization import OrganizationAnalysisDetail
+from knoweak.settings import ANALYSIS
+
+CHANGE_CHANGED = 'changed'
+CHANGE_NEW = 'new'
+CHANGE_REMOVED = 'removed'
+
+# Changes in the order they are listed (the code of a change is its index)
+CHANGES = [CHANGE_CHANGED, CHANGE_NEW, CHANGE_REMOVED]
+
+COMPARED_FIELDS = [
+    'process_relevance', 'it_service_relevance', 'it_asset_relevance', 'security_threat_level',
+    'it_asset_vulnerability_level', 'calculated_impact', 'calculated_probability', 'calculated_risk'
+]
+
+# Ranks and ids are 32 bits in database, so (change, rank, id) fits in a single 64 bits key
+RANK_SHIFT = 31
+CHANGE_SHIFT = 62
+MAX_KEY_VALUE = (1 << RANK_SHIFT) - 1
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+class AnalysisSide:
+    """Details of one of the analyses of a diff, in the order of risk (their position is the
+    risk rank - 1). Only the ids of details are kept once the diff is made.
+    """
+
+    def __init__(self, analysis, ids, codes=None, values=None):
+        self.analysis_id = analysis.id
+        self.archived = analysis.archived_on is not None
+        self.ids = ids
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_details(self, session, positions):
+        """Gets the details in some positions as ``OrganizationAnalysisDetail`` objects
+        (None for a negative position).
+        """
+        if self.archived:
+            details = archive.load(session, self.analysis_id)
+            return [details.get_details(position, position + 1)[0] if position >= 0 else None
+                    for position in positions]
+
+        ids = [int(self.ids[position]) for position in positions if position >= 0]
+        details_by_id = {}
+        if ids:
+            query = session \
+                .query(OrganizationAnalysisDetail) \
+                .filter(OrganizationAnalysisDetail.id.in_(ids))
+            details_by_id = {detail.id: detail for detail in query}
+        return [details_by_id.get(int(self.ids[position])) if position >= 0 else None for position in positions]
+
+
+class AnalysisDiff:
+    """Differences from an analysis to another one, in the order of change, risk rank and id.
+    Each difference keeps the position of its detail in base and in the other analysis (-1
+    when the analysis doesn't have it).
+    """
+
+    def __init__(self, base, other, changes, ranks, ids, base_positions, other_positions):
+        keys = (changes.astype(np.uint64) << np.uint64(CHANGE_SHIFT)) | \
+            (ranks.astype(np.uint64) << np.uint64(RANK_SHIFT)) | ids.astype(np.uint64)
+        order = np.argsort(keys, kind='stable')
+        self.base = base
+        self.other = other
+        self.keys = keys[order]
+        self.base_positions = base_positions[order]
+        self.other_positions = other_positions[order]
+        self.nbytes = sum(array.nbytes for array in (base.ids, other.ids, self.keys, self.base_positions,
+                                                     self.other_positions))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_rows(self, session, start, stop):
+        """Gets the differences in a range of positions as (change, base detail, other detail)."""
+        base_details = self.base.get_details(session, self.base_positions[start:stop].tolist())
+        other_details = self.other.get_details(session, self.other_positions[start:stop].tolist())
+        changes = (self.keys[start:stop] >> np.uint64(CHANGE_SHIFT)).tolist()
+        return [(CHANGES[change], base_detail, other_detail)
+                for change, base_detail, other_detail in zip(changes, base_details, other_details)]
+
+    def iterate(self, session):
+        """Generates all differences as (change, base detail, other detail), reading their
+        details in batches of STREAM_BATCH_SIZE.
+        """
+        for start in range(0, len(self), constants.STREAM_BATCH_SIZE):
+            yield from self.get_rows(session, start, start + constants.STREAM_BATCH_SIZE)
+
+    def encode_cursor(self, position):
+        """Gets the cursor of the difference in a position: its change, risk rank and id."""
+        key = int(self.keys[position])
+        values = [key >> CHANGE_SHIFT, (key >> RANK_SHIFT) & MAX_KEY_VALUE, key & MAX_KEY_VALUE]
+        content = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(content).decode().rstrip('=')
+
+    def find_position_after(self, cursor):
+        """Gets the position of the first difference after the one of a cursor.
+
+        :raises ValueError: When the cursor is not valid.
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+        except (TypeError, UnicodeDecodeError, base64.binascii.Error):
+            raise ValueError('The cursor is not valid.')
+        if not isinstance(values, list) or len(values) != 3 or \
+                any(type(value) is not int or not 0 <= value <= MAX_KEY_VALUE for value in values) or \
+                values[0] >= len(CHANGES):
+            raise ValueError('The cursor is not valid.')
+
+        change, rank, detail_id = values
+        key = np.uint64((change << CHANGE_SHIFT) | (rank << RANK_SHIFT) | detail_id)
+        return int(np.searchsorted(self.keys, key, side='right'))
+
+
+def get_diff(session, analysis, other_analysis):
+    """Gets the differences from an analysis to another one, from cache when they were already made.
+
+    :param session: The database session.
+    :param analysis: The base ``OrganizationAnalysis``.
+    :param other_analysis: The ``OrganizationAnalysis`` compared to base.
+    :return: An ``AnalysisDiff`` object.
+    """
+    global _cache_bytes
+    # Details of an analysis only move (to its archive), which changes where they are read from
+    key = (analysis.id, analysis.archived_on is not None, other_analysis.id, other_analysis.archived_on is not None)
+    with _cache_lock:
+        analysis_diff = _cache.get(key)
+        if analysis_diff is not None:
+            _cache.move_to_end(key)
+            return analysis_diff
+
+    analysis_diff = make_diff(session, analysis, other_analysis)
+
+    with _cache_lock:
+        if key not in _cache:
+            _cache[key] = analysis_diff
+            _cache_bytes += analysis_diff.nbytes
+        while _cache and _cache_bytes > ANALYSIS['diff_cache_mb'] * 1024 * 1024:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= evicted.nbytes
+    return analysis_diff
+
+
+def make_diff(session, analysis, other_analysis):
+    """Matches the details of two analyses by the names of their paths (see module docs)."""
+    shared_codes = [{} for _ in NAME_ID_FIELDS]
+    base = load_side(session, analysis, shared_codes)
+    other = load_side(session, other_analysis, shared_codes)
+
+    # A path is a single integer, plus the number of times it's repeated before in its analysis
+    paths = combine_columns([np.concatenate((base_codes, other_codes))
+                             for base_codes, other_codes in zip(base.codes, other.codes)],
+                            [len(codes) + 1 for codes in shared_codes])
+    occurrences = np.concatenate((count_occurrences(paths[:len(base)]), count_occurrences(paths[len(base):])))
+    if occurrences.any():
+        paths = np.unique(paths, return_inverse=True)[1].reshape(-1)
+        paths = combine_columns([paths, occurrences], [len(paths), len(paths)])
+    base_paths, other_paths = paths[:len(base)], paths[len(base):]
+
+    # Each path of the other analysis is looked up in the (sorted) paths of base
+    base_order = np.argsort(base_paths, kind='stable')
+    sorted_base_paths = base_paths[base_order]
+    found_positions = np.minimum(np.searchsorted(sorted_base_paths, other_paths), max(len(base) - 1, 0))
+    is_matched = sorted_base_paths[found_positions] == other_paths if len(base) else \
+        np.zeros(len(other), dtype=bool)
+    matched_positions = np.full(len(other), -1, dtype=np.int64)
+    matched_positions[is_matched] = base_order[found_positions[is_matched]]
+
+    is_removed = np.ones(len(base), dtype=bool)
+    is_removed[matched_positions[is_matched]] = False
+    is_changed = is_matched.copy()
+    is_changed[is_matched] = (base.values[matched_positions[is_matched]] != other.values[is_matched]).any(axis=1)
+
+    changed = np.flatnonzero(is_changed)
+    new = np.flatnonzero(~is_matched)
+    removed = np.flatnonzero(is_removed)
+    no_positions = np.full(len(removed), -1, dtype=np.int64)
+
+    changes = np.concatenate((np.full(len(changed), CHANGES.index(CHANGE_CHANGED)),
+                              np.full(len(new), CHANGES.index(CHANGE_NEW)),
+                              np.full(len(removed), CHANGES.index(CHANGE_REMOVED)))).astype(np.int64)
+    ranks = np.concatenate((changed + 1, new + 1, removed + 1))
+    ids = np.concatenate((other.ids[changed], other.ids[new], base.ids[removed]))
+    base_positions = np.concatenate((matched_positions[changed], np.full(len(new), -1, dtype=np.int64), removed))
+    other_positions = np.concatenate((changed, new, no_positions))
+
+    # Names and values are no longer needed
+    base.codes = base.values = other.codes = other.values = None
+    return AnalysisDiff(base, other, changes, ranks, ids, base_positions, other_positions)
+
+
+def load_side(session, analysis, shared_codes):
+    """Reads the ids, names (as shared codes) and compared values of the details of an analysis,
+    in the order of risk.
+
+    :param shared_codes: The codes of names of each field of ``NAME_ID_FIELDS``, shared by both
+        analyses (names not coded yet are added).
+    """
+    dictionary = None
+    if analysis.details_format == constants.ANALYSIS_DETAILS_FORMAT_DICTIONARY:
+        dictionary = NameDictionary.load(session, analysis.id)
+    name_fields = [id_field if dictionary else name_field for name_field, id_field in NAME_ID_FIELDS]
+
+    if analysis.archived_on is not None:
+        details = archive.load(session, analysis.id)
+        ids = details.arrays['id'].astype(np.int64)
+        local_codes = [details.arrays[field].astype(np.int64) for field in name_fields]
+        local_names = [details.names.get(field) for field in name_fields]
+        values = np.column_stack([details.arrays[field].astype(np.float64) for field in COMPARED_FIELDS])
+    else:
+        ids, local_codes, local_names, values = read_details(session, analysis, name_fields, dictionary is None)
+
+    codes = []
+    for field_codes, field_names, field_shared_codes in zip(local_codes, local_names, shared_codes):
+        if field_names is None:
+            # Ids of the dictionary (there may be gaps, which decode as NULL as ids not found)
+            size = max(dictionary.names_by_id, default=0) + 1
+            field_names = [dictionary.decode(name_id) for name_id in range(size)]
+        codes.append(share_codes(field_codes, field_names, field_shared_codes))
+    return AnalysisSide(analysis, ids, codes, values.reshape(len(ids), len(COMPARED_FIELDS)))
+
+
+def read_details(session, analysis, name_fields, has_plain_names):
+    """Reads the details of an analysis in database in batches of STREAM_BATCH_SIZE.
+
+    :return: A tuple with ids, codes of names of each field (-1 for NULL), the names of the codes
+        of each field (None for ids of the dictionary) and compared values.
+    """
+    detail = OrganizationAnalysisDetail
+    if analysis.total_details is None:
+        # Analyses created before ranks are kept in the order they are shown
+        order_by = [detail.calculated_risk.desc(), detail.calculated_impact.desc(),
+                    detail.calculated_probability.desc(), detail.id]
+    else:
+        order_by = [detail.risk_rank]
+
+    columns = [detail.id] + [getattr(detail, field) for field in name_fields] + \
+        [getattr(detail, field) for field in COMPARED_FIELDS]
+    query = session \
+        .query(*columns) \
+        .filter(detail.organization_analysis_id == analysis.id) \
+        .order_by(*order_by) \
+        .yield_per(constants.STREAM_BATCH_SIZE)
+
+    ids, values = [], []
+    local_codes = [[] for _ in name_fields]
+    codes_by_name = [{} for _ in name_fields]
+    rows = iter(query)
+    while True:
+        batch = list(islice(rows, constants.STREAM_BATCH_SIZE))
+        if not batch:
+            break
+        batch_columns = list(zip(*batch))
+        ids.extend(batch_columns[0])
+        for field_codes, field_values, field_codes_by_name in zip(local_codes, batch_columns[1:],
+                                                                  codes_by_name):
+            if has_plain_names:
+                field_values = [-1 if value is None else
+                                field_codes_by_name.setdefault(value, len(field_codes_by_name))
+                                for value in field_values]
+            else:
+                field_values = [-1 if value is None else value for value in field_values]
+            field_codes.append(np.array(field_values, dtype=np.int64))
+        values.append(np.array(batch_columns[1 + len(name_fields):], dtype=np.float64).T)
+
+    local_codes = [np.concatenate(field_codes) if field_codes else np.empty(0, dtype=np.int64)
+                   for field_codes in local_codes]
+    local_names = [list(field_codes_by_name) if has_plain_names else None for field_codes_by_name in codes_by_name]
+    values = np.concatenate(values) if values else np.empty((0, len(COMPARED_FIELDS)))
+    return np.array(ids, dtype=np.int64), local_codes, local_names, values
+
+
+def share_codes(local_codes, local_names, shared_codes):
+    """Maps the codes of names of an analysis (indexes of ``local_names``, -1 for NULL) to
+    codes shared by both analyses.
+    """
+    lookup = np.array([shared_codes.setdefault(name, len(shared_codes)) for name in local_names + [None]],
+                      dtype=np.int64)
+    return lookup[local_codes]
+
+
+def combine_columns(columns, sizes):
+    """Combines columns of codes (from 0 to their size - 1) into a single code per row."""
+    if np.prod([float(size) for size in sizes]) < 2 ** 63:
+        combined = np.zeros(len(columns[0]), dtype=np.int64)
+        for column, size in zip(columns, sizes):
+            combined = combined * size + column
+        return combined
+    return np.unique(np.column_stack(columns), axis=0, return_inverse=True)[1].reshape(-1)
+
+
+def count_occurrences(codes):
+    """Counts the times each code was repeated before it (codes in order of risk)."""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    positions = np.arange(len(codes))
+    group_starts = np.maximum.accumulate(np.where(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]],
+                                                  positions, 0)) if len(codes) else positions
+    occurrences = np.empty(len(codes), dtype=np.int64)
+    occurrences[order] = positions - group_starts
+    return occurrences
@@ -0,0 +1,132 @@
+"""
+Fingerprint of the inputs of an analysis.
+
+Two analyses of the same organization with the same fingerprint have the same
+details. The fingerprint is calculated from the rows of the organization that
+define its paths and levels (not from the paths themselves, which are many more),
+from the state of the catalog tables that provide the names, from the
+normalized scopes and from the formula of the risk.
+
+When the graph of the organization is cached, its rows are not read again: the
+graph keeps the digest of the rows it was built from and the state of catalogs is
+taken from their versions (see ``search.invalidate``), all in a single statement.
+"""
+import hashlib
+import json
+
+from sqlalchemy import func
+
+from knoweak.db.models.catalog import (
+    BusinessDepartment, BusinessMacroprocess, BusinessProcess, CatalogVersion, ITService, ITAsset, SecurityThreat
+)
+from knoweak.db.models.organization import (
+    OrganizationDepartment, OrganizationMacroprocess, OrganizationProcess, OrganizationITService,
+    OrganizationITServiceITAsset, OrganizationITAsset, OrganizationSecurityThreat, OrganizationITAssetVulnerability
+)
+
+# Change it whenever the way details are calculated changes
+VERSION = 3
+
+CATALOG_MODELS = [BusinessDepartment, BusinessMacroprocess, BusinessProcess, ITService, ITAsset, SecurityThreat]
+
+
+def compute(session, organization_id, scopes, formula, organization_graph=None):
+    """Calculates the fingerprint of the inputs of an analysis.
+
+    :param session: The database session.
+    :param organization_id: The code of the organization.
+    :param scopes: Scopes as returned by ``scoping.remove_redundant_scopes``.
+    :param formula: The ``formulas.Formula`` used to calculate the risk.
+    :param organization_graph: (Optional) The cached ``graph.OrganizationGraph`` of the organization.
+        When informed, the rows of the organization are not read (see module docs).
+    :return: A SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'v{VERSION}'.encode())
+    digest.update(formula.hash.encode())
+    digest.update(json.dumps(normalize_scopes(scopes)).encode())
+
+    if organization_graph is not None:
+        digest.update(organization_graph.rows_digest.encode())
+        query = session \
+            .query(CatalogVersion.catalog, CatalogVersion.version) \
+            .filter(CatalogVersion.catalog.in_([model.__tablename__ for model in CATALOG_MODELS])) \
+            .order_by(CatalogVersion.catalog)
+        digest.update(b'versions' + repr([tuple(row) for row in query]).encode())
+        return digest.hexdigest()
+
+    digest.update(digest_rows(build_organization_queries(session, organization_id)).encode())
+    for model in CATALOG_MODELS:
+        row = session.query(func.count(model.id), func.max(model.last_modified_on)).one()
+        digest.update(repr(tuple(row)).encode())
+
+    return digest.hexdigest()
+
+
+def digest_rows(rows):
+    """Gets the digest of the rows of the queries of ``build_organization_queries`` (in that order).
+
+    :param rows: An iterable of the rows of each query (or the queries themselves).
+    :return: A SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    for table_rows in rows:
+        for row in table_rows:
+            digest.update(repr(tuple(row)).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def normalize_scopes(scopes):
+    """Gets scopes as sorted tuples so that the order they were requested doesn't matter."""
+    if not scopes:
+        return []
+    keys = ('department_id', 'macroprocess_id', 'process_id')
+    return sorted([scope.get(key) or 0 for key in keys] for scope in scopes)
+
+
+def build_organization_queries(session, organization_id):
+    return [
+        session.query(OrganizationDepartment.department_id)
+            .filter(OrganizationDepartment.organization_id == organization_id)
+            .order_by(OrganizationDepartment.department_id),
+        session.query(OrganizationMacroprocess.instance_id,
+                      OrganizationMacroprocess.department_id,
+                      OrganizationMacroprocess.macroprocess_id)
+            .filter(OrganizationMacroprocess.organization_id == organization_id)
+            .order_by(OrganizationMacroprocess.instance_id),
+        session.query(OrganizationProcess.instance_id,
+                      OrganizationProcess.macroprocess_instance_id,
+                      OrganizationProcess.process_id,
+                      OrganizationProcess.relevance_level_id)
+            .filter(OrganizationProcess.organization_id == organization_id)
+            .order_by(OrganizationProcess.instance_id),
+        session.query(OrganizationITService.instance_id,
+                      OrganizationITService.process_instance_id,
+                      OrganizationITService.it_service_id,
+                      OrganizationITService.relevance_level_id)
+            .filter(OrganizationITService.organization_id == organization_id)
+            .order_by(OrganizationITService.instance_id),
+        session.query(OrganizationITAsset.instance_id,
+                      OrganizationITAsset.it_asset_id)
+            .filter(OrganizationITAsset.organization_id == organization_id)
+            .order_by(OrganizationITAsset.instance_id),
+        session.query(OrganizationITServiceITAsset.it_service_instance_id,
+                      OrganizationITServiceITAsset.it_asset_instance_id,
+                      OrganizationITServiceITAsset.relevance_level_id)
+            .join(OrganizationITService)
+            .filter(OrganizationITService.organization_id == organization_id)
+            .order_by(OrganizationITServiceITAsset.it_service_instance_id,
+                      OrganizationITServiceITAsset.it_asset_instance_id),
+        session.query(OrganizationSecurityThreat.id,
+                      OrganizationSecurityThreat.security_threat_id,
+                      OrganizationSecurityThreat.threat_level_id)
+            .filter(OrganizationSecurityThreat.organization_id == organization_id)
+            .order_by(OrganizationSecurityThreat.id),
+        session.query(OrganizationITAssetVulnerability.organization_security_threat_id,
+                      OrganizationITAssetVulnerability.it_asset_instance_id,
+                      OrganizationITAssetVulnerability.vulnerability_level_id)
+            .join(OrganizationITAsset)
+            .filter(OrganizationITAsset.organization_id == organization_id)
+            .order_by(OrganizationITAssetVulnerability.id),
+    ]
@@ -0,0 +1,244 @@
+"""
+Formulas of the risk calculated in an analysis.
+
+A formula is defined by three arithmetic expressions: the impact and the
+probability (over the levels of a path) and the risk (over impact, probability
+and the levels). The built-in formula is:
+
+    impact = (itAssetRelevance / 5) * (itServiceRelevance / 5) * (processRelevance / 5)
+    probability = (itAssetVulnerabilityLevel / 5) * (securityThreatLevel / 5)
+    risk = impact * probability
+
+An organization may define its own formula. Expressions accept numbers, the
+operators + - * / ** and the functions in ``FUNCTIONS``. A definition is parsed
+and validated once and compiled into an evaluator that runs each expression over
+the whole arrays of levels (as NumPy operations), so a custom formula costs the
+same per path as the built-in one. Compiled formulas are cached by the hash of
+their definition (the most recently used ones).
+"""
+import ast
+import hashlib
+import itertools
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from knoweak.db.models.organization import Organization
+from knoweak.settings import ANALYSIS
+
+# Name of each level in expressions and the field of path it's taken from
+VARIABLES = {
+    'processRelevance': 'process_relevance',
+    'itServiceRelevance': 'it_service_relevance',
+    'itAssetRelevance': 'it_asset_relevance',
+    'securityThreatLevel': 'security_threat_level',
+    'itAssetVulnerabilityLevel': 'it_asset_vulnerability_level',
+}
+
+# Functions are wrapped with a fixed number of arguments, as a NumPy ufunc takes one more
+# positional argument as the array its result is written to (e.g. a level of paths)
+FUNCTIONS = {
+    'abs': lambda x: np.abs(x),
+    'exp': lambda x: np.exp(x),
+    'log': lambda x: np.log(x),
+    'log2': lambda x: np.log2(x),
+    'log10': lambda x: np.log10(x),
+    'log1p': lambda x: np.log1p(x),
+    'sqrt': lambda x: np.sqrt(x),
+    'min': lambda x, y: np.minimum(x, y),
+    'max': lambda x, y: np.maximum(x, y),
+}
+
+# Number of arguments of each function
+_ARITIES = {name: function.__code__.co_argcount for name, function in FUNCTIONS.items()}
+
+DEFAULT_DEFINITION = {
+    'impact': '(itAssetRelevance / 5) * (itServiceRelevance / 5) * (processRelevance / 5)',
+    'probability': '(itAssetVulnerabilityLevel / 5) * (securityThreatLevel / 5)',
+    'risk': 'impact * probability',
+}
+
+# Names each expression can refer to (besides functions)
+_EXPRESSION_NAMES = {
+    'impact': set(VARIABLES),
+    'probability': set(VARIABLES),
+    'risk': set(VARIABLES) | {'impact', 'probability'},
+}
+
+# Levels a rated path can have. Formulas are checked over all their combinations.
+_LEVELS = range(1, 6)
+
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load,
+                  ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.UAdd, ast.USub)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class FormulaError(ValueError):
+    """Raised when the definition of a formula is invalid.
+
+    :ivar field: The expression ('impact', 'probability' or 'risk') that is invalid, if any.
+    """
+
+    def __init__(self, message, field=None):
+        super().__init__(message)
+        self.field = field
+
+
+class Formula:
+    """A compiled formula. Use ``get_formula`` to get one."""
+
+    def __init__(self, definition):
+        self.definition = normalize(definition)
+        self.json = to_json(self.definition)
+        self.hash = hashlib.sha256(self.json.encode()).hexdigest()
+        self.codes = {field: compile_expression(field, self.definition[field]) for field in DEFAULT_DEFINITION}
+        check_range(self)
+
+    def __reduce__(self):
+        # Sent to other processes by definition, where it's compiled (and cached) again
+        return get_formula, (self.definition,)
+
+    def evaluate(self, levels):
+        """Calculates impact, probability and risk of all paths at once.
+
+        :param levels: A ``PathColumns`` object (or a dict) with an array for each level field.
+        :return: A tuple of arrays of float (impact, probability, risk).
+        """
+        namespace = {name: levels[field] for name, field in VARIABLES.items()}
+        impact = self._evaluate('impact', namespace)
+        probability = self._evaluate('probability', namespace)
+        namespace['impact'] = impact
+        namespace['probability'] = probability
+        risk = self._evaluate('risk', namespace)
+        return impact, probability, risk
+
+    def _evaluate(self, field, namespace):
+        values = eval(self.codes[field], {'__builtins__': {}}, dict(namespace, **FUNCTIONS))
+        shape = np.shape(namespace['processRelevance'])
+        return np.broadcast_to(np.asarray(values, dtype=np.float64), shape)
+
+
+def normalize(definition):
+    """Gets the full definition of a formula (missing expressions are the built-in ones)."""
+    if definition is None:
+        return dict(DEFAULT_DEFINITION)
+    if not isinstance(definition, dict):
+        raise FormulaError('The formula must be an object with impact, probability and risk.')
+
+    unknown_fields = set(definition) - set(DEFAULT_DEFINITION)
+    if unknown_fields:
+        raise FormulaError('Unknown expression.', field=sorted(unknown_fields)[0])
+
+    result = dict(DEFAULT_DEFINITION)
+    for field, expression in definition.items():
+        if expression is None:
+            continue
+        if not isinstance(expression, str):
+            raise FormulaError('The expression must be a string.', field=field)
+        result[field] = ' '.join(expression.split())
+    return result
+
+
+def to_json(definition):
+    """Gets the canonical JSON of a full definition (as stored and hashed)."""
+    return json.dumps(definition, sort_keys=True, separators=(',', ':'))
+
+
+def compile_expression(field, expression):
+    """Parses and validates an expression, then compiles it."""
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        raise FormulaError('The expression is not valid.', field=field)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise FormulaError('Unknown function.', field=field)
+            if node.keywords or len(node.args) != _ARITIES[node.func.id]:
+                raise FormulaError(f"Wrong number of arguments of '{node.func.id}'.", field=field)
+        elif isinstance(node, ast.Name):
+            if node.id not in _EXPRESSION_NAMES[field] and node.id not in FUNCTIONS:
+                raise FormulaError(f"Unknown name '{node.id}'.", field=field)
+        elif is_number(node):
+            continue
+        elif not isinstance(node, _ALLOWED_NODES):
+            raise FormulaError('The expression is not allowed.', field=field)
+
+    # Numbers become floats, so operations between them never run on (unbounded) Python integers
+    tree = ast.fix_missing_locations(_FloatNumbers().visit(tree))
+    return compile(tree, f'<{field}>', 'eval')
+
+
+class _FloatNumbers(ast.NodeTransformer):
+
+    def visit_Num(self, node):
+        return ast.copy_location(ast.Num(n=float(node.n)), node)
+
+    def visit_Constant(self, node):
+        return ast.copy_location(ast.Constant(value=float(node.value)), node)
+
+
+def is_number(node):
+    # ast.Num is deprecated in favor of ast.Constant since Python 3.8
+    if hasattr(ast, 'Constant') and isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float)) and not isinstance(node.value, bool)
+    return isinstance(node, ast.Num) and isinstance(node.n, (int, float))
+
+
+def check_range(formula):
+    """Checks that impact, probability and risk are between 0 and 1 for every combination of levels,
+    as they are stored (and summarized) as such.
+    """
+    combinations = np.array(list(itertools.product(_LEVELS, repeat=len(VARIABLES))), dtype=np.int64)
+    levels = {field: combinations[:, i] for i, field in enumerate(VARIABLES.values())}
+    with np.errstate(all='ignore'):
+        try:
+            results = formula.evaluate(levels)
+        except (TypeError, ValueError, ArithmeticError):
+            raise FormulaError('The expression could not be evaluated.')
+
+    for field, values in zip(('impact', 'probability', 'risk'), results):
+        if not np.all(np.isfinite(values)) or np.any(values < 0) or np.any(values > 1):
+            raise FormulaError('The result must be between 0 and 1 for all levels.', field=field)
+
+
+def get_formula(definition=None):
+    """Gets a compiled formula, from cache when it was already compiled in this process.
+
+    :param definition: A dict with the expressions of 'impact', 'probability' and/or 'risk'
+        (the missing ones are the built-in). When None, the built-in formula is returned.
+    :return: A ``Formula``.
+    :raises FormulaError: When the definition is invalid.
+    """
+    key = hashlib.sha256(to_json(normalize(definition)).encode()).hexdigest()
+    with _cache_lock:
+        formula = _cache.get(key)
+        if formula is not None:
+            _cache.move_to_end(key)
+            return formula
+
+    formula = Formula(definition)
+    with _cache_lock:
+        _cache[key] = formula
+        while len(_cache) > ANALYSIS['formula_cache_size']:
+            _cache.popitem(last=False)
+    return formula
+
+
+def from_json(formula_json):
+    """Gets the compiled formula of a definition stored as JSON (None is the built-in formula)."""
+    return get_formula(json.loads(formula_json) if formula_json else None)
+
+
+def get_organization_formula(session, organization_id):
+    """Gets the compiled formula defined for an organization (or the built-in one)."""
+    formula_json = session.query(Organization.risk_formula).filter(Organization.id == organization_id).scalar()
+    return from_json(formula_json)
+
+
+DEFAULT_FORMULA = get_formula()
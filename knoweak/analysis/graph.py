@@ -0,0 +1,223 @@
+"""
+In-memory graph of the paths of an organization.
+
+The graph keeps the rows that define the paths of an organization (departments,
+macroprocesses, processes, IT services, IT assets, security threats and the
+IT service/IT asset and vulnerability links) as NumPy arrays, one ``Layer`` per
+table. Parents and links are array indexes, and the vulnerabilities of each IT
+asset are kept as a compressed adjacency list (offsets + targets), so the paths
+are expanded with array operations instead of the 10-table join.
+
+Graphs are cached per organization (LRU) and tagged with the ``graph_version``
+of the organization. Write endpoints of ``organization_*`` resources increment
+the version in the same transaction as their changes, so a cached graph is never
+used after the organization changed, no matter which process made the change.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from knoweak.analysis import fingerprint, risk, scoping
+from knoweak.db.models.organization import Organization
+from knoweak.settings import ANALYSIS
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Layer:
+    """Rows of a table of the graph stored column by column.
+
+    :ivar ids: Ids of the rows (instance ids), sorted.
+    :ivar catalog_ids: Ids of the catalog items the rows are instances of.
+    :ivar levels: Relevance or threat/vulnerability levels (0 when not rated).
+    :ivar parents: Indexes of the parents of the rows in the layer above (-1 when not found).
+    :ivar targets: Indexes of the rows linked to in another layer (links only, -1 when not found).
+    """
+    __slots__ = ('ids', 'catalog_ids', 'levels', 'parents', 'targets')
+
+    def __init__(self, ids, catalog_ids=None, levels=None, parents=None, targets=None):
+        self.ids = ids
+        self.catalog_ids = catalog_ids
+        self.levels = levels
+        self.parents = parents
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, ids):
+        """Gets the indexes of the rows with the ids informed (-1 when not found)."""
+        positions = np.searchsorted(self.ids, ids)
+        positions = np.minimum(positions, max(len(self.ids) - 1, 0))
+        found = self.ids[positions] == ids if len(self.ids) else np.zeros(len(ids), dtype=bool)
+        return np.where(found, positions, -1)
+
+
+class OrganizationGraph:
+    """Paths of an organization as a graph of layers."""
+    __slots__ = ('organization_id', 'version', 'departments', 'macroprocesses', 'processes', 'it_services',
+                 'it_assets', 'security_threats', 'it_service_it_assets', 'vulnerabilities',
+                 'vulnerability_offsets', 'vulnerability_order', 'rows_digest')
+
+    def __init__(self, organization_id, version, rows):
+        """Builds the graph from the rows of organization.
+
+        :param rows: Rows of the queries of ``fingerprint.build_organization_queries`` (in that order).
+        """
+        self.organization_id = organization_id
+        self.version = version
+        self.rows_digest = fingerprint.digest_rows(rows)
+
+        departments, macroprocesses, processes, it_services, it_assets, links, threats, vulnerabilities = \
+            [to_matrix(table_rows, width) for table_rows, width in zip(rows, (1, 3, 4, 4, 2, 3, 3, 3))]
+
+        self.departments = Layer(departments[:, 0])
+        self.macroprocesses = Layer(macroprocesses[:, 0], catalog_ids=macroprocesses[:, 2])
+        self.macroprocesses.parents = self.departments.index_of(macroprocesses[:, 1])
+        self.processes = Layer(processes[:, 0], catalog_ids=processes[:, 2], levels=processes[:, 3])
+        self.processes.parents = self.macroprocesses.index_of(processes[:, 1])
+        self.it_services = Layer(it_services[:, 0], catalog_ids=it_services[:, 2], levels=it_services[:, 3])
+        self.it_services.parents = self.processes.index_of(it_services[:, 1])
+        self.it_assets = Layer(it_assets[:, 0], catalog_ids=it_assets[:, 1])
+        self.security_threats = Layer(threats[:, 0], catalog_ids=threats[:, 1], levels=threats[:, 2])
+
+        # Links between IT services (parents) and IT assets (targets)
+        self.it_service_it_assets = Layer(np.arange(len(links)), levels=links[:, 2],
+                                          parents=self.it_services.index_of(links[:, 0]),
+                                          targets=self.it_assets.index_of(links[:, 1]))
+
+        # Vulnerabilities of IT assets (parents) to security threats (targets)
+        self.vulnerabilities = Layer(np.arange(len(vulnerabilities)), levels=vulnerabilities[:, 2],
+                                     parents=self.it_assets.index_of(vulnerabilities[:, 1]),
+                                     targets=self.security_threats.index_of(vulnerabilities[:, 0]))
+
+        # Compressed adjacency list of the vulnerabilities of each IT asset
+        valid = (self.vulnerabilities.parents >= 0) & (self.vulnerabilities.targets >= 0)
+        valid_indexes = np.nonzero(valid)[0]
+        order = np.argsort(self.vulnerabilities.parents[valid_indexes], kind='stable')
+        self.vulnerability_order = valid_indexes[order]
+        counts = np.bincount(self.vulnerabilities.parents[valid_indexes], minlength=len(self.it_assets))
+        self.vulnerability_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def get_paths(self, scopes=None, only_rated=True):
+        """Expands the paths of the organization within the scopes informed.
+
+        :param scopes: (Optional) Scopes as returned by ``scoping.remove_redundant_scopes``.
+        :param only_rated: (Optional) When false, paths with levels not rated are kept. Default is true.
+        :return: A ``PathColumns`` object with the columns of ``risk.PATH_COLUMNS``
+            and the column 'process_instance_id'.
+        """
+        processes, it_services, links, vulnerabilities = \
+            self.processes, self.it_services, self.it_service_it_assets, self.vulnerabilities
+
+        # Processes reachable from a department of organization and within scopes
+        macroprocess_of_process = processes.parents
+        valid_process = macroprocess_of_process >= 0
+        valid_process[valid_process] = self.macroprocesses.parents[macroprocess_of_process[valid_process]] >= 0
+        if scopes:
+            valid_process &= self.get_processes_in_scopes(scopes)
+
+        # Links of the IT services of those processes
+        process_of_link = np.where(links.parents >= 0, it_services.parents[links.parents], -1)
+        valid_link = (process_of_link >= 0) & (links.targets >= 0)
+        valid_link[valid_link] = valid_process[process_of_link[valid_link]]
+        link_indexes = np.nonzero(valid_link)[0]
+
+        # Each link expands to the vulnerabilities of its IT asset
+        assets = links.targets[link_indexes]
+        counts = self.vulnerability_offsets[assets + 1] - self.vulnerability_offsets[assets]
+        path_links = np.repeat(link_indexes, counts)
+        path_assets = np.repeat(assets, counts)
+        first_positions = np.repeat(self.vulnerability_offsets[assets], counts)
+        group_starts = np.repeat(np.cumsum(counts) - counts, counts)
+        path_vulnerabilities = self.vulnerability_order[first_positions + np.arange(len(path_links)) - group_starts]
+
+        path_services = links.parents[path_links]
+        path_processes = it_services.parents[path_services]
+        path_macroprocesses = processes.parents[path_processes]
+        path_threats = vulnerabilities.targets[path_vulnerabilities]
+
+        columns = {
+            'department_id': self.departments.ids[self.macroprocesses.parents[path_macroprocesses]],
+            'macroprocess_id': self.macroprocesses.catalog_ids[path_macroprocesses],
+            'process_id': processes.catalog_ids[path_processes],
+            'it_service_id': it_services.catalog_ids[path_services],
+            'it_asset_id': self.it_assets.catalog_ids[path_assets],
+            'security_threat_id': self.security_threats.catalog_ids[path_threats],
+            'it_service_instance_id': it_services.ids[path_services],
+            'it_asset_instance_id': self.it_assets.ids[path_assets],
+            'organization_security_threat_id': self.security_threats.ids[path_threats],
+            'process_relevance': processes.levels[path_processes],
+            'it_service_relevance': it_services.levels[path_services],
+            'it_asset_relevance': links.levels[path_links],
+            'security_threat_level': self.security_threats.levels[path_threats],
+            'it_asset_vulnerability_level': vulnerabilities.levels[path_vulnerabilities],
+            'process_instance_id': processes.ids[path_processes],
+        }
+        paths = risk.PathColumns.from_columns(columns)
+
+        if only_rated:
+            rated = np.ones(len(paths), dtype=bool)
+            for field in risk.LEVEL_FIELDS:
+                rated &= paths[field] > 0
+            paths = paths.select(rated)
+        return paths
+
+    def get_processes_in_scopes(self, scopes):
+        """Gets a mask of the processes (of ``processes`` layer) within the scopes informed."""
+        scope_set = scoping.ScopeSet(scopes)
+        macroprocesses = self.processes.parents
+        departments = self.departments.ids[self.macroprocesses.parents[macroprocesses]]
+        keys = zip(departments.tolist(),
+                   self.macroprocesses.catalog_ids[macroprocesses].tolist(),
+                   self.processes.catalog_ids.tolist())
+        return np.array([key[0] in scope_set.departments or key[:2] in scope_set.macroprocesses or
+                         key in scope_set.processes for key in keys], dtype=bool)
+
+
+def to_matrix(rows, width):
+    """Gets rows as a matrix of int64 (NULL values become 0)."""
+    values = np.array([0 if value is None else value for row in rows for value in row], dtype=np.int64)
+    return values.reshape(-1, width)
+
+
+def get_graph(session, organization_id):
+    """Gets the graph of an organization, from cache when it's still up to date.
+
+    :param session: The database session.
+    :param organization_id: The code of the organization.
+    :return: An ``OrganizationGraph``.
+    """
+    # The version is read before the rows, so the graph is never newer than its version
+    version = session.query(Organization.graph_version).filter(Organization.id == organization_id).scalar()
+    with _cache_lock:
+        graph = _cache.get(organization_id)
+        if graph is not None and graph.version == version:
+            _cache.move_to_end(organization_id)
+            return graph
+
+    rows = [query.all() for query in fingerprint.build_organization_queries(session, organization_id)]
+    graph = OrganizationGraph(organization_id, version, rows)
+
+    with _cache_lock:
+        _cache[organization_id] = graph
+        _cache.move_to_end(organization_id)
+        while len(_cache) > ANALYSIS['graph_cache_size']:
+            _cache.popitem(last=False)
+    return graph
+
+
+def invalidate(session, organization_id):
+    """Marks the graph of an organization as outdated. Must be called by write operations
+    in the organization before they commit, so the new version is committed with the changes.
+
+    :param session: The database session.
+    :param organization_id: The code of the organization.
+    """
+    session.query(Organization) \
+        .filter(Organization.id == organization_id) \
+        .update({Organization.graph_version: Organization.graph_version + 1}, synchronize_session=False)
+    with _cache_lock:
+        _cache.pop(organization_id, None)
@@ -0,0 +1,131 @@
+"""
+Bounded pool of background workers that process analysis jobs.
+
+The pool lives in the process that received the request. The state of each job
+is kept in database (``organization_analysis_job``) so that any process of the
+application can report it.
+
+Jobs are lost when their process stops (e.g. it's restarted) before they finish.
+To tell them from jobs that are just long, the process touches the last modification
+of its queued and running jobs every ANALYSIS['job_heartbeat_seconds']. Jobs not
+touched for ANALYSIS['job_timeout_seconds'] are marked as failed when read.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from knoweak.api import constants
+from knoweak.api.errors import build_error, Message
+from knoweak.db import Session
+from knoweak.db.models.organization import OrganizationAnalysisJob
+from knoweak.settings import ANALYSIS
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = [constants.ANALYSIS_JOB_STATUS_QUEUED, constants.ANALYSIS_JOB_STATUS_RUNNING]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_active_job_ids = set()
+_heartbeat = None
+_heartbeat_lock = threading.Lock()
+
+
+def get_executor():
+    """Gets the executor of this process, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ANALYSIS['job_workers'])
+        return _executor
+
+
+def submit(function, *args, **kwargs):
+    """Schedules a function to be run by one of the workers of the pool.
+
+    :return: A ``concurrent.futures.Future``.
+    """
+    return get_executor().submit(function, *args, **kwargs)
+
+
+def submit_job(job_id, function, *args, **kwargs):
+    """Schedules the function that processes a job, keeping the heartbeat of the job
+    until the function returns.
+
+    :param job_id: The id of the ``OrganizationAnalysisJob``.
+    :return: A ``concurrent.futures.Future``.
+    """
+    global _heartbeat
+    with _heartbeat_lock:
+        _active_job_ids.add(job_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=beat, name='analysis-jobs-heartbeat', daemon=True)
+            _heartbeat.start()
+
+    future = submit(function, *args, **kwargs)
+    future.add_done_callback(lambda _: release(job_id))
+    return future
+
+
+def release(job_id):
+    with _heartbeat_lock:
+        _active_job_ids.discard(job_id)
+
+
+def beat():
+    """Touches the jobs of this process forever (run by the heartbeat thread)."""
+    while True:
+        time.sleep(ANALYSIS['job_heartbeat_seconds'])
+        with _heartbeat_lock:
+            job_ids = list(_active_job_ids)
+        if not job_ids:
+            continue
+
+        session = Session()
+        try:
+            session \
+                .query(OrganizationAnalysisJob) \
+                .filter(OrganizationAnalysisJob.id.in_(job_ids)) \
+                .filter(OrganizationAnalysisJob.status.in_(ACTIVE_STATUSES)) \
+                .update({OrganizationAnalysisJob.last_modified_on: datetime.utcnow()}, synchronize_session=False)
+            session.commit()
+        except Exception:
+            session.rollback()
+            logger.exception('Heartbeat of analysis jobs failed.')
+        finally:
+            session.close()
+
+
+def fail_if_lost(session, job):
+    """Marks a job as failed when its process stopped before finishing it (see module docs).
+
+    :param session: The database session.
+    :param job: The ``OrganizationAnalysisJob``.
+    :return: True if the job was marked as failed.
+    """
+    if job.status not in ACTIVE_STATUSES:
+        return False
+
+    # Checked again in the statement, so a job touched or finished meanwhile is kept
+    now = datetime.utcnow()
+    limit = now - timedelta(seconds=ANALYSIS['job_timeout_seconds'])
+    errors = [build_error(Message.ERR_ANALYSIS_JOB_INTERRUPTED)]
+    total = session \
+        .query(OrganizationAnalysisJob) \
+        .filter(OrganizationAnalysisJob.id == job.id) \
+        .filter(OrganizationAnalysisJob.status.in_(ACTIVE_STATUSES)) \
+        .filter(OrganizationAnalysisJob.last_modified_on < limit) \
+        .update({
+            OrganizationAnalysisJob.status: constants.ANALYSIS_JOB_STATUS_FAILED,
+            OrganizationAnalysisJob.errors: json.dumps(errors),
+            OrganizationAnalysisJob.finished_on: now,
+            OrganizationAnalysisJob.last_modified_on: now
+        }, synchronize_session=False)
+    session.commit()
+    if total:
+        session.refresh(job)
+    return bool(total)
@@ -0,0 +1,46 @@
+"""
+Memory usage measurement of the running process.
+
+Measures are of the whole process (its resident set size, RSS), not of a single
+piece of work: memory held by requests or jobs running at the same time in other
+threads is included and memory freed by Python may not be returned to the system.
+They are sampled at some points of the work, so short spikes between samples are
+missed.
+"""
+import os
+
+try:
+    import resource
+except ImportError:  # pragma: no cover (not available in Windows)
+    resource = None
+
+_STATM_PATH = '/proc/self/statm'
+
+
+def get_rss_kb():
+    """Gets the current resident set size (RSS) of the process in kilobytes.
+
+    When the current value is not available (no procfs), the peak RSS
+    of the process lifetime is returned instead. When neither is available,
+    returns None.
+    """
+    if os.path.exists(_STATM_PATH):
+        with open(_STATM_PATH) as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+class PeakRSS:
+    """Keeps the highest RSS of the process sampled while some work is being done (see module docs)."""
+
+    def __init__(self):
+        self.peak_kb = get_rss_kb()
+
+    def sample(self):
+        rss_kb = get_rss_kb()
+        if rss_kb is not None and (self.peak_kb is None or rss_kb > self.peak_kb):
+            self.peak_kb = rss_kb
+        return self.peak_kb
@@ -0,0 +1,75 @@
+"""
+Dictionary of names used by the details of an analysis.
+
+In 'dictionary' format, details don't keep names of departments, processes, IT
+assets and so on. Each distinct name gets a small integer id within the analysis
+and details keep only the ids. The names are kept once per analysis in
+``organization_analysis_name``.
+"""
+from sqlalchemy import literal, select
+
+from knoweak.db.models.organization import OrganizationAnalysisName
+
+# Fields of details that keep names and the fields that keep their ids in dictionary format
+NAME_ID_FIELDS = [
+    ('department_name', 'department_name_id'),
+    ('macroprocess_name', 'macroprocess_name_id'),
+    ('process_name', 'process_name_id'),
+    ('it_service_name', 'it_service_name_id'),
+    ('it_asset_name', 'it_asset_name_id'),
+    ('security_threat_name', 'security_threat_name_id'),
+]
+
+
+class NameDictionary:
+    """Maps names to ids (and back) for a single analysis."""
+
+    def __init__(self, entries=None):
+        self.names_by_id = dict(entries or [])
+        self.ids_by_name = {name: name_id for name_id, name in self.names_by_id.items()}
+        self.new_entries = []
+
+    @classmethod
+    def load(cls, session, analysis_id):
+        query = session \
+            .query(OrganizationAnalysisName.id, OrganizationAnalysisName.name) \
+            .filter(OrganizationAnalysisName.organization_analysis_id == analysis_id)
+        return cls(query.all())
+
+    def encode(self, name):
+        """Gets the id of a name, adding the name to the dictionary when it's new."""
+        name_id = self.ids_by_name.get(name)
+        if name_id is None:
+            name_id = len(self.names_by_id) + 1
+            self.ids_by_name[name] = name_id
+            self.names_by_id[name_id] = name
+            self.new_entries.append((name_id, name))
+        return name_id
+
+    def decode(self, name_id):
+        return self.names_by_id.get(name_id)
+
+    def decode_details(self, detail_dict):
+        """Replaces the name ids of a dict made from a detail by the names."""
+        for name_field, id_field in NAME_ID_FIELDS:
+            detail_dict[name_field] = self.decode(detail_dict.pop(id_field, None))
+        return detail_dict
+
+    def save(self, session, analysis_id):
+        """Inserts the names added since the dictionary was created or last saved."""
+        if not self.new_entries:
+            return
+        rows = [{'organization_analysis_id': analysis_id, 'organization_analysis_name_id': name_id, 'name': name}
+                for name_id, name in self.new_entries]
+        session.execute(OrganizationAnalysisName.__table__.insert(), rows)
+        self.new_entries = []
+
+
+def copy_names(session, source_analysis_id, target_analysis_id):
+    """Copies the dictionary of an analysis to another one with a single statement."""
+    table = OrganizationAnalysisName.__table__
+    query = select([literal(target_analysis_id), table.c.organization_analysis_name_id, table.c.name]) \
+        .where(table.c.organization_analysis_id == source_analysis_id)
+
+    column_names = ['organization_analysis_id', 'organization_analysis_name_id', 'name']
+    session.execute(table.insert().from_select(column_names, query))
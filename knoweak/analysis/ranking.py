@@ -0,0 +1,87 @@
+"""
+Ranking of analysis details by risk.
+
+Details are listed by risk, impact and probability (all descending). Since an
+analysis doesn't change once created, the position of each detail in that order
+is stored in ``risk_rank`` (1, 2, 3, ... with no gaps) and pages of details
+become range reads on the index of (analysis id, risk rank).
+"""
+from itertools import islice
+
+import numpy as np
+from sqlalchemy import bindparam, select, text
+
+from knoweak.db.models.organization import OrganizationAnalysisDetail
+
+
+def rank_details(details):
+    """Sets the risk rank of details built in memory.
+    Ties are ranked in the order details are given (which is the order they are inserted).
+
+    :param details: A list of dicts with the fields of ``OrganizationAnalysisDetail``.
+    """
+    def get_column(field):
+        return np.fromiter((values[field] for values in details), dtype=np.float64, count=len(details))
+
+    # The last key is the primary one
+    order = np.lexsort((np.arange(len(details)),
+                        -get_column('calculated_probability'),
+                        -get_column('calculated_impact'),
+                        -get_column('calculated_risk')))
+    ranks = np.empty(len(details), dtype=np.int64)
+    ranks[order] = np.arange(1, len(details) + 1)
+
+    for values, rank in zip(details, ranks.tolist()):
+        values['risk_rank'] = rank
+
+
+def assign_ranks(session, analysis_id, batch_size):
+    """Sets the risk rank of details already saved in database.
+    Ties are ranked in the order details were inserted.
+
+    In MySQL details are ranked by a single UPDATE in the order of risk, numbering rows
+    with a user variable. Other databases (e.g. SQLite in development) get the ids
+    in order and update them in batches.
+
+    :param session: The database session.
+    :param analysis_id: The id of the analysis whose details are ranked.
+    :param batch_size: Max number of rows updated at once (when not in MySQL).
+    """
+    if session.get_bind().dialect.name == 'mysql':
+        assign_ranks_in_database(session, analysis_id)
+    else:
+        assign_ranks_in_batches(session, analysis_id, batch_size)
+
+
+def assign_ranks_in_database(session, analysis_id):
+    # Both statements run in the connection of the session, which keeps the variable
+    session.execute(text('SET @risk_rank := 0'))
+    session.execute(text(
+        'UPDATE organization_analysis_detail '
+        'SET risk_rank = (@risk_rank := @risk_rank + 1) '
+        'WHERE organization_analysis_id = :analysis_id '
+        'ORDER BY calculated_risk DESC, calculated_impact DESC, calculated_probability DESC, '
+        'organization_analysis_detail_id'
+    ), {'analysis_id': analysis_id})
+
+
+def assign_ranks_in_batches(session, analysis_id, batch_size):
+    table = OrganizationAnalysisDetail.__table__
+    query = select([table.c.organization_analysis_detail_id]) \
+        .where(table.c.organization_analysis_id == analysis_id) \
+        .order_by(table.c.calculated_risk.desc(),
+                  table.c.calculated_impact.desc(),
+                  table.c.calculated_probability.desc(),
+                  table.c.organization_analysis_detail_id)
+    detail_ids = [row[0] for row in session.execute(query)]
+
+    statement = table.update() \
+        .where(table.c.organization_analysis_detail_id == bindparam('detail_id')) \
+        .values(risk_rank=bindparam('rank'))
+
+    iterator = iter(enumerate(detail_ids, start=1))
+    while True:
+        batch = [{'detail_id': detail_id, 'rank': rank} for rank, detail_id in islice(iterator, batch_size)]
+        if not batch:
+            break
+        session.execute(statement, batch)
@@ -0,0 +1,207 @@
+"""
+Vectorized calculation of the risk of the paths considered in an analysis.
+
+A path goes from a department of an organization down to a security threat
+that explores a vulnerability of an IT asset:
+
+    department > macroprocess > process > IT service > IT asset > security threat
+
+Instead of loading ORM entities and calculating one path at a time, paths are
+fetched as plain columns (catalog ids and levels only) and all calculations are
+made at once over NumPy arrays.
+"""
+from itertools import chain
+
+import numpy as np
+
+from knoweak.analysis import formulas
+from knoweak.analysis.names import NAME_ID_FIELDS
+from knoweak.db.models.catalog import (
+    BusinessDepartment, BusinessMacroprocess, BusinessProcess, ITService, ITAsset, SecurityThreat
+)
+from knoweak.db.models.organization import (
+    OrganizationDepartment, OrganizationMacroprocess, OrganizationProcess, OrganizationITService,
+    OrganizationITServiceITAsset, OrganizationITAsset, OrganizationSecurityThreat, OrganizationITAssetVulnerability
+)
+
+# Columns to be selected for each path (the order matters)
+PATH_COLUMNS = [
+    OrganizationDepartment.department_id.label('department_id'),
+    OrganizationMacroprocess.macroprocess_id.label('macroprocess_id'),
+    OrganizationProcess.process_id.label('process_id'),
+    OrganizationITService.it_service_id.label('it_service_id'),
+    OrganizationITAsset.it_asset_id.label('it_asset_id'),
+    OrganizationSecurityThreat.security_threat_id.label('security_threat_id'),
+    OrganizationITService.instance_id.label('it_service_instance_id'),
+    OrganizationITAsset.instance_id.label('it_asset_instance_id'),
+    OrganizationSecurityThreat.id.label('organization_security_threat_id'),
+    OrganizationProcess.relevance_level_id.label('process_relevance'),
+    OrganizationITService.relevance_level_id.label('it_service_relevance'),
+    OrganizationITServiceITAsset.relevance_level_id.label('it_asset_relevance'),
+    OrganizationSecurityThreat.threat_level_id.label('security_threat_level'),
+    OrganizationITAssetVulnerability.vulnerability_level_id.label('it_asset_vulnerability_level'),
+]
+
+# Name of each detail field and the key column / catalog model used to resolve it
+NAME_FIELDS = [
+    ('department_name', 'department_id', BusinessDepartment),
+    ('macroprocess_name', 'macroprocess_id', BusinessMacroprocess),
+    ('process_name', 'process_id', BusinessProcess),
+    ('it_service_name', 'it_service_id', ITService),
+    ('it_asset_name', 'it_asset_id', ITAsset),
+    ('security_threat_name', 'security_threat_id', SecurityThreat),
+]
+
+# Instances of organization that identify a path
+INSTANCE_FIELDS = [
+    'it_service_instance_id',
+    'it_asset_instance_id',
+    'organization_security_threat_id',
+]
+
+LEVEL_FIELDS = [
+    'process_relevance',
+    'it_service_relevance',
+    'it_asset_relevance',
+    'security_threat_level',
+    'it_asset_vulnerability_level',
+]
+
+
+class PathColumns:
+    """Paths of an analysis stored column by column.
+
+    Each column is a NumPy array that can be accessed by its label
+    as defined in ``PATH_COLUMNS``.
+    """
+
+    def __init__(self, rows, columns=None):
+        labels = [column.key for column in (columns or PATH_COLUMNS)]
+        values = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * len(labels))
+        matrix = values.reshape(-1, len(labels))
+        self.columns = {label: matrix[:, i] for i, label in enumerate(labels)}
+        self.size = matrix.shape[0]
+
+    def __getitem__(self, label):
+        return self.columns[label]
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Creates an object from a dict of arrays of the same length (by label)."""
+        paths = cls([])
+        paths.columns = columns
+        paths.size = len(next(iter(columns.values())))
+        return paths
+
+    def select(self, indices):
+        """Gets a new object with only the paths at the indices (or boolean mask) informed."""
+        return PathColumns.from_columns({label: values[indices] for label, values in self.columns.items()})
+
+
+def fetch_paths(query, columns=None):
+    """Executes a query that selects ``PATH_COLUMNS`` and returns its result as columns.
+
+    :param query: Session query from SQL Alchemy selecting ``PATH_COLUMNS``.
+    :param columns: (Optional) The columns selected by query when other than ``PATH_COLUMNS``.
+    :return: A ``PathColumns`` object.
+    """
+    return PathColumns(query.all(), columns)
+
+
+def stream_paths(session, query, chunk_size):
+    """Executes a query that selects ``PATH_COLUMNS`` using a server-side cursor
+    and yields its result in chunks of columns.
+
+    The cursor is opened in a connection of its own, so the session remains free
+    to run other statements (e.g. inserts) while the result is being consumed.
+
+    :param session: The database session.
+    :param query: Session query from SQL Alchemy selecting ``PATH_COLUMNS``.
+    :param chunk_size: Max number of paths in each chunk.
+    :return: A generator of ``PathColumns`` objects.
+    """
+    connection = session.get_bind().connect()
+    try:
+        result = connection.execution_options(stream_results=True).execute(query.statement)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield PathColumns(rows)
+    finally:
+        connection.close()
+
+
+def calculate_risk(paths, formula=None):
+    """Calculates impact, probability and risk of all paths at once.
+
+    The built-in formulas are the same used since the first version of analysis:
+        I = (it_asset_relevance / 5) * (it_service_relevance / 5) * (process_relevance / 5)
+        P = (it_asset_vulnerability_level / 5) * (security_threat_level / 5)
+        R = I * P
+
+    :param paths: A ``PathColumns`` object.
+    :param formula: (Optional) The ``formulas.Formula`` to be used. Default is the built-in one.
+    :return: A tuple of arrays (impact, probability, risk).
+    """
+    return (formula or formulas.DEFAULT_FORMULA).evaluate(paths)
+
+
+def resolve_names(session, paths, cache=None, dictionary=None):
+    """Gets the names of catalog items referenced by paths.
+
+    Only the distinct ids of each catalog are queried and then spread
+    over the paths.
+
+    :param session: The database session.
+    :param paths: A ``PathColumns`` object.
+    :param cache: (Optional) A dict to keep names already resolved between calls.
+        Only names not found in cache will be queried.
+    :param dictionary: (Optional) A ``NameDictionary``. When informed, the names are
+        encoded and their ids are returned instead (see ``NAME_ID_FIELDS``).
+    :return: A dict with an array of names (or name ids) for each name field of detail.
+    """
+    cache = {} if cache is None else cache
+    id_fields = dict(NAME_ID_FIELDS)
+    names = {}
+    for field, key, model in NAME_FIELDS:
+        unique_ids, inverse = np.unique(paths[key], return_inverse=True)
+        names_by_id = cache.setdefault(model, {})
+        missing_ids = [item_id for item_id in unique_ids.tolist() if item_id not in names_by_id]
+        if missing_ids:
+            query = session.query(model.id, model.name).filter(model.id.in_(missing_ids))
+            names_by_id.update(query.all())
+
+        unique_names = [names_by_id.get(item_id) for item_id in unique_ids.tolist()]
+        if dictionary is None:
+            names[field] = np.array(unique_names, dtype=object)[inverse]
+        else:
+            unique_name_ids = np.array([dictionary.encode(name) for name in unique_names], dtype=np.int64)
+            names[id_fields[field]] = unique_name_ids[inverse]
+    return names
+
+
+def build_details(session, paths, names_cache=None, dictionary=None, formula=None):
+    """Builds the values of analysis details for all paths.
+
+    :param session: The database session.
+    :param paths: A ``PathColumns`` object.
+    :param names_cache: (Optional) See ``resolve_names``.
+    :param dictionary: (Optional) See ``resolve_names``.
+    :param formula: (Optional) See ``calculate_risk``.
+    :return: A list of dicts with the fields of ``OrganizationAnalysisDetail``.
+    """
+    impact, probability, risk = calculate_risk(paths, formula)
+
+    resolved_names = resolve_names(session, paths, names_cache, dictionary)
+    fields = {field: values.tolist() for field, values in resolved_names.items()}
+    fields.update({field: paths[field].tolist() for field in INSTANCE_FIELDS + LEVEL_FIELDS})
+    fields['calculated_impact'] = impact.tolist()
+    fields['calculated_probability'] = probability.tolist()
+    fields['calculated_risk'] = risk.tolist()
+
+    names = list(fields.keys())
+    return [dict(zip(names, values)) for values in zip(*fields.values())]
@@ -0,0 +1,99 @@
+"""
+Rollups of the risk of an analysis per hierarchy level.
+
+For each level (department, macroprocess, ..., security threat), the details of
+an analysis are grouped by the name of the item in that level and the max, sum,
+mean and count of their risk are stored in ``organization_analysis_rollup``.
+Rollups are calculated once, when the analysis is created, so the summary of an
+analysis is served without going through its details again. Analyses created
+before rollups existed get them when they are archived; until then, their summary
+is aggregated from their details on each request and not saved.
+"""
+from sqlalchemy import func, literal, select
+
+from knoweak.api import constants
+from knoweak.db.models.organization import (
+    OrganizationAnalysisDetail, OrganizationAnalysisName, OrganizationAnalysisRollup
+)
+
+# Levels and the fields of details that keep the name (or name id) of each one
+LEVELS = [
+    ('department', 'department_name', 'department_name_id'),
+    ('macroprocess', 'macroprocess_name', 'macroprocess_name_id'),
+    ('process', 'process_name', 'process_name_id'),
+    ('it_service', 'it_service_name', 'it_service_name_id'),
+    ('it_asset', 'it_asset_name', 'it_asset_name_id'),
+    ('security_threat', 'security_threat_name', 'security_threat_name_id'),
+]
+
+_COLUMN_NAMES = ['organization_analysis_id', 'level', 'name', 'max_risk', 'sum_risk', 'mean_risk', 'total_details']
+
+
+def compute_rollups(session, analysis):
+    """Calculates and saves the rollups of an analysis with one statement per level.
+    The details of the analysis must have been flushed already.
+
+    :param session: The database session.
+    :param analysis: The ``OrganizationAnalysis``.
+    """
+    rollup_table = OrganizationAnalysisRollup.__table__
+    for level, name_field, name_id_field in LEVELS:
+        query = build_level_query(analysis, level, name_field, name_id_field)
+        session.execute(rollup_table.insert().from_select(_COLUMN_NAMES, query))
+
+
+def aggregate_rollups(session, analysis):
+    """Calculates the rollups of an analysis without saving them, sorted by their max risk.
+
+    :param session: The database session.
+    :param analysis: The ``OrganizationAnalysis``.
+    :return: A list of ``OrganizationAnalysisRollup`` objects, which are not added to any session.
+    """
+    result = []
+    for level, name_field, name_id_field in LEVELS:
+        query = build_level_query(analysis, level, name_field, name_id_field)
+        for analysis_id, _, name, max_risk, sum_risk, mean_risk, total_details in session.execute(query):
+            result.append(OrganizationAnalysisRollup(organization_analysis_id=analysis_id, level=level, name=name,
+                                                     max_risk=float(max_risk), sum_risk=float(sum_risk),
+                                                     mean_risk=float(mean_risk), total_details=total_details))
+    result.sort(key=lambda rollup: (-rollup.max_risk, -rollup.mean_risk, rollup.name or ''))
+    return result
+
+
+def build_level_query(analysis, level, name_field, name_id_field):
+    """Builds the query of the rollups of a level, with the columns of ``_COLUMN_NAMES``."""
+    detail_table = OrganizationAnalysisDetail.__table__
+    name_table = OrganizationAnalysisName.__table__
+    risk = detail_table.c.calculated_risk
+
+    if analysis.details_format == constants.ANALYSIS_DETAILS_FORMAT_DICTIONARY:
+        name = name_table.c.name
+        source = detail_table.join(
+            name_table,
+            (name_table.c.organization_analysis_id == detail_table.c.organization_analysis_id) &
+            (name_table.c.organization_analysis_name_id == detail_table.c[name_id_field]))
+    else:
+        name = detail_table.c[name_field]
+        source = detail_table
+
+    return select([literal(analysis.id), literal(level), name,
+                   func.max(risk), func.sum(risk), func.avg(risk), func.count()]) \
+        .select_from(source) \
+        .where(detail_table.c.organization_analysis_id == analysis.id) \
+        .group_by(name)
+
+
+def copy_rollups(session, source_analysis_id, target_analysis_id):
+    """Copies the rollups of an analysis to another one with a single statement."""
+    table = OrganizationAnalysisRollup.__table__
+    copied_columns = [table.c[column_name] for column_name in _COLUMN_NAMES[1:]]
+    query = select([literal(target_analysis_id)] + copied_columns) \
+        .where(table.c.organization_analysis_id == source_analysis_id)
+    session.execute(table.insert().from_select(_COLUMN_NAMES, query))
+
+
+def has_rollups(session, analysis_id):
+    query = session \
+        .query(OrganizationAnalysisRollup.id) \
+        .filter(OrganizationAnalysisRollup.organization_analysis_id == analysis_id)
+    return query.first() is not None
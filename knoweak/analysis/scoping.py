@@ -0,0 +1,116 @@
+"""
+Scopes of an analysis.
+
+A scope is a whole department, a whole macroprocess of a department or a single
+process of a macroprocess of a department (identified by catalog ids). Scopes are
+kept in sets per level, so redundant ones (already covered by a parent level) are
+removed in linear time. To filter the paths of an analysis, scopes are resolved to
+the instances of the organization and compiled into one ``IN`` list per level,
+which keeps the query driven by indexes no matter how many scopes are selected.
+"""
+from sqlalchemy import false, or_
+
+from knoweak.db.models.organization import OrganizationDepartment, OrganizationMacroprocess, OrganizationProcess
+
+
+class ScopeSet:
+    """Scopes of an analysis by level, without redundancy.
+
+    Dicts are used as ordered sets, so scopes keep the order they were requested within each level.
+    """
+
+    def __init__(self, scopes=None):
+        self.departments = {}
+        self.macroprocesses = {}
+        self.processes = {}
+
+        scopes = scopes or []
+        for scope in scopes:
+            if scope.get('macroprocess_id') is None and scope.get('process_id') is None:
+                self.departments[scope.get('department_id')] = None
+
+        for scope in scopes:
+            if scope.get('macroprocess_id') is not None and scope.get('process_id') is None:
+                if scope.get('department_id') not in self.departments:
+                    self.macroprocesses[(scope.get('department_id'), scope.get('macroprocess_id'))] = None
+
+        for scope in scopes:
+            if scope.get('process_id') is not None:
+                key = (scope.get('department_id'), scope.get('macroprocess_id'), scope.get('process_id'))
+                if key[0] not in self.departments and key[:2] not in self.macroprocesses:
+                    self.processes[key] = None
+
+    def __len__(self):
+        return len(self.departments) + len(self.macroprocesses) + len(self.processes)
+
+    def as_list(self):
+        """Gets the scopes as dicts, as they are requested and stored."""
+        scopes = [{'department_id': department_id} for department_id in self.departments]
+        scopes += [{'department_id': department_id, 'macroprocess_id': macroprocess_id}
+                   for department_id, macroprocess_id in self.macroprocesses]
+        scopes += [{'department_id': department_id, 'macroprocess_id': macroprocess_id, 'process_id': process_id}
+                   for department_id, macroprocess_id, process_id in self.processes]
+        return scopes
+
+
+def remove_redundant_scopes(requested_scopes):
+    """Removes scopes of which parent levels have already been chosen as a whole
+    and scopes requested more than once.
+
+    :param requested_scopes: Scopes as they came from request.
+    :return: The remaining scopes or None when no scope was requested.
+    """
+    if not requested_scopes:
+        return None
+    return ScopeSet(requested_scopes).as_list()
+
+
+def build_scopes_filter(session, organization_id, scopes):
+    """Builds the condition that keeps only the paths within the scopes of an analysis.
+
+    Macroprocesses and processes of scopes are resolved to their instances in the
+    organization with a query per level (filtered by an ``IN`` list of catalog ids) and
+    matched in memory, so the condition is made of at most three ``IN`` lists.
+
+    :param session: The database session.
+    :param organization_id: The code of the organization.
+    :param scopes: Scopes as returned by ``remove_redundant_scopes``.
+    :return: A SQL condition, or None when there are no scopes (all paths are kept).
+    """
+    scope_set = ScopeSet(scopes)
+    if not len(scope_set):
+        return None
+
+    conditions = []
+    if scope_set.departments:
+        conditions.append(OrganizationDepartment.department_id.in_(list(scope_set.departments)))
+
+    if scope_set.macroprocesses:
+        department_ids = {department_id for department_id, _ in scope_set.macroprocesses}
+        query = session \
+            .query(OrganizationMacroprocess.instance_id,
+                   OrganizationMacroprocess.department_id,
+                   OrganizationMacroprocess.macroprocess_id) \
+            .filter(OrganizationMacroprocess.organization_id == organization_id) \
+            .filter(OrganizationMacroprocess.department_id.in_(department_ids))
+        instance_ids = [instance_id for instance_id, department_id, macroprocess_id in query
+                        if (department_id, macroprocess_id) in scope_set.macroprocesses]
+        if instance_ids:
+            conditions.append(OrganizationMacroprocess.instance_id.in_(instance_ids))
+
+    if scope_set.processes:
+        process_ids = {process_id for _, _, process_id in scope_set.processes}
+        query = session \
+            .query(OrganizationProcess.instance_id,
+                   OrganizationMacroprocess.department_id,
+                   OrganizationMacroprocess.macroprocess_id,
+                   OrganizationProcess.process_id) \
+            .join(OrganizationMacroprocess) \
+            .filter(OrganizationProcess.organization_id == organization_id) \
+            .filter(OrganizationProcess.process_id.in_(process_ids))
+        instance_ids = [row.instance_id for row in query if tuple(row[1:]) in scope_set.processes]
+        if instance_ids:
+            conditions.append(OrganizationProcess.instance_id.in_(instance_ids))
+
+    # Scopes that don't exist in organization match no path
+    return or_(*conditions) if conditions else false()
@@ -0,0 +1,124 @@
+"""
+What-if simulation of the risk of an organization.
+
+Levels of processes, IT services, IT assets (in IT services), security threats
+and vulnerabilities can be overridden with hypothetical values. Paths are taken
+with their current levels (including the ones not rated yet), the overrides are
+applied to the level columns, the paths that end up with any level not rated are
+dropped and the risk is calculated as in an analysis. Nothing is persisted.
+"""
+import numpy as np
+from sqlalchemy import func
+
+from knoweak.analysis import risk, rollups
+from knoweak.db.models.organization import OrganizationProcess
+
+# Levels not rated (NULL) are fetched as 0, so overrides can rate them
+SIMULATION_COLUMNS = [
+    func.coalesce(column.element, 0).label(column.key) if column.key in risk.LEVEL_FIELDS else column
+    for column in risk.PATH_COLUMNS
+] + [OrganizationProcess.instance_id.label('process_instance_id')]
+
+# Kind of override, the level field it changes and the fields of path that identify what is overridden
+OVERRIDE_KINDS = [
+    ('processes', 'process_relevance', ['process_instance_id']),
+    ('it_services', 'it_service_relevance', ['it_service_instance_id']),
+    ('it_service_it_assets', 'it_asset_relevance', ['it_service_instance_id', 'it_asset_instance_id']),
+    ('security_threats', 'security_threat_level', ['security_threat_id']),
+    ('vulnerabilities', 'it_asset_vulnerability_level', ['it_asset_instance_id', 'security_threat_id']),
+]
+
+# Ids are INT in database, so keys combine them in 32 bits each (ids of overrides are validated)
+MAX_ID = 2 ** 31 - 1
+_KEY_BITS = 32
+
+
+def apply_overrides(paths, overrides):
+    """Replaces the levels of paths by the ones of overrides (in place).
+
+    :param paths: A ``PathColumns`` object selecting ``SIMULATION_COLUMNS``.
+    :param overrides: A dict with a list of (key, level) for each kind of override, where key
+        is a tuple with the values of the fields that identify what is overridden.
+    """
+    for kind, level_field, key_fields in OVERRIDE_KINDS:
+        if not overrides.get(kind):
+            continue
+
+        keys = combine_keys([paths[field] for field in key_fields])
+        override_keys = combine_keys([np.array([key[i] for key, _ in overrides[kind]], dtype=np.int64)
+                                      for i in range(len(key_fields))])
+        override_levels = np.array([level for _, level in overrides[kind]], dtype=np.int64)
+
+        # Binary search of the key of each path among the sorted keys of overrides
+        order = np.argsort(override_keys, kind='stable')
+        override_keys, override_levels = override_keys[order], override_levels[order]
+        positions = np.minimum(np.searchsorted(override_keys, keys), len(override_keys) - 1)
+        matched = override_keys[positions] == keys
+        paths[level_field][matched] = override_levels[positions[matched]]
+
+
+def combine_keys(columns):
+    """Combines columns of ids (from 0 to MAX_ID) into a single column of int64 keys."""
+    keys = columns[0].astype(np.int64)
+    for column in columns[1:]:
+        keys = (keys << _KEY_BITS) | column.astype(np.int64)
+    return keys
+
+
+def simulate(session, paths, overrides, top, formula=None):
+    """Calculates the risk of paths after applying the overrides.
+
+    :param session: The database session.
+    :param paths: A ``PathColumns`` object with the columns of ``SIMULATION_COLUMNS``.
+        It's changed by overrides.
+    :param overrides: See ``apply_overrides``.
+    :param top: Number of paths with the highest risks to be returned as details.
+    :param formula: (Optional) See ``risk.calculate_risk``.
+    :return: A tuple with the total of paths, the details of the top risks and the rollups.
+    """
+    apply_overrides(paths, overrides)
+
+    rated = np.ones(len(paths), dtype=bool)
+    for field in risk.LEVEL_FIELDS:
+        rated &= paths[field] > 0
+    paths = paths.select(rated)
+
+    impact, probability, calculated_risk = risk.calculate_risk(paths, formula)
+    order = np.lexsort((np.arange(len(paths)), -probability, -impact, -calculated_risk))
+    top_details = risk.build_details(session, paths.select(order[:top]), formula=formula) if len(paths) else []
+
+    return len(paths), top_details, build_rollups(session, paths, calculated_risk)
+
+
+def build_rollups(session, paths, calculated_risk):
+    """Calculates the rollups of risk per level in memory, as they are stored for an analysis.
+
+    :return: A dict with a list of rollups (sorted by max risk) for each level.
+    """
+    key_by_name_field = {name_field: (key, model) for name_field, key, model in risk.NAME_FIELDS}
+
+    result = {}
+    for level, name_field, _ in rollups.LEVELS:
+        key, model = key_by_name_field[name_field]
+        unique_ids, inverse = np.unique(paths[key], return_inverse=True)
+        total_details = np.bincount(inverse, minlength=len(unique_ids))
+        sum_risk = np.bincount(inverse, weights=calculated_risk, minlength=len(unique_ids))
+        max_risk = np.zeros(len(unique_ids))
+        np.maximum.at(max_risk, inverse, calculated_risk)
+
+        names_by_id = dict(session.query(model.id, model.name).filter(model.id.in_(unique_ids.tolist())))
+
+        max_risk, sum_risk, total_details = max_risk.tolist(), sum_risk.tolist(), total_details.tolist()
+        level_rollups = [
+            {
+                'name': names_by_id.get(item_id),
+                'max_risk': max_risk[i],
+                'sum_risk': sum_risk[i],
+                'mean_risk': sum_risk[i] / total_details[i],
+                'total_details': total_details[i]
+            }
+            for i, item_id in enumerate(unique_ids.tolist())
+        ]
+        level_rollups.sort(key=lambda rollup: (-rollup['max_risk'], -rollup['mean_risk'], rollup['name']))
+        result[level] = level_rollups
+    return result
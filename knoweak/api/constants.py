@@ -2,6 +2,12 @@
 
 DEFAULT_RECORDS_PER_PAGE = 10
 MAX_RECORDS_PER_PAGE = 100
+STREAM_BATCH_SIZE = 1000
+EXPAND_BATCH_SIZE = 500
+
+PAGING_TOTAL_COUNTED = 'counted'
+PAGING_TOTAL_CACHED = 'cached'
+PAGING_TOTAL_ESTIMATED = 'estimated'
 
 GENERAL_NAME_MIN_LENGTH = 2
 GENERAL_NAME_MAX_LENGTH = 128
@@ -11,3 +17,11 @@ EMAIL_MAX_LENGTH = 256
 TAX_ID_MAX_LENGTH = 16
 PASSWORD_MIN_LENGTH = 6
 ANALYSIS_DESCRIPTION_MAX_LENGTH = 1024
+
+ANALYSIS_JOB_STATUS_QUEUED = 'queued'
+ANALYSIS_JOB_STATUS_RUNNING = 'running'
+ANALYSIS_JOB_STATUS_SUCCEEDED = 'succeeded'
+ANALYSIS_JOB_STATUS_FAILED = 'failed'
+
+ANALYSIS_DETAILS_FORMAT_PLAIN = 'plain'
+ANALYSIS_DETAILS_FORMAT_DICTIONARY = 'dictionary'
@@ -0,0 +1,157 @@
+"""
+Filter and sort criteria of collections.
+
+Clients can filter records in the 'filter' query string parameter and change
+their order in the 'sort' parameter, e.g.
+
+    ?filter=relevanceLevelId>=4,createdOn<2020-01-01&sort=-createdOn
+
+A filter is a list of conditions (all of them must be true), each one a field,
+an operator (= != > >= < <=) and a value. Values of = and != can be many,
+separated by '|' (e.g. 'relevanceLevelId=4|5'), and 'null' is the NULL value.
+Dates are in ISO format (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS[.ffffff]). Sort is a
+list of fields, each one descending when prefixed by '-'. Records are then
+sorted by the default order of the collection.
+
+Fields are limited to the columns each resource declares (those that are indexed).
+The parameters are parsed once and compiled into SQL expressions of these columns.
+"""
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import inflection
+
+from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.paging import get_order_by, get_python_type
+
+DATETIME_FORMATS = ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d']
+
+NULL_VALUE = 'null'
+
+_CONDITION_PATTERN = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*(>=|<=|!=|=|>|<)\s*(.*?)\s*$')
+
+_COMPARISONS = {
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+}
+
+
+class Criteria:
+    """Conditions and order (SQL expressions) requested for a collection."""
+
+    def __init__(self, conditions, order_by):
+        self.conditions = conditions
+        self.order_by = order_by
+
+    @classmethod
+    def from_request(cls, req, columns):
+        """Gets the criteria requested in the 'filter' and 'sort' parameters.
+
+        :param req: The request object. See Falcon Request documentation.
+        :param columns: The columns that records can be filtered and sorted by (a dict by field name).
+        :return: A ``Criteria`` or None when neither filter nor sort were requested.
+        :raises HTTPUnprocessableEntity: When a parameter is not valid.
+        """
+        filters = req.get_param_as_list('filter')
+        sorts = req.get_param_as_list('sort')
+        if filters is None and sorts is None:
+            return None
+
+        errors = []
+        try:
+            conditions = [parse_condition(condition, columns) for condition in filters or []]
+        except ValueError:
+            conditions = None
+            errors.append(build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='filter'))
+        try:
+            order_by = [parse_sort(sort, columns) for sort in sorts or []]
+        except ValueError:
+            order_by = None
+            errors.append(build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='sort'))
+        if errors:
+            raise HTTPUnprocessableEntity(errors)
+        return cls(conditions, order_by)
+
+    def apply(self, query):
+        """Filters a query by the conditions and orders it by the sort, then by its own order."""
+        if self.conditions:
+            query = query.filter(*self.conditions)
+        if self.order_by:
+            default_order_by = get_order_by(query)
+            query = query.order_by(None).order_by(*self.order_by, *default_order_by)
+        return query
+
+
+def parse_condition(condition, columns):
+    """Compiles a condition (e.g. 'relevanceLevelId>=4') into a SQL expression.
+
+    :raises ValueError: When the condition is not valid.
+    """
+    match = _CONDITION_PATTERN.match(condition)
+    if match is None:
+        raise ValueError('The condition is not valid.')
+    field, operator, value = match.groups()
+    column = get_column(field, columns)
+
+    if operator in ('=', '!='):
+        values = [parse_value(column, value.strip()) for value in value.split('|')]
+        in_values = [value for value in values if value is not None]
+        expressions = []
+        if in_values:
+            expressions.append(column == in_values[0] if len(in_values) == 1 else column.in_(in_values))
+        if None in values:
+            expressions.append(column.is_(None))
+        expression = expressions[0] if len(expressions) == 1 else expressions[0] | expressions[1]
+        return expression if operator == '=' else ~expression
+
+    value = parse_value(column, value)
+    if value is None:
+        raise ValueError('NULL can only be compared by = and !=.')
+    return _COMPARISONS[operator](column, value)
+
+
+def parse_sort(sort, columns):
+    """Compiles a field of sort (e.g. '-createdOn') into an ORDER BY expression.
+
+    :raises ValueError: When the field is not valid.
+    """
+    sort = sort.strip()
+    is_descending = sort.startswith('-')
+    column = get_column(sort.lstrip('+-').strip(), columns)
+    return column.desc() if is_descending else column.asc()
+
+
+def get_column(field, columns):
+    column = columns.get(inflection.underscore(field))
+    if column is None:
+        raise ValueError('The field is not valid.')
+    return column
+
+
+def parse_value(column, value):
+    """Converts a value of a condition into the type of a column (None is NULL)."""
+    if value == NULL_VALUE:
+        return None
+
+    python_type = get_python_type(column)
+    try:
+        if python_type is int:
+            return int(value)
+        if python_type is float:
+            return float(value)
+        if python_type is Decimal:
+            return Decimal(value)
+    except (ValueError, InvalidOperation):
+        raise ValueError('The value is not valid.')
+    if python_type is datetime:
+        for datetime_format in DATETIME_FORMATS:
+            try:
+                return datetime.strptime(value, datetime_format)
+            except ValueError:
+                continue
+        raise ValueError('The value is not valid.')
+    return value
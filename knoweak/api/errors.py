@@ -40,6 +40,11 @@ class Message(Enum):
     ERR_DEPARTMENT_ID_ALREADY_IN_ORGANIZATION = "Department already exists in organization informed."
     ERR_ORGANIZATION_SECURITY_THREAT_ID_INVALID = "Security threat id is invalid or doesn't exist in organization."
     ERR_NO_ITEMS_TO_ANALYZE = "No items to analyze."
+    ERR_ANALYSIS_JOB_FAILED = "The analysis could not be processed."
+    ERR_ANALYSIS_JOB_INTERRUPTED = "The analysis was interrupted before it was finished. Request it again."
+    ERR_ANALYSIS_CANNOT_BE_BASE = "The analysis cannot be used as base for an incremental analysis."
+    ERR_RISK_FORMULA_INVALID = "Risk formula is invalid. Use numbers, levels, operators (+ - * / **) and " \
+                               "the functions allowed, with results between 0 and 1 for all levels."
 
 
 class MessagePTBR(Enum):
@@ -60,3 +65,8 @@ class MessagePTBR(Enum):
     ERR_DEPARTMENT_ID_ALREADY_IN_ORGANIZATION = "O departamento já existe na organização."
     ERR_ORGANIZATION_SECURITY_THREAT_ID_INVALID = "O identificador da ameaça é inválido ou não existe na organização."
     ERR_NO_ITEMS_TO_ANALYZE = "Nenhum item a ser analisado."
+    ERR_ANALYSIS_JOB_FAILED = "Não foi possível processar a análise."
+    ERR_ANALYSIS_JOB_INTERRUPTED = "A análise foi interrompida antes de terminar. Solicite-a novamente."
+    ERR_ANALYSIS_CANNOT_BE_BASE = "A análise não pode ser usada como base para uma análise incremental."
+    ERR_RISK_FORMULA_INVALID = "A fórmula de risco é inválida. Use números, níveis, operadores (+ - * / **) e " \
+                               "as funções permitidas, com resultados entre 0 e 1 para todos os níveis."
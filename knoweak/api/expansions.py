@@ -0,0 +1,114 @@
+"""
+Expansion of children of resources.
+
+Clients can ask for the children of records to be embedded in them in the
+'expand' query string parameter (e.g. 'expand=itAssets' in IT services of an
+organization) instead of requesting the children of each record. Children of
+children are expanded with dots ('expand=itAssets.vulnerabilities') and many
+children with commas. Each resource declares the children it can expand.
+
+Children of all records are fetched at once, in batches of parent ids (IN), so
+the number of statements of a request depends on the children expanded, not on
+the number of records.
+"""
+from itertools import islice
+
+import inflection
+
+from knoweak.api import constants
+from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import HTTPUnprocessableEntity
+
+
+class Expansion:
+    """Children that can be embedded in the records of a resource.
+
+    :param key: The column of the child model that references the parent.
+    :param parent_key: The attribute of the parent referenced by key.
+    :param asdict_func: Function to make a dict from a child.
+    :param order_by: (Optional) Order of the children of each parent.
+    :param joins: (Optional) Entities joined to order the children.
+    :param expansions: (Optional) Expansions of the children (a dict by name).
+    """
+
+    def __init__(self, key, parent_key, asdict_func, order_by=(), joins=(), expansions=None):
+        self.key = key
+        self.parent_key = parent_key
+        self.asdict_func = asdict_func
+        self.order_by = list(order_by)
+        self.joins = list(joins)
+        self.expansions = expansions or {}
+
+    def fetch(self, session, parent_ids):
+        """Gets the children of parents in lists by parent id."""
+        children_by_parent_id = {parent_id: [] for parent_id in parent_ids}
+        parent_ids = iter(children_by_parent_id)
+        while True:
+            batch = list(islice(parent_ids, constants.EXPAND_BATCH_SIZE))
+            if not batch:
+                break
+            query = session.query(self.key.class_)
+            for entity in self.joins:
+                query = query.join(entity)
+            query = query.filter(self.key.in_(batch)).order_by(*self.order_by)
+            for child in query:
+                children_by_parent_id[getattr(child, self.key.key)].append(child)
+        return children_by_parent_id
+
+
+class Expand:
+    """Children requested to be embedded in the records of a resource."""
+
+    def __init__(self, expansions, tree):
+        self.expansions = expansions
+        self.tree = tree
+
+    @classmethod
+    def from_request(cls, req, expansions):
+        """Gets the children requested in the 'expand' parameter (in camel case, separated by comma).
+
+        :param req: The request object. See Falcon Request documentation.
+        :param expansions: The expansions of the resource (a dict by name).
+        :return: An ``Expand`` or None when children were not requested.
+        :raises HTTPUnprocessableEntity: When a child can't be expanded in the resource.
+        """
+        paths = req.get_param_as_list('expand')
+        if paths is None:
+            return None
+
+        tree = {}
+        for path in paths:
+            node, node_expansions = tree, expansions
+            for name in path.strip().split('.'):
+                name = inflection.underscore(name.strip())
+                if name not in node_expansions:
+                    raise HTTPUnprocessableEntity([build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='expand')])
+                node = node.setdefault(name, {})
+                node_expansions = node_expansions[name].expansions
+        return cls(expansions, tree)
+
+    def embed(self, session, records, data):
+        """Embeds the children requested in the dicts of records.
+
+        :param session: The database session.
+        :param records: The records (models) of the resource.
+        :param data: The dicts made from records (in the same order), changed in place.
+        """
+        embed(session, records, data, self.expansions, self.tree)
+
+
+def embed(session, records, data, expansions, tree):
+    for name, subtree in tree.items():
+        expansion = expansions[name]
+        parent_ids = [getattr(record, expansion.parent_key) for record in records]
+        children_by_parent_id = expansion.fetch(session, parent_ids)
+
+        # Each child is made a dict once, even when it's embedded in many records
+        children = [child for children in children_by_parent_id.values() for child in children]
+        children_data = [expansion.asdict_func(child) for child in children]
+        if subtree:
+            embed(session, children, children_data, expansion.expansions, subtree)
+
+        data_by_child = {id(child): obj for child, obj in zip(children, children_data)}
+        for parent_id, obj in zip(parent_ids, data):
+            obj[name] = [data_by_child[id(child)] for child in children_by_parent_id[parent_id]]
@@ -0,0 +1,77 @@
+"""
+Sparse fieldsets of resources.
+
+Clients can ask for only some fields of a resource in the 'fields' query string
+parameter (e.g. 'fields=id,name'). Fields are the attributes of the model of the
+resource: its columns and its relationships (the nested objects of responses).
+Only the columns requested (and the primary key) are selected from the database
+and relationships not requested are not loaded (nor joined), then only the fields
+requested are serialized.
+"""
+import inflection
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, noload
+
+from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import HTTPUnprocessableEntity
+
+
+class Fieldset:
+    """Fields requested of a model."""
+
+    def __init__(self, model, names):
+        self.model = model
+        self.names = set(names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    @classmethod
+    def from_request(cls, req, model):
+        """Gets the fieldset requested in the 'fields' parameter (in camel case, separated by comma).
+
+        :param req: The request object. See Falcon Request documentation.
+        :param model: The model of the resource.
+        :return: A ``Fieldset`` or None when fields were not requested.
+        :raises HTTPUnprocessableEntity: When a field is not an attribute of the model.
+        """
+        fields = req.get_param_as_list('fields')
+        if fields is None:
+            return None
+
+        names = [inflection.underscore(field.strip()) for field in fields if field.strip()]
+        attribute_keys = {attribute.key for attribute in inspect(model).attrs}
+        if not names or any(name not in attribute_keys for name in names):
+            raise HTTPUnprocessableEntity([build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='fields')])
+        return cls(model, names)
+
+    def apply(self, query):
+        """Limits the columns selected by a query of the model to the fields (and the primary key)
+        and skips loading the relationships that are not among the fields.
+        """
+        mapper = inspect(self.model)
+        primary_key = set(mapper.primary_key)
+        columns = [getattr(self.model, attribute.key) for attribute in mapper.column_attrs
+                   if attribute.key in self.names or primary_key.intersection(attribute.columns)]
+        relationships = [getattr(self.model, relationship.key) for relationship in mapper.relationships
+                         if relationship.key not in self.names]
+        return query.options(load_only(*columns), *[noload(relationship) for relationship in relationships])
+
+
+def fieldset_asdict(dictable_model, fieldset=None, follow=None, exclude=None):
+    """Gets a model as dict (see dictalchemy ``asdict``) with only the fields of a fieldset.
+    Columns not requested are never read, as they may not have been loaded.
+
+    :param dictable_model: The model.
+    :param fieldset: (Optional) The ``Fieldset``. When None, all fields are included.
+    :param follow: (Optional) Relationships to follow, as in ``asdict``.
+    :param exclude: (Optional) Fields to exclude, as in ``asdict``.
+    :return: A dict.
+    """
+    if fieldset is None:
+        return dictable_model.asdict(follow=follow, exclude=exclude)
+
+    follow = {key: args for key, args in (follow or {}).items() if key in fieldset}
+    exclude = (exclude or []) + [attribute.key for attribute in inspect(dictable_model).mapper.column_attrs
+                                 if attribute.key not in fieldset]
+    return dictable_model.asdict(follow=follow, exclude=exclude)
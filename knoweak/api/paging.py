@@ -0,0 +1,331 @@
+"""
+Paging of collections: keyset (cursor) pages and cached totals of records.
+
+A page of a keyset is fetched seeking the rows after the last row of the previous
+page (a WHERE predicate on the columns of ORDER BY) instead of skipping all rows
+before it (OFFSET), so every page costs the same however deep it is. The keyset
+of a query is taken from its ORDER BY plus the primary key of its entity, which
+makes the order total. The position in the collection is sent to clients as an
+opaque cursor with the values of the keyset in the last row of a page.
+
+NULLs are expected first in ascending order and last in descending order, as in MySQL.
+
+Where the database supports window functions, the total of records is fetched
+along with the page (COUNT(*) OVER ()) in a single statement. Otherwise (e.g.
+MySQL 5.7) records are counted in a statement of their own.
+
+Totals of records of collections in an organization are cached per query shape
+(its SQL and parameters) along with the versions of the organization they were
+counted in. A cached total is valid while the versions of the organization are
+the same: ``graph_version`` is increased by writes in the structure of the
+organization (see ``graph.invalidate``) and ``totals_version`` by the other writes
+in the organization (see ``invalidate_totals``). Versions are read from the
+database in the same statement as the page or the count (as scalar subqueries),
+so writes made by any process invalidate the cache without another round trip.
+"""
+import base64
+import json
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import and_, or_, false, func, inspect, select
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import ColumnElement, UnaryExpression
+
+from knoweak.db.models.organization import Organization
+from knoweak.settings import PAGING
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+_totals_cache = OrderedDict()
+_totals_cache_lock = threading.Lock()
+
+
+class Keyset:
+    """Columns (and their directions) that identify the position of a row in the order of a query."""
+
+    def __init__(self, columns, descending, primary_key):
+        self.columns = columns
+        self.descending = descending
+        self.primary_key = primary_key
+
+    def apply(self, query, cursor=None):
+        """Orders a query by the whole keyset and adds its columns to the query, as the values of
+        the keyset may not be attributes of the entity. When a cursor is informed, only the rows
+        after it are selected.
+        """
+        query = query \
+            .order_by(*self.primary_key) \
+            .add_columns(*[column.label(f'keyset_{i}') for i, column in enumerate(self.columns)])
+        if cursor is not None:
+            query = query.filter(self.seek(self.decode(cursor)))
+        return query
+
+    @classmethod
+    def from_query(cls, query):
+        """Gets the keyset of a query of a single entity (see module docs).
+
+        :param query: Session query from SQL Alchemy.
+        :return: A ``Keyset`` or None when the query doesn't support keyset paging.
+        """
+        descriptions = query.column_descriptions
+        if len(descriptions) != 1 or descriptions[0]['entity'] is None \
+                or descriptions[0]['expr'] is not descriptions[0]['entity']:
+            return None
+
+        entity = descriptions[0]['entity']
+        mapper = inspect(entity).mapper
+        primary_key = [getattr(entity, mapper.get_property_by_column(column).key).expression
+                       for column in mapper.primary_key]
+
+        columns, descending = [], []
+        for clause in get_order_by(query):
+            is_descending = False
+            if isinstance(clause, UnaryExpression) and clause.modifier in (operators.asc_op, operators.desc_op):
+                is_descending = clause.modifier is operators.desc_op
+                clause = clause.element
+            if not isinstance(clause, ColumnElement):
+                return None
+            columns.append(clause)
+            descending.append(is_descending)
+
+        columns.extend(primary_key)
+        descending.extend([False] * len(primary_key))
+        return cls(columns, descending, primary_key)
+
+    def seek(self, values):
+        """Builds the predicate of the rows after the position of values, as
+        (c1 > v1) OR (c1 = v1 AND c2 > v2) OR ... in the direction of each column.
+        """
+        conditions = []
+        for i, (column, is_descending, value) in enumerate(zip(self.columns, self.descending, values)):
+            previous_columns_equal = [column_equal(c, v) for c, v in zip(self.columns[:i], values[:i])]
+            conditions.append(and_(*previous_columns_equal, column_after(column, is_descending, value)))
+        return or_(*conditions)
+
+    def encode(self, values):
+        """Gets the cursor of a row from the values of its keyset."""
+        values = [value.strftime(CURSOR_DATETIME_FORMAT) if isinstance(value, datetime)
+                  else str(value) if isinstance(value, Decimal) else value
+                  for value in values]
+        content = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(content).decode().rstrip('=')
+
+    def decode(self, cursor):
+        """Gets the values of the keyset from a cursor.
+
+        :raises ValueError: When the cursor is not valid for this keyset.
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+        except (TypeError, UnicodeDecodeError, base64.binascii.Error):
+            raise ValueError('The cursor is not valid.')
+        if not isinstance(values, list) or len(values) != len(self.columns):
+            raise ValueError('The cursor is not valid.')
+
+        return [None if value is None else decode_value(get_python_type(column), value)
+                for column, value in zip(self.columns, values)]
+
+
+def decode_value(python_type, value):
+    """Gets the value of a column of a keyset from its value in a cursor (see ``Keyset.encode``).
+
+    :raises ValueError: When the value doesn't have the type of the column.
+    """
+    # Booleans are ints in Python, but never the value of a numeric column
+    if python_type is bool:
+        is_valid = isinstance(value, bool)
+    elif python_type is int:
+        is_valid = isinstance(value, int) and not isinstance(value, bool)
+    elif python_type is float:
+        is_valid = isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+    elif python_type in (str, datetime, Decimal):
+        is_valid = isinstance(value, str)
+    else:
+        is_valid = isinstance(value, (bool, int, float, str))
+    if not is_valid:
+        raise ValueError('The cursor is not valid.')
+
+    if python_type is float:
+        return float(value)
+    if python_type is datetime:
+        return datetime.strptime(value, CURSOR_DATETIME_FORMAT)
+    if python_type is Decimal:
+        try:
+            value = Decimal(value)
+        except InvalidOperation:
+            raise ValueError('The cursor is not valid.')
+        if not value.is_finite():
+            raise ValueError('The cursor is not valid.')
+    return value
+
+
+def get_order_by(query):
+    # Query has no public accessor of its ORDER BY (it's '_order_by' until SQLAlchemy 1.4)
+    clauses = getattr(query, '_order_by_clauses', None)
+    if clauses is None:
+        clauses = query._order_by or ()
+    return list(clauses)
+
+
+def get_python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def column_equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def column_after(column, is_descending, value):
+    if value is None:
+        # NULLs come first in ascending order and last in descending order
+        return false() if is_descending else column.isnot(None)
+    if not is_descending:
+        return column > value
+    if getattr(column, 'nullable', True):
+        return or_(column < value, column.is_(None))
+    return column < value
+
+
+def fetch_page(query, records_per_page, offset=0, keyset=None, cursor=None, count_total=False,
+               organization_id=None):
+    """Fetches a page of records.
+
+    :param query: Session query from SQL Alchemy to fetch records.
+    :param records_per_page: Number of records of the page.
+    :param offset: (Optional) Number of records to skip.
+    :param keyset: (Optional) The ``Keyset`` of query, to get the cursor of the next page.
+    :param cursor: (Optional) The cursor of the last record of the previous page (requires keyset).
+    :param count_total: (Optional) When true, the total of records is counted in the same
+        statement. Check ``supports_window_count`` first.
+    :param organization_id: (Optional) When informed, the versions of the organization are
+        read in the same statement (see ``get_version_columns``).
+    :return: A tuple with the records, whether there's a next page, the cursor of the next
+        page (None without keyset), the total of records (None when not counted or when
+        there are no records in the page) and the versions of the organization (None when
+        not read or when there are no records in the page). Records of queries of many
+        columns are tuples.
+    :raises ValueError: When the cursor is not valid for the keyset.
+    """
+    width = len(query.column_descriptions)
+    if keyset is not None:
+        query = keyset.apply(query, cursor)
+    if count_total:
+        query = query.add_columns(func.count().over().label('total_records'))
+    if organization_id is not None:
+        query = query.add_columns(*get_version_columns(organization_id))
+    if offset:
+        query = query.offset(offset)
+
+    # One more row tells whether there's a next page
+    rows = query.limit(records_per_page + 1).all()
+    has_next_page = len(rows) > records_per_page
+    rows = rows[:records_per_page]
+
+    if keyset is None and not count_total and organization_id is None:
+        return rows, has_next_page, None, None, None
+
+    next_cursor = None
+    position = width
+    if keyset is not None:
+        if has_next_page:
+            next_cursor = keyset.encode(rows[-1][position:position + len(keyset.columns)])
+        position += len(keyset.columns)
+    total_records = rows[0][position] if count_total and rows else None
+    version = tuple(rows[0][-2:]) if organization_id is not None and rows else None
+    records = [row[0] for row in rows] if width == 1 else [tuple(row[:width]) for row in rows]
+    return records, has_next_page, next_cursor, total_records, version
+
+
+def count_records(query, organization_id=None):
+    """Counts the records of a query in a statement of its own.
+
+    :param query: Session query from SQL Alchemy.
+    :param organization_id: (Optional) When informed, the versions of the organization are
+        read in the same statement (see ``get_version_columns``).
+    :return: A tuple with the total of records and the versions of the organization (None when not read).
+    """
+    columns = [func.count()]
+    if organization_id is not None:
+        columns.extend(get_version_columns(organization_id))
+    row = query.session.query(*columns).select_from(query.order_by(None).subquery()).one()
+    return row[0], tuple(row[1:]) if organization_id is not None else None
+
+
+def supports_window_count(session):
+    """Checks whether the database of a session supports COUNT(*) OVER ()."""
+    dialect = session.get_bind().dialect
+    version = dialect.server_version_info or ()
+    if dialect.name == 'mysql':
+        if getattr(dialect, 'is_mariadb', False) or 'MariaDB' in version:
+            return version >= (10, 2)
+        return version >= (8, 0)
+    if dialect.name == 'sqlite':
+        return getattr(dialect.dbapi, 'sqlite_version_info', ()) >= (3, 25)
+    return dialect.name in ('postgresql', 'oracle', 'mssql')
+
+
+def get_version_columns(organization_id):
+    """Gets the versions of an organization (graph and totals) as scalar subqueries, to be
+    read as columns of another statement.
+    """
+    return [select([column]).where(Organization.id == organization_id).correlate(None).as_scalar().label(label)
+            for column, label in [(Organization.graph_version, 'graph_version'),
+                                  (Organization.totals_version, 'totals_version')]]
+
+
+def get_totals_key(query, organization_id):
+    """Gets the key of the total of records of a query in cache, made of the organization
+    and the shape of the query (its SQL with the values of its parameters).
+
+    :return: The key or None when there's no organization (totals are not cached).
+    """
+    if organization_id is None:
+        return None
+
+    compiled = query.statement.compile()
+    return organization_id, str(compiled), repr(sorted(compiled.params.items()))
+
+
+def get_cached_total(key):
+    """Gets the total of records cached for a key (see ``get_totals_key``).
+
+    :return: A tuple with the versions of the organization the total was counted in and
+        the total, or None when not cached. The versions must be checked by the caller.
+    """
+    if key is None:
+        return None
+    with _totals_cache_lock:
+        cached = _totals_cache.get(key)
+        if cached is not None:
+            _totals_cache.move_to_end(key)
+        return cached
+
+
+def cache_total(key, version, total_records):
+    if key is None or version is None:
+        return
+    with _totals_cache_lock:
+        _totals_cache[key] = (version, total_records)
+        _totals_cache.move_to_end(key)
+        while len(_totals_cache) > PAGING['totals_cache_size']:
+            _totals_cache.popitem(last=False)
+
+
+def invalidate_totals(session, organization_id):
+    """Marks the cached totals of collections in an organization as outdated. Must be called
+    by write operations in the organization that don't change its structure (these call
+    ``graph.invalidate``) before they commit.
+
+    :param session: The database session.
+    :param organization_id: The code of the organization.
+    """
+    session.query(Organization) \
+        .filter(Organization.id == organization_id) \
+        .update({Organization.totals_version: Organization.totals_version + 1}, synchronize_session=False)
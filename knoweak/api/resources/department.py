@@ -3,7 +3,9 @@ import falcon
 from knoweak.api import constants
 from knoweak.api.errors import Message, build_error
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api import search
 from knoweak.api.utils import get_collection_page, validate_str, patch_item
 from knoweak.db import Session
 from knoweak.db.models.catalog import BusinessDepartment
@@ -21,9 +23,11 @@ class Collection:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, BusinessDepartment)
             query = session.query(BusinessDepartment).order_by(BusinessDepartment.name)
+            query = search.filter_by_name(req, query, BusinessDepartment)
 
-            data, paging = get_collection_page(req, query)
+            data, paging = get_collection_page(req, query, fieldset=fieldset)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -48,6 +52,7 @@ class Collection:
             item = BusinessDepartment().fromdict(req.media, only=['name'])
 
             session.add(item)
+            search.invalidate(session, BusinessDepartment)
             session.commit()
             resp.status = falcon.HTTP_CREATED
             resp.location = req.relative_uri + f'/{item.id}'
@@ -69,11 +74,12 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, BusinessDepartment)
             item = session.query(BusinessDepartment).get(department_id)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': item.asdict()}
+            resp.media = {'data': fieldset_asdict(item, fieldset)}
         finally:
             session.close()
 
@@ -97,6 +103,8 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(department, req.media, only=['name'])
+            if 'name' in req.media:
+                search.invalidate(session, BusinessDepartment)
             session.commit()
 
             resp.status = falcon.HTTP_OK
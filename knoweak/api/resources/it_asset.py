@@ -1,14 +1,23 @@
 import falcon
 
 from knoweak.api import constants as constants
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import Message, build_error
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api import search
 from knoweak.api.utils import get_collection_page, validate_str, patch_item
 from knoweak.db import Session
 from knoweak.db.models.catalog import ITAsset, ITAssetCategory
 
 
+# Indexed columns that IT assets can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'category_id': ITAsset.category_id
+}
+
+
 class Collection:
     """GET and POST IT assets in catalog."""
 
@@ -21,9 +30,13 @@ class Collection:
         """
         session = Session()
         try:
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, ITAsset)
             query = session.query(ITAsset).order_by(ITAsset.name)
+            query = search.filter_by_name(req, query, ITAsset)
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               fieldset=fieldset, criteria=criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -48,6 +61,7 @@ class Collection:
             item = ITAsset().fromdict(req.media, only=['name', 'description', 'category_id'])
 
             session.add(item)
+            search.invalidate(session, ITAsset)
             session.commit()
             resp.status = falcon.HTTP_CREATED
             resp.location = req.relative_uri + f'/{item.id}'
@@ -69,11 +83,12 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, ITAsset)
             item = session.query(ITAsset).get(it_asset_id)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': item.asdict()}
+            resp.media = {'data': fieldset_asdict(item, fieldset)}
         finally:
             session.close()
 
@@ -97,6 +112,8 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(it_asset, req.media, only=['name', 'description', 'category_id'])
+            if 'name' in req.media:
+                search.invalidate(session, ITAsset)
             session.commit()
 
             resp.status = falcon.HTTP_OK
@@ -184,6 +201,6 @@ def exists_name(name, session):
     return exists
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     follow = {'category': {'only': ['id', 'name']}}
-    return dictable_model.asdict(follow=follow, exclude=['category_id'])
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=['category_id'])
@@ -3,6 +3,7 @@ import falcon
 from knoweak.api import constants as constants
 from knoweak.api.errors import Message, build_error
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
 from knoweak.api.utils import get_collection_page, validate_str, patch_item, validate_number
 from knoweak.db import Session
@@ -21,9 +22,10 @@ class Collection:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, ITAssetCategory)
             query = session.query(ITAssetCategory).order_by(ITAssetCategory.name)
 
-            data, paging = get_collection_page(req, query)
+            data, paging = get_collection_page(req, query, fieldset=fieldset)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -69,11 +71,12 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, ITAssetCategory)
             item = session.query(ITAssetCategory).get(it_asset_category_id)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': item.asdict()}
+            resp.media = {'data': fieldset_asdict(item, fieldset)}
         finally:
             session.close()
 
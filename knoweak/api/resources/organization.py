@@ -1,14 +1,28 @@
+import json
+from datetime import datetime
+
 import falcon
 
+from knoweak.analysis import formulas
 from knoweak.api import constants as constants
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import Message, build_error
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
 from knoweak.api.utils import get_collection_page, validate_str, patch_item
 from knoweak.db import Session
 from knoweak.db.models.organization import Organization
 
 
+# Indexed columns that organizations can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'tax_id': Organization.tax_id,
+    'legal_name': Organization.legal_name,
+    'trade_name': Organization.trade_name
+}
+
+
 class Collection:
     """GET and POST organizations."""
 
@@ -21,9 +35,12 @@ class Collection:
         """
         session = Session()
         try:
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, Organization)
             query = session.query(Organization).order_by(Organization.legal_name, Organization.created_on)
 
-            data, paging = get_collection_page(req, query)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               fieldset=fieldset, criteria=criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -47,12 +64,13 @@ class Collection:
             # Copy fields from request to an Organization object
             accepted_fields = ['tax_id', 'legal_name', 'trade_name']
             item = Organization().fromdict(req.media, only=accepted_fields)
+            item.risk_formula = get_risk_formula_json(req.media.get('risk_formula'))
 
             session.add(item)
             session.commit()
             resp.status = falcon.HTTP_CREATED
             resp.location = req.relative_uri + f'/{item.id}'
-            resp.media = {'data': item.asdict()}
+            resp.media = {'data': custom_asdict(item)}
         finally:
             session.close()
 
@@ -70,11 +88,12 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, Organization)
             item = session.query(Organization).get(organization_code)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': item.asdict()}
+            resp.media = {'data': custom_asdict(item, fieldset)}
         finally:
             session.close()
 
@@ -97,10 +116,15 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(organization, req.media, only=['tax_id', 'legal_name', 'trade_name'])
+            if 'risk_formula' in req.media:
+                risk_formula = get_risk_formula_json(req.media['risk_formula'])
+                if risk_formula != organization.risk_formula:
+                    organization.risk_formula = risk_formula
+                    organization.last_modified_on = datetime.utcnow()
             session.commit()
 
             resp.status = falcon.HTTP_OK
-            resp.media = {'data': organization.asdict()}
+            resp.media = {'data': custom_asdict(organization)}
         finally:
             session.close()
 
@@ -138,6 +162,10 @@ def validate_post(request_media, session):
     if error:
         errors.append(error)
 
+    # Validate risk formula if informed
+    # -----------------------------------------------------
+    errors.extend(validate_risk_formula(request_media.get('risk_formula')))
+
     return errors
 
 
@@ -181,9 +209,41 @@ def validate_patch(request_media, session):
         if error:
             errors.append(error)
 
+    # Validate risk formula if informed
+    # -----------------------------------------------------
+    if 'risk_formula' in request_media:
+        errors.extend(validate_risk_formula(request_media.get('risk_formula')))
+
     return errors
 
 
+def validate_risk_formula(risk_formula):
+    """Validates the definition of a risk formula (null means the built-in formula)."""
+    if risk_formula is None:
+        return []
+    try:
+        formulas.get_formula(risk_formula)
+    except formulas.FormulaError as e:
+        field_name = 'riskFormula' if e.field is None else f'riskFormula.{e.field}'
+        return [build_error(Message.ERR_RISK_FORMULA_INVALID, field_name=field_name)]
+    return []
+
+
+def get_risk_formula_json(risk_formula):
+    """Gets the (validated) risk formula as stored. The built-in formula is not stored."""
+    if risk_formula is None:
+        return None
+    formula = formulas.get_formula(risk_formula)
+    return None if formula.hash == formulas.DEFAULT_FORMULA.hash else formula.json
+
+
+def custom_asdict(dictable_model, fieldset=None):
+    obj = fieldset_asdict(dictable_model, fieldset, exclude=['graph_version', 'totals_version', 'risk_formula'])
+    if fieldset is None or 'risk_formula' in fieldset:
+        obj['risk_formula'] = json.loads(dictable_model.risk_formula) if dictable_model.risk_formula else None
+    return obj
+
+
 def exists_tax_id(tax_id, session):
     def exists():
         return session.query(Organization.tax_id) \
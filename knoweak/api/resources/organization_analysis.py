@@ -1,17 +1,40 @@
+import json
+import logging
+from datetime import datetime
+
 import falcon
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, literal, select
 
-from knoweak.api import constants
+from knoweak.analysis import (
+    bulk, fingerprint, formulas, graph, jobs, memory, names, ranking, risk, rollups, scoping, simulation
+)
+from knoweak.api import constants, paging
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import build_error, Message
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources import organization_analysis_job
 from knoweak.api.utils import get_collection_page, validate_str, patch_item, validate_number
 from knoweak.db import Session
+from knoweak.db.models.catalog import (
+    BusinessDepartment, BusinessMacroprocess, BusinessProcess, ITService, ITAsset, SecurityThreat
+)
 from knoweak.db.models.organization import (
     Organization, OrganizationAnalysis, OrganizationITAsset, OrganizationITService,
     OrganizationProcess, OrganizationMacroprocess, OrganizationDepartment, OrganizationAnalysisDetail,
-    OrganizationITServiceITAsset, OrganizationITAssetVulnerability, OrganizationSecurityThreat
+    OrganizationITServiceITAsset, OrganizationITAssetVulnerability, OrganizationSecurityThreat, OrganizationAnalysisJob,
+    OrganizationAnalysisName
 )
+from knoweak.settings import ANALYSIS
+
+logger = logging.getLogger(__name__)
+
+
+# Indexed columns that analyses can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'created_on': OrganizationAnalysis.created_on
+}
 
 
 class Collection:
@@ -27,6 +50,8 @@ class Collection:
         """
         session = Session()
         try:
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationAnalysis)
             organization = session.query(Organization).get(organization_code)
             if organization is None:
                 raise falcon.HTTPNotFound()
@@ -36,7 +61,8 @@ class Collection:
                 .filter(OrganizationAnalysis.organization_id == organization_code) \
                 .order_by(OrganizationAnalysis.created_on.desc())
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, criteria=criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -50,6 +76,13 @@ class Collection:
         for relevance, vulnerability and security threat levels in processes, IT services,
         IT assets and security threats.
 
+        When the query string parameter 'async' is true, the analysis is processed in
+        background and a job is returned (202 Accepted) with its location to be followed.
+
+        When nothing changed since a previous analysis with the same scopes, its details
+        are copied instead of calculated again, unless the query string parameter 'force'
+        is true.
+
         :param req: See Falcon Request documentation.
         :param resp: See Falcon Response documentation.
         :param organization_code: The code of the organization.
@@ -60,21 +93,19 @@ class Collection:
             if organization is None:
                 raise falcon.HTTPNotFound()
 
-            errors = validate_post(req.media)
+            errors = validate_post(req.media, organization_code, session)
             if errors:
                 raise HTTPUnprocessableEntity(errors)
 
-            scopes = remove_redundant_scopes(req.media.get('scopes'))
-            accepted_fields = ['description']
-            item = OrganizationAnalysis().fromdict(req.media, only=accepted_fields)
-            item.organization_id = organization_code
-            item.total_processed_items = process_analysis(session, item, organization_code, scopes)
-
-            if item.total_processed_items == 0:
-                raise HTTPUnprocessableEntity([build_error(Message.ERR_NO_ITEMS_TO_ANALYZE)])
+            force = req.get_param_as_bool('force') or False
+            if req.get_param_as_bool('async'):
+                job = create_analysis_job(session, organization_code, req.media, force)
+                resp.status = falcon.HTTP_ACCEPTED
+                resp.location = req.app + req.path + f'/jobs/{job.id}'
+                resp.media = {'data': organization_analysis_job.custom_asdict(job)}
+                return
 
-            session.add(item)
-            session.commit()
+            item = create_analysis(session, organization_code, req.media, force)
 
             resp.status = falcon.HTTP_CREATED
             resp.location = req.relative_uri + f'/{item.id}'
@@ -97,11 +128,12 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, OrganizationAnalysis)
             item = find_organization_analysis(analysis_id, organization_code, session)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': custom_asdict(item)}
+            resp.media = {'data': custom_asdict(item, fieldset)}
         finally:
             session.close()
 
@@ -125,6 +157,7 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(analysis, req.media, only=['description'])
+            paging.invalidate_totals(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_OK
@@ -148,12 +181,13 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(analysis)
+            paging.invalidate_totals(session, organization_code)
             session.commit()
         finally:
             session.close()
 
 
-def validate_post(request_media):
+def validate_post(request_media, organization_code, session):
     errors = []
 
     # Validate description if informed
@@ -165,7 +199,32 @@ def validate_post(request_media):
 
     # Validate scopes if informed
     # -----------------------------------------------------
-    scopes = request_media.get('scopes') or []
+    errors.extend(validate_scopes(request_media.get('scopes')))
+
+    # Validate base analysis if informed
+    # Scopes are taken from base analysis so they cannot be informed again
+    # -----------------------------------------------------
+    base_analysis_id = request_media.get('base_analysis_id')
+    error = validate_number('baseAnalysisId', base_analysis_id, min_value=1)
+    if error:
+        errors.append(error)
+    elif base_analysis_id is not None:
+        base_analysis = find_organization_analysis(base_analysis_id, organization_code, session)
+        if base_analysis is None:
+            errors.append(build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='baseAnalysisId'))
+        elif not supports_incremental_analysis(session, base_analysis):
+            errors.append(build_error(Message.ERR_ANALYSIS_CANNOT_BE_BASE, field_name='baseAnalysisId'))
+        if request_media.get('scopes'):
+            errors.append(build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='scopes'))
+
+    # Remove None's before returning
+    return [err for err in errors if err is not None]
+
+
+def validate_scopes(scopes):
+    errors = []
+
+    scopes = scopes or []
     for i, scope in enumerate(scopes):
 
         scope_i = f'scopes[{i}]'
@@ -205,54 +264,118 @@ def validate_patch(request_media):
     return errors
 
 
-def remove_redundant_scopes(requested_scopes):
-    """Remove redundant scopes by ignoring those of which parent levels have been
-    already been chosen as a whole and putting the remaining ones in a separate list.
+def create_analysis(session, organization_code, request_media, force=False):
+    """Creates and saves a new analysis of the organization.
+
+    :param session: The database session.
+    :param organization_code: The code of the organization.
+    :param request_media: The validated request content (description and scopes).
+    :param force: (Optional) When true, the details are calculated even if there's
+        an analysis with the same fingerprint to copy them from.
+    :return: The ``OrganizationAnalysis`` created.
+    """
+    formula = formulas.get_organization_formula(session, organization_code)
+
+    base_analysis = None
+    scopes = scoping.remove_redundant_scopes(request_media.get('scopes'))
+    if request_media.get('base_analysis_id') is not None:
+        base_analysis = find_organization_analysis(request_media['base_analysis_id'], organization_code, session)
+        scopes = json.loads(base_analysis.scopes) if base_analysis.scopes else None
+
+        # Details of base analysis cannot be reused when the formula changed since then
+        if formulas.from_json(base_analysis.risk_formula).hash != formula.hash:
+            base_analysis = None
+
+    accepted_fields = ['description']
+    item = OrganizationAnalysis().fromdict(request_media, only=accepted_fields)
+    item.organization_id = organization_code
+    item.scopes = json.dumps(scopes) if scopes else None
+    item.risk_formula = formula.json
+    item.created_on = datetime.utcnow()
+    organization_graph = graph.get_graph(session, organization_code) if ANALYSIS['graph_cache'] else None
+    item.fingerprint = fingerprint.compute(session, organization_code, scopes, formula, organization_graph)
+
+    same_analysis = None if force else find_analysis_by_fingerprint(session, organization_code, item.fingerprint)
+    if same_analysis is not None:
+        item.details_format = same_analysis.details_format
+        session.add(item)
+        session.flush()
+        item.total_processed_items = bulk.copy_details(session, same_analysis.id, item.id)
+        names.copy_names(session, same_analysis.id, item.id)
+    else:
+        item.total_processed_items = process_analysis(session, item, organization_code, scopes,
+                                                      base_analysis=base_analysis, formula=formula)
+
+    if item.total_processed_items == 0:
+        raise HTTPUnprocessableEntity([build_error(Message.ERR_NO_ITEMS_TO_ANALYZE)])
+
+    item.total_details = item.total_processed_items
+    session.add(item)
+    session.flush()
+    if same_analysis is not None and rollups.has_rollups(session, same_analysis.id):
+        rollups.copy_rollups(session, same_analysis.id, item.id)
+    else:
+        rollups.compute_rollups(session, item)
+
+    paging.invalidate_totals(session, organization_code)
+    session.commit()
+    return item
+
+
+def create_analysis_job(session, organization_code, request_media, force=False):
+    """Saves a new job and schedules it to be processed by the background workers.
+
+    :param session: The database session.
+    :param organization_code: The code of the organization.
+    :param request_media: The validated request content (description and scopes).
+    :param force: (Optional) See ``create_analysis``.
+    :return: The ``OrganizationAnalysisJob`` created.
+    """
+    job = OrganizationAnalysisJob()
+    job.organization_id = organization_code
+    job.status = constants.ANALYSIS_JOB_STATUS_QUEUED
+    session.add(job)
+    session.commit()
+
+    jobs.submit_job(job.id, run_analysis_job, job.id, organization_code, request_media, force)
+    return job
+
+
+def run_analysis_job(job_id, organization_code, request_media, force=False):
+    """Processes an analysis job in a session of its own.
+    It's meant to be run by a background worker.
 
-    :param requested_scopes: Scopes as it came from request.
-    :return: The remaining scopes
+    :param job_id: The id of the job to be processed.
+    :param organization_code: The code of the organization.
+    :param request_media: The validated request content (description and scopes).
+    :param force: (Optional) See ``create_analysis``.
     """
-    if not requested_scopes:
-        return None
-
-    whole_departments = []
-    whole_macroprocesses = []
-    whole_processes = []
-    remaining_scopes = []
-
-    # 1st pass: collect whole departments
-    for scope in requested_scopes:
-        if scope.get('department_id') is not None:
-            if scope.get('department_id') in whole_departments:
-                continue
-            if scope.get('macroprocess_id') is None and scope.get('process_id') is None:
-                whole_departments.append(scope.get('department_id'))
-                remaining_scopes.append(scope)
-
-    # 2nd pass: collect whole macroprocesses
-    for scope in requested_scopes:
-        if scope.get('macroprocess_id') is not None:
-            if scope.get('department_id') in whole_departments:
-                continue
-            if scope.get('macroprocess_id') in whole_macroprocesses:
-                continue
-            if scope.get('process_id') is None:
-                whole_macroprocesses.append(scope.get('macroprocess_id'))
-                remaining_scopes.append(scope)
-
-    # 3rd pass: collect whole processes
-    for scope in requested_scopes:
-        if scope.get('process_id') is not None:
-            if scope.get('department_id') in whole_departments:
-                continue
-            if scope.get('macroprocess_id') in whole_macroprocesses:
-                continue
-            if scope.get('process_id') in whole_processes:
-                continue
-            whole_processes.append(scope.get('process_id'))
-            remaining_scopes.append(scope)
-
-    return remaining_scopes
+    session = Session()
+    try:
+        job = session.query(OrganizationAnalysisJob).get(job_id)
+        job.status = constants.ANALYSIS_JOB_STATUS_RUNNING
+        job.started_on = job.last_modified_on = datetime.utcnow()
+        session.commit()
+
+        errors = None
+        try:
+            analysis = create_analysis(session, organization_code, request_media, force)
+            job.analysis_id = analysis.id
+            job.total_processed_items = analysis.total_processed_items
+        except HTTPUnprocessableEntity as e:
+            session.rollback()
+            errors = e.errors
+        except Exception:
+            session.rollback()
+            logger.exception('Analysis job %s failed.', job_id)
+            errors = [build_error(Message.ERR_ANALYSIS_JOB_FAILED)]
+
+        job.status = constants.ANALYSIS_JOB_STATUS_FAILED if errors else constants.ANALYSIS_JOB_STATUS_SUCCEEDED
+        job.errors = json.dumps(errors) if errors else None
+        job.finished_on = job.last_modified_on = datetime.utcnow()
+        session.commit()
+    finally:
+        session.close()
 
 
 def find_organization_analysis(analysis_id, organization_code, session):
@@ -263,32 +386,247 @@ def find_organization_analysis(analysis_id, organization_code, session):
     return query.first()
 
 
-def process_analysis(session, analysis, organization_id, scopes=None):
-    query = session\
-        .query(OrganizationITServiceITAsset,
-               OrganizationProcess,
-               OrganizationMacroprocess,
-               OrganizationDepartment,
-               OrganizationSecurityThreat,
-               OrganizationITAssetVulnerability)\
-        .join(OrganizationITAsset)\
-        .join(OrganizationITService)\
-        .join(OrganizationProcess)\
-        .join(OrganizationMacroprocess)\
-        .join(OrganizationDepartment)\
-        .join(Organization)\
-        .join(OrganizationSecurityThreat)\
-        .join(OrganizationITAssetVulnerability,
-              and_(OrganizationITAssetVulnerability.organization_security_threat_id == OrganizationSecurityThreat.id,
-                   OrganizationITAssetVulnerability.it_asset_instance_id == OrganizationITAsset.instance_id))\
-        .filter(OrganizationITServiceITAsset.relevance_level_id > 0)\
-        .filter(OrganizationITService.relevance_level_id > 0)\
-        .filter(OrganizationProcess.relevance_level_id > 0)\
-        .filter(OrganizationSecurityThreat.threat_level_id > 0)\
-        .filter(OrganizationITAssetVulnerability.vulnerability_level_id > 0)\
-        .filter(Organization.id == organization_id)
-
-    query = add_filters_for_scopes(query, scopes)
+def find_analysis_by_fingerprint(session, organization_code, analysis_fingerprint):
+    query = session \
+        .query(OrganizationAnalysis) \
+        .filter(OrganizationAnalysis.organization_id == organization_code) \
+        .filter(OrganizationAnalysis.fingerprint == analysis_fingerprint) \
+        .filter(OrganizationAnalysis.archived_on.is_(None)) \
+        .order_by(OrganizationAnalysis.created_on.desc())
+    return query.first()
+
+
+def process_analysis(session, analysis, organization_id, scopes=None, engine=None, base_analysis=None,
+                     formula=None):
+    """Calculates the risk of every path (department > ... > security threat) of the
+    organization within the scopes informed and adds the results as details of the analysis.
+
+    The peak memory (RSS) of the process observed while processing is recorded in the analysis,
+    as well as the format its details are stored in (see ``names``) and the formula of the risk.
+
+    :param session: The database session.
+    :param analysis: The ``OrganizationAnalysis`` that will receive the details.
+    :param organization_id: The code of the organization.
+    :param scopes: (Optional) Scopes as returned by ``scoping.remove_redundant_scopes``.
+    :param engine: (Optional) 'vectorized' or 'orm'. Defaults to the configured engine.
+    :param base_analysis: (Optional) A previous analysis made with the same scopes.
+        When informed, only the paths changed since the base analysis are calculated
+        and the others are copied from it.
+    :param formula: (Optional) The ``formulas.Formula`` of the risk. Defaults to the formula of the organization.
+    :return: The number of processed items.
+    """
+    peak_rss = memory.PeakRSS()
+
+    formula = formula or formulas.get_organization_formula(session, organization_id)
+    analysis.risk_formula = formula.json
+
+    engine = engine or ANALYSIS['engine']
+    if base_analysis is not None:
+        analysis.details_format = base_analysis.details_format
+    elif engine == 'orm':
+        analysis.details_format = constants.ANALYSIS_DETAILS_FORMAT_PLAIN
+    else:
+        analysis.details_format = ANALYSIS['details_format']
+
+    if base_analysis is not None:
+        total_processed_items = process_analysis_incrementally(session, analysis, organization_id, scopes,
+                                                               base_analysis, peak_rss, formula)
+    elif engine == 'orm':
+        total_processed_items = process_analysis_by_entities(session, analysis, organization_id, scopes, formula)
+    elif ANALYSIS['streaming']:
+        total_processed_items = process_analysis_in_chunks(session, analysis, organization_id, scopes, peak_rss,
+                                                           formula)
+    else:
+        total_processed_items = process_analysis_by_columns(session, analysis, organization_id, scopes, peak_rss,
+                                                            formula)
+
+    analysis.peak_rss_kb = peak_rss.sample()
+    return total_processed_items
+
+
+def process_analysis_by_columns(session, analysis, organization_id, scopes, peak_rss, formula=None):
+    paths = fetch_paths(session, organization_id, scopes)
+    if len(paths) == 0:
+        return 0
+
+    dictionary = create_name_dictionary(analysis)
+    details = risk.build_details(session, paths, dictionary=dictionary, formula=formula)
+    ranking.rank_details(details)
+    peak_rss.sample()
+    return save_details(session, analysis, details, dictionary)
+
+
+def process_analysis_in_chunks(session, analysis, organization_id, scopes, peak_rss, formula=None):
+    """Processes the analysis streaming the paths from database with a server-side cursor.
+    Each chunk of paths is calculated and its details are inserted in bulk before the
+    next chunk is fetched, so memory usage does not grow with the size of the organization.
+    """
+    query = build_analysis_query(session, organization_id, scopes, *risk.PATH_COLUMNS)
+
+    session.add(analysis)
+    session.flush()
+
+    names_cache = {}
+    dictionary = create_name_dictionary(analysis)
+    total_processed_items = 0
+    for paths in risk.stream_paths(session, query, ANALYSIS['stream_chunk_size']):
+        details = risk.build_details(session, paths, names_cache, dictionary, formula)
+        peak_rss.sample()
+        total_processed_items += bulk.insert_details(session, analysis.id, details,
+                                                     ANALYSIS['bulk_insert_batch_size'])
+        if dictionary is not None:
+            dictionary.save(session, analysis.id)
+
+    ranking.assign_ranks(session, analysis.id, ANALYSIS['bulk_insert_batch_size'])
+    return total_processed_items
+
+
+def process_analysis_incrementally(session, analysis, organization_id, scopes, base_analysis, peak_rss,
+                                   formula=None):
+    """Processes the analysis reusing the details of a base analysis.
+
+    A path is unchanged when base analysis has a detail of its instances with the same levels
+    and names (see ``build_unchanged_condition``). The details of unchanged paths are copied from
+    base analysis in a single statement and only the other paths are calculated. Paths that no
+    longer exist are neither copied nor calculated.
+    """
+    session.add(analysis)
+    session.flush()
+
+    total_processed_items = copy_unchanged_details(session, analysis, organization_id, scopes, base_analysis)
+
+    # Names of copied details keep their ids, so new names are added to a copy of base dictionary
+    dictionary = None
+    if analysis.details_format == constants.ANALYSIS_DETAILS_FORMAT_DICTIONARY:
+        names.copy_names(session, base_analysis.id, analysis.id)
+        dictionary = names.NameDictionary.load(session, analysis.id)
+
+    query = build_analysis_query(session, organization_id, scopes, *risk.PATH_COLUMNS)
+    query = join_catalogs(query) \
+        .outerjoin(OrganizationAnalysisDetail, build_unchanged_condition(base_analysis)) \
+        .filter(OrganizationAnalysisDetail.id.is_(None))
+    paths = risk.fetch_paths(query)
+    if len(paths):
+        details = risk.build_details(session, paths, dictionary=dictionary, formula=formula)
+        peak_rss.sample()
+        total_processed_items += bulk.insert_details(session, analysis.id, details,
+                                                     ANALYSIS['bulk_insert_batch_size'])
+        if dictionary is not None:
+            dictionary.save(session, analysis.id)
+
+    ranking.assign_ranks(session, analysis.id, ANALYSIS['bulk_insert_batch_size'])
+    return total_processed_items
+
+
+def copy_unchanged_details(session, analysis, organization_id, scopes, base_analysis):
+    detail_table = OrganizationAnalysisDetail.__table__
+    copied_columns = bulk.get_copied_columns()
+
+    query = build_analysis_query(session, organization_id, scopes,
+                                 literal(analysis.id).label('organization_analysis_id'), *copied_columns)
+    query = join_catalogs(query).join(OrganizationAnalysisDetail, build_unchanged_condition(base_analysis))
+
+    column_names = ['organization_analysis_id'] + [column.name for column in copied_columns]
+    result = session.execute(detail_table.insert().from_select(column_names, query.statement))
+    return result.rowcount
+
+
+def build_unchanged_condition(base_analysis):
+    """Builds the condition that matches a path (of a query joined by ``join_catalogs``) with the detail
+    of base analysis that has its instances, levels and names. Details are calculated only from them
+    (and from the formula, which is the same as in base), so a matched detail is what the path would get.
+    Rows are compared by their values, not by when they were modified, so no write is missed (bulk
+    updates and cascades don't touch modification times).
+    """
+    detail = OrganizationAnalysisDetail
+    conditions = [detail.organization_analysis_id == base_analysis.id]
+    conditions += [getattr(detail, column.key) == column.element for column in risk.PATH_COLUMNS
+                   if column.key in risk.INSTANCE_FIELDS or column.key in risk.LEVEL_FIELDS]
+
+    name_id_fields = dict(names.NAME_ID_FIELDS)
+    for name_field, _, model in risk.NAME_FIELDS:
+        if base_analysis.details_format == constants.ANALYSIS_DETAILS_FORMAT_DICTIONARY:
+            # Names of the dictionary are found by their ids (its primary key)
+            base_name = select([OrganizationAnalysisName.name]) \
+                .where(and_(OrganizationAnalysisName.organization_analysis_id == base_analysis.id,
+                            OrganizationAnalysisName.id == getattr(detail, name_id_fields[name_field]))) \
+                .as_scalar()
+        else:
+            base_name = getattr(detail, name_field)
+        conditions.append(base_name == model.name)
+    return and_(*conditions)
+
+
+def join_catalogs(query):
+    """Joins the catalog items referenced by a query built with ``build_analysis_query``."""
+    return query \
+        .join(BusinessDepartment, BusinessDepartment.id == OrganizationDepartment.department_id) \
+        .join(BusinessMacroprocess, BusinessMacroprocess.id == OrganizationMacroprocess.macroprocess_id) \
+        .join(BusinessProcess, BusinessProcess.id == OrganizationProcess.process_id) \
+        .join(ITService, ITService.id == OrganizationITService.it_service_id) \
+        .join(ITAsset, ITAsset.id == OrganizationITAsset.it_asset_id) \
+        .join(SecurityThreat, SecurityThreat.id == OrganizationSecurityThreat.security_threat_id)
+
+
+def supports_incremental_analysis(session, analysis):
+    """Checks if an analysis can be used as base for an incremental analysis.
+    Analyses created before details kept the instances of their paths cannot,
+    nor the archived ones (their details are no longer in the database).
+    """
+    if analysis.archived_on is not None:
+        return False
+
+    query = session \
+        .query(OrganizationAnalysisDetail.id) \
+        .filter(OrganizationAnalysisDetail.organization_analysis_id == analysis.id) \
+        .filter(OrganizationAnalysisDetail.it_service_instance_id.is_(None))
+    return query.first() is None
+
+
+def create_name_dictionary(analysis):
+    """Creates an empty dictionary of names when details of analysis are stored in 'dictionary' format."""
+    if analysis.details_format == constants.ANALYSIS_DETAILS_FORMAT_DICTIONARY:
+        return names.NameDictionary()
+    return None
+
+
+def save_details(session, analysis, details, dictionary=None):
+    """Persists the details of an analysis according to the configured persistence mode.
+
+    In 'bulk' mode the analysis is flushed to get its id and the details are inserted
+    in batches without being tracked by the session. Otherwise, the details are added
+    to the analysis as ORM objects and saved when the session is committed.
+
+    :param session: The database session.
+    :param analysis: The ``OrganizationAnalysis`` that owns the details.
+    :param details: A list of dicts with the fields of ``OrganizationAnalysisDetail``.
+    :param dictionary: (Optional) The ``NameDictionary`` used to encode names of details.
+    :return: The number of details.
+    """
+    if ANALYSIS['persistence'] != 'bulk':
+        for values in details:
+            analysis.details.append(OrganizationAnalysisDetail(**values))
+        total_saved = len(details)
+    else:
+        session.add(analysis)
+        session.flush()
+        total_saved = bulk.insert_details(session, analysis.id, details, ANALYSIS['bulk_insert_batch_size'])
+
+    if dictionary is not None:
+        session.add(analysis)
+        session.flush()
+        dictionary.save(session, analysis.id)
+    return total_saved
+
+
+def process_analysis_by_entities(session, analysis, organization_id, scopes=None, formula=None):
+    query = build_analysis_query(session, organization_id, scopes,
+                                 OrganizationITServiceITAsset,
+                                 OrganizationProcess,
+                                 OrganizationMacroprocess,
+                                 OrganizationDepartment,
+                                 OrganizationSecurityThreat,
+                                 OrganizationITAssetVulnerability)
     result = query.all()
 
     total_processed_items = 0
@@ -303,6 +641,11 @@ def process_analysis(session, analysis, organization_id, scopes=None):
         detail.department_name = item.OrganizationDepartment.department.name
         detail.security_threat_name = item.OrganizationSecurityThreat.security_threat.name
 
+        # Keep the instances that identify the path
+        detail.it_service_instance_id = item.OrganizationITServiceITAsset.it_service_instance_id
+        detail.it_asset_instance_id = item.OrganizationITServiceITAsset.it_asset_instance_id
+        detail.organization_security_threat_id = item.OrganizationSecurityThreat.id
+
         # Get the relevance, vulnerability and threat levels for calculations
         detail.it_asset_relevance = item.OrganizationITServiceITAsset.relevance_level_id
         detail.it_service_relevance = item.OrganizationITServiceITAsset.it_service_instance.relevance_level_id
@@ -310,48 +653,95 @@ def process_analysis(session, analysis, organization_id, scopes=None):
         detail.security_threat_level = item.OrganizationSecurityThreat.threat_level_id
         detail.it_asset_vulnerability_level = item.OrganizationITAssetVulnerability.vulnerability_level_id
 
-        # Calculate risk (R = Impact * Probability)
-        detail.calculated_impact = (detail.it_asset_relevance / 5) * (detail.it_service_relevance / 5) * (detail.process_relevance / 5)
-        detail.calculated_probability = (detail.it_asset_vulnerability_level / 5) * (detail.security_threat_level / 5)
-        detail.calculated_risk = detail.calculated_impact * detail.calculated_probability
+        # Calculate risk (R = Impact * Probability in built-in formula)
+        levels = {field: getattr(detail, field) for field in risk.LEVEL_FIELDS}
+        impact, probability, calculated_risk = risk.calculate_risk(levels, formula)
+        detail.calculated_impact = float(impact)
+        detail.calculated_probability = float(probability)
+        detail.calculated_risk = float(calculated_risk)
 
         analysis.details.append(detail)
         total_processed_items += 1
 
+    if total_processed_items:
+        session.add(analysis)
+        session.flush()
+        ranking.assign_ranks(session, analysis.id, ANALYSIS['bulk_insert_batch_size'])
     return total_processed_items
 
 
-def add_filters_for_scopes(query, scopes):
-    if not scopes:
-        return query
+def fetch_paths(session, organization_id, scopes, only_rated=True):
+    """Gets the paths of an organization as columns, expanded from the cached graph
+    of the organization when enabled or selected from database otherwise.
+
+    :param session: The database session.
+    :param organization_id: The code of the organization.
+    :param scopes: Scopes as returned by ``scoping.remove_redundant_scopes``.
+    :param only_rated: (Optional) See ``build_analysis_query``.
+    :return: A ``PathColumns`` object with (at least) the columns of ``risk.PATH_COLUMNS``.
+        When ``only_rated`` is false, all columns of ``simulation.SIMULATION_COLUMNS``.
+    """
+    if ANALYSIS['graph_cache']:
+        return graph.get_graph(session, organization_id).get_paths(scopes, only_rated)
+
+    columns = risk.PATH_COLUMNS if only_rated else simulation.SIMULATION_COLUMNS
+    query = build_analysis_query(session, organization_id, scopes, *columns, only_rated=only_rated)
+    return risk.fetch_paths(query, columns)
+
+
+def build_analysis_query(session, organization_id, scopes, *entities, only_rated=True):
+    """Builds the query of the paths of an organization within the scopes informed.
+
+    :param session: The database session.
+    :param organization_id: The code of the organization.
+    :param scopes: Scopes as returned by ``scoping.remove_redundant_scopes``.
+    :param entities: The entities (or columns) to be selected.
+    :param only_rated: (Optional) When false, paths with levels not rated (or rated 0)
+        are also selected. Default is true.
+    :return: A ``Query`` of paths.
+    """
+    query = session\
+        .query(*entities)\
+        .select_from(OrganizationITServiceITAsset)\
+        .join(OrganizationITAsset)\
+        .join(OrganizationITService)\
+        .join(OrganizationProcess)\
+        .join(OrganizationMacroprocess)\
+        .join(OrganizationDepartment)\
+        .join(Organization)\
+        .join(OrganizationSecurityThreat)\
+        .join(OrganizationITAssetVulnerability,
+              and_(OrganizationITAssetVulnerability.organization_security_threat_id == OrganizationSecurityThreat.id,
+                   OrganizationITAssetVulnerability.it_asset_instance_id == OrganizationITAsset.instance_id))
+
+    if only_rated:
+        query = query\
+            .filter(OrganizationITServiceITAsset.relevance_level_id > 0)\
+            .filter(OrganizationITService.relevance_level_id > 0)\
+            .filter(OrganizationProcess.relevance_level_id > 0)\
+            .filter(OrganizationSecurityThreat.threat_level_id > 0)\
+            .filter(OrganizationITAssetVulnerability.vulnerability_level_id > 0)
 
-    conditions = []
-    for scope in scopes:
-        if scope.get('process_id') is not None:
-            conditions.append(and_(
-                OrganizationDepartment.department_id == scope.get('department_id'),
-                OrganizationMacroprocess.macroprocess_id == scope.get('macroprocess_id'),
-                OrganizationProcess.process_id == scope.get('process_id'),
-            ))
-        elif scope.get('macroprocess_id') is not None:
-            conditions.append(and_(
-                OrganizationDepartment.department_id == scope.get('department_id'),
-                OrganizationMacroprocess.macroprocess_id == scope.get('macroprocess_id'),
-            ))
-        elif scope.get('department_id') is not None:
-            conditions.append(
-                OrganizationDepartment.department_id == scope.get('department_id')
-            )
+    query = query.filter(Organization.id == organization_id)
+    return add_filters_for_scopes(query, session, organization_id, scopes)
 
-    if conditions:
-        query = query.filter(or_(*conditions))
 
-    return query
+def add_filters_for_scopes(query, session, organization_id, scopes):
+    scopes_filter = scoping.build_scopes_filter(session, organization_id, scopes)
+    if scopes_filter is None:
+        return query
+    return query.filter(scopes_filter)
 
 
-def custom_asdict(dictable_model):
-    return dictable_model.asdict(exclude=['organization_id'])
+def custom_asdict(dictable_model, fieldset=None):
+    obj = fieldset_asdict(dictable_model, fieldset, exclude=['organization_id', 'scopes', 'fingerprint',
+                                                             'details_format', 'risk_formula'])
+    if fieldset is None or 'risk_formula' in fieldset:
+        obj['risk_formula'] = json.loads(dictable_model.risk_formula) if dictable_model.risk_formula else None
+    return obj
 
 
 def create_response_asdict(dictable_model):
-    return dictable_model.asdict(include=['total_processed_items'], exclude=['organization_id'])
+    exclude = ['organization_id', 'scopes', 'fingerprint', 'details_format', 'risk_formula', 'total_details',
+               'archived_on']
+    return dictable_model.asdict(include=['total_processed_items'], exclude=exclude)
@@ -1,10 +1,34 @@
+import math
+
 import falcon
+from sqlalchemy import inspect
 
-from knoweak.api.utils import get_collection_page
+from knoweak.analysis import archive
+from knoweak.analysis.names import NAME_ID_FIELDS, NameDictionary
+from knoweak.api import constants
+from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.utils import (
+    get_collection_page, get_paging_params, build_paging_info, stream_ndjson, stream_csv, gzip_stream
+)
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources.organization_analysis import find_organization_analysis
 from knoweak.db import Session
 from knoweak.db.models.organization import OrganizationAnalysis, OrganizationAnalysisDetail
 
+# Fields of details that are not part of responses
+EXCLUDED_FIELDS = ['organization_analysis_id', 'it_service_instance_id', 'it_asset_instance_id',
+                   'organization_security_threat_id', 'risk_rank']
+
+# Fields of details in responses (and columns of exported CSV), in order
+FIELDS = [attribute.key for attribute in inspect(OrganizationAnalysisDetail).column_attrs
+          if attribute.key not in EXCLUDED_FIELDS + [id_field for _, id_field in NAME_ID_FIELDS]]
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8'
+}
+
 
 class Collection:
     """GET the details of an analysis."""
@@ -20,7 +44,7 @@ class Collection:
         """
         session = Session()
         try:
-            organization_analysis = find_organization_analysis(organization_code, analysis_id, session)
+            organization_analysis = find_organization_analysis(analysis_id, organization_code, session)
             if organization_analysis is None:
                 raise falcon.HTTPNotFound()
 
@@ -34,7 +58,14 @@ class Collection:
                           OrganizationAnalysisDetail.calculated_impact.desc(),
                           OrganizationAnalysisDetail.calculated_probability.desc())
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            dictionary = load_name_dictionary(session, organization_analysis)
+            asdict_func = lambda detail: custom_asdict(detail, dictionary)  # noqa: E731
+
+            # Archived analyses always have their total of details (and are in the order of ranks)
+            if organization_analysis.total_details is None:
+                data, paging = get_collection_page(req, query, asdict_func, organization_code)
+            else:
+                data, paging = get_ranked_page(req, session, organization_analysis, asdict_func)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -43,13 +74,112 @@ class Collection:
             session.close()
 
 
-def find_organization_analysis(organization_code, analysis_id, session):
+class Export:
+    """GET all details of an analysis as a file."""
+
+    @falcon.before(check_scope, 'read:analyses')
+    def on_get(self, req, resp, organization_code, analysis_id):
+        """GETs all details of a specific analysis from an organization, in the order of risk,
+        as JSON lines ('format=ndjson', the default) or CSV ('format=csv').
+
+        Details are read with a server-side cursor (or from the archive of the analysis)
+        and sent while they are read. When the client accepts gzip encoding, the content is
+        compressed on the fly.
+
+        :param req: See Falcon Request documentation.
+        :param resp: See Falcon Response documentation.
+        :param organization_code: The code of the organization.
+        :param analysis_id: The id of the analysis for which the details should be exported.
+        """
+        session = Session()
+        streaming = False
+        try:
+            organization_analysis = find_organization_analysis(analysis_id, organization_code, session)
+            if organization_analysis is None:
+                raise falcon.HTTPNotFound()
+
+            export_format = req.get_param('format') or 'ndjson'
+            if export_format not in EXPORT_CONTENT_TYPES:
+                raise HTTPUnprocessableEntity([build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='format')])
+
+            query = session \
+                .query(OrganizationAnalysisDetail) \
+                .filter(OrganizationAnalysisDetail.organization_analysis_id == organization_analysis.id)
+            if organization_analysis.archived_on is not None:
+                query = archive.load(session, organization_analysis.id)
+            elif organization_analysis.total_details is None:
+                query = query.order_by(OrganizationAnalysisDetail.calculated_risk.desc(),
+                                       OrganizationAnalysisDetail.calculated_impact.desc(),
+                                       OrganizationAnalysisDetail.calculated_probability.desc())
+            else:
+                query = query.order_by(OrganizationAnalysisDetail.risk_rank)
+
+            dictionary = load_name_dictionary(session, organization_analysis)
+            asdict_func = lambda detail: custom_asdict(detail, dictionary)  # noqa: E731
+
+            if export_format == 'csv':
+                stream = stream_csv(session, query, FIELDS, asdict_func)
+            else:
+                stream = stream_ndjson(session, query, asdict_func)
+
+            resp.vary = ('Accept-Encoding',)
+            if 'gzip' in (req.get_header('Accept-Encoding') or ''):
+                resp.set_header('Content-Encoding', 'gzip')
+                stream = gzip_stream(stream)
+
+            resp.content_type = EXPORT_CONTENT_TYPES[export_format]
+            resp.downloadable_as = f'analysis-{organization_analysis.id}.{export_format}'
+            resp.stream = stream
+            streaming = True
+        finally:
+            # When streaming, the session is closed once the whole response is sent
+            if not streaming:
+                session.close()
+
+
+def get_ranked_page(req, session, organization_analysis, asdict_func):
+    """Gets a page of details reading the range of risk ranks of that page.
+    The total of records is the number of details stored in analysis, so no count is made.
+    Details of archived analyses are read from the (decompressed) archive instead.
+    Pages are already read seeking their ranks, so there's no cursor mode.
+    """
+    if req.get_param('cursor') is not None:
+        raise HTTPUnprocessableEntity([build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='cursor')])
+
+    page, records_per_page = get_paging_params(req)
+    total_records = organization_analysis.total_details
+    page = min(page, math.ceil(total_records / records_per_page) or 1)
+    first_rank = (page - 1) * records_per_page + 1
+
+    if organization_analysis.archived_on is not None:
+        records = archive.load(session, organization_analysis.id).get_details(first_rank - 1,
+                                                                              first_rank - 1 + records_per_page)
+        data = [asdict_func(record) for record in records]
+        return data, build_paging_info(page, records_per_page, total_records)
+
     query = session \
-        .query(OrganizationAnalysis) \
-        .filter(OrganizationAnalysis.organization_id == organization_code) \
-        .filter(OrganizationAnalysis.id == analysis_id)
-    return query.first()
+        .query(OrganizationAnalysisDetail) \
+        .filter(OrganizationAnalysisDetail.organization_analysis_id == organization_analysis.id) \
+        .filter(OrganizationAnalysisDetail.risk_rank.between(first_rank, first_rank + records_per_page - 1)) \
+        .order_by(OrganizationAnalysisDetail.risk_rank)
+
+    data = [asdict_func(record) for record in query]
+    return data, build_paging_info(page, records_per_page, total_records)
+
+
+def load_name_dictionary(session, organization_analysis):
+    if organization_analysis.details_format == constants.ANALYSIS_DETAILS_FORMAT_DICTIONARY:
+        return NameDictionary.load(session, organization_analysis.id)
+    return None
 
 
-def custom_asdict(dictable_model):
-    return dictable_model.asdict(exclude=['organization_analysis_id'])
+def custom_asdict(dictable_model, dictionary=None):
+    """Gets the detail as dict. When a ``NameDictionary`` is informed, the names are decoded
+    from the name ids kept by detail.
+    """
+    obj = dictable_model.asdict(exclude=EXCLUDED_FIELDS)
+    if dictionary is not None:
+        return dictionary.decode_details(obj)
+    for _, id_field in NAME_ID_FIELDS:
+        obj.pop(id_field, None)
+    return obj
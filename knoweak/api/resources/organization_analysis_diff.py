@@ -0,0 +1,107 @@
+import math
+
+import falcon
+
+from knoweak.analysis import diff
+from knoweak.analysis.names import NameDictionary
+from knoweak.api import constants
+from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources import organization_analysis, organization_analysis_details
+from knoweak.api.utils import build_paging_info, get_paging_params, stream_ndjson
+from knoweak.db import Session
+
+
+class Collection:
+    """GET the differences between two analyses."""
+
+    @falcon.before(check_scope, 'read:analyses')
+    def on_get(self, req, resp, organization_code, analysis_id, other_analysis_id):
+        """GETs a paged collection of the details that are new, removed or changed in an analysis
+        compared to another (base) analysis of the same organization.
+        Each item has the change and the detail in base ('before') and in the other analysis ('after').
+        Details are matched by the names of their paths (see ``diff``).
+
+        When 'stream' is true in query string, all items are sent as JSON lines (NDJSON) instead.
+
+        :param req: See Falcon Request documentation.
+        :param resp: See Falcon Response documentation.
+        :param organization_code: The code of the organization.
+        :param analysis_id: The id of the base analysis.
+        :param other_analysis_id: The id of the analysis compared to base.
+        """
+        session = Session()
+        streaming = False
+        try:
+            analysis = organization_analysis.find_organization_analysis(analysis_id, organization_code, session)
+            other_analysis = organization_analysis.find_organization_analysis(other_analysis_id, organization_code,
+                                                                              session)
+            if analysis is None or other_analysis is None:
+                raise falcon.HTTPNotFound()
+
+            analysis_diff = diff.get_diff(session, analysis, other_analysis)
+            dictionary = load_name_dictionary(session, analysis)
+            other_dictionary = load_name_dictionary(session, other_analysis)
+            asdict_func = lambda row: custom_asdict(row, dictionary, other_dictionary)  # noqa: E731
+
+            if req.get_param_as_bool('stream'):
+                resp.content_type = 'application/x-ndjson'
+                resp.stream = stream_ndjson(session, analysis_diff.iterate(session), asdict_func)
+                streaming = True
+                return
+
+            data, paging = get_diff_page(req, session, analysis_diff, asdict_func)
+            resp.media = {
+                'data': data,
+                'paging': paging
+            }
+        finally:
+            # When streaming, the session is closed once the whole response is sent
+            if not streaming:
+                session.close()
+
+
+def get_diff_page(req, session, analysis_diff, asdict_func):
+    """Gets a page of differences reading only the details of that page.
+    The total of records is the size of the diff, so no count is made. When 'cursor' is
+    informed (the 'nextCursor' of the previous page), the page after it is fetched and
+    'page' is ignored.
+    """
+    page, records_per_page = get_paging_params(req)
+    total_records = len(analysis_diff)
+    cursor = req.get_param('cursor')
+    if cursor is not None:
+        try:
+            start = analysis_diff.find_position_after(cursor)
+        except ValueError:
+            raise HTTPUnprocessableEntity([build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='cursor')])
+    else:
+        page = min(page, math.ceil(total_records / records_per_page) or 1)
+        start = (page - 1) * records_per_page
+
+    stop = min(start + records_per_page, total_records)
+    data = [asdict_func(row) for row in analysis_diff.get_rows(session, start, stop)]
+    next_cursor = analysis_diff.encode_cursor(stop - 1) if stop < total_records else None
+
+    if cursor is not None:
+        paging = {'records_per_page': records_per_page}
+    else:
+        paging = build_paging_info(page, records_per_page, total_records)
+    paging['next_cursor'] = next_cursor
+    return data, paging
+
+
+def load_name_dictionary(session, analysis):
+    if analysis.details_format == constants.ANALYSIS_DETAILS_FORMAT_DICTIONARY:
+        return NameDictionary.load(session, analysis.id)
+    return None
+
+
+def custom_asdict(row, dictionary=None, other_dictionary=None):
+    change, detail, other_detail = row
+    return {
+        'change': change,
+        'before': organization_analysis_details.custom_asdict(detail, dictionary) if detail else None,
+        'after': organization_analysis_details.custom_asdict(other_detail, other_dictionary) if other_detail else None
+    }
@@ -0,0 +1,48 @@
+import json
+
+import falcon
+
+from knoweak.analysis import jobs
+from knoweak.api.middlewares.auth import check_scope
+from knoweak.db import Session
+from knoweak.db.models.organization import OrganizationAnalysisJob
+
+
+class Item:
+    """GET the status of an analysis job."""
+
+    @falcon.before(check_scope, 'read:analyses')
+    def on_get(self, req, resp, organization_code, job_id):
+        """GETs a single analysis job of an organization.
+        The response contains the job status, its timings and, once succeeded, the id of the
+        resulting analysis. A job whose process stopped before finishing it is reported as failed.
+
+        :param req: See Falcon Request documentation.
+        :param resp: See Falcon Response documentation.
+        :param organization_code: The code of organization.
+        :param job_id: The id of the job to retrieve.
+        """
+        session = Session()
+        try:
+            item = find_organization_analysis_job(job_id, organization_code, session)
+            if item is None:
+                raise falcon.HTTPNotFound()
+
+            jobs.fail_if_lost(session, item)
+            resp.media = {'data': custom_asdict(item)}
+        finally:
+            session.close()
+
+
+def find_organization_analysis_job(job_id, organization_code, session):
+    query = session \
+        .query(OrganizationAnalysisJob) \
+        .filter(OrganizationAnalysisJob.organization_id == organization_code) \
+        .filter(OrganizationAnalysisJob.id == job_id)
+    return query.first()
+
+
+def custom_asdict(dictable_model):
+    obj = dictable_model.asdict(exclude=['organization_id', 'errors'])
+    obj['errors'] = json.loads(dictable_model.errors) if dictable_model.errors else None
+    return obj
@@ -0,0 +1,133 @@
+import falcon
+
+from knoweak.analysis import formulas, scoping, simulation
+from knoweak.api import constants
+from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import HTTPUnprocessableEntity, JSONHandler
+from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources import organization_analysis
+from knoweak.api.utils import validate_number
+from knoweak.db import Session
+from knoweak.db.models.organization import Organization
+from knoweak.db.models.system import RatingLevel
+
+# Kind of override (as in simulation), the fields of request that identify what is overridden and the level field
+OVERRIDE_FIELDS = [
+    ('processes', ['process_instance_id'], 'relevance_level_id'),
+    ('it_services', ['it_service_instance_id'], 'relevance_level_id'),
+    ('it_service_it_assets', ['it_service_instance_id', 'it_asset_instance_id'], 'relevance_level_id'),
+    ('security_threats', ['security_threat_id'], 'threat_level_id'),
+    ('vulnerabilities', ['it_asset_instance_id', 'security_threat_id'], 'vulnerability_level_id'),
+]
+
+
+class Simulation:
+    """POST a what-if simulation of the risk of an organization."""
+
+    @falcon.before(check_scope, 'read:analyses')
+    def on_post(self, req, resp, organization_code):
+        """Simulates an analysis of the organization with hypothetical levels for processes,
+        IT services, IT assets (in IT services), security threats and vulnerabilities.
+        Levels not overridden are the ones already filled. Nothing is persisted.
+
+        The response contains the total of details the analysis would have, the details with
+        the highest risks ('top' in request, default is DEFAULT_RECORDS_PER_PAGE) and the
+        rollups per level, as in the summary of an analysis.
+
+        :param req: See Falcon Request documentation.
+        :param resp: See Falcon Response documentation.
+        :param organization_code: The code of the organization.
+        """
+        session = Session()
+        try:
+            organization = session.query(Organization).get(organization_code)
+            if organization is None:
+                raise falcon.HTTPNotFound()
+
+            request_media = req.media or {}
+            errors = validate_post(request_media, session)
+            if errors:
+                raise HTTPUnprocessableEntity(errors)
+
+            scopes = scoping.remove_redundant_scopes(request_media.get('scopes'))
+            paths = organization_analysis.fetch_paths(session, organization_code, scopes, only_rated=False)
+            overrides = get_overrides(request_media.get('overrides'))
+            top = request_media.get('top') or constants.DEFAULT_RECORDS_PER_PAGE
+            formula = formulas.get_organization_formula(session, organization_code)
+
+            total_details, top_details, rollups = simulation.simulate(session, paths, overrides, top, formula)
+
+            resp.media = {
+                'data': {
+                    'total_details': total_details,
+                    'top_risks': top_details,
+                    'summary': rollups
+                }
+            }
+        finally:
+            session.close()
+
+
+def validate_post(request_media, session):
+    errors = []
+
+    # Validate scopes if informed
+    # -----------------------------------------------------
+    errors.extend(organization_analysis.validate_scopes(request_media.get('scopes')))
+
+    # Validate number of top risks if informed
+    # -----------------------------------------------------
+    errors.append(validate_number('top', request_media.get('top'), min_value=1,
+                                  max_value=constants.MAX_RECORDS_PER_PAGE))
+
+    # Validate overrides if informed
+    # -----------------------------------------------------
+    overrides = request_media.get('overrides') or {}
+    if not isinstance(overrides, dict):
+        errors.append(build_error(Message.ERR_INVALID_VALUE_TYPE, field_name='overrides'))
+        overrides = {}
+
+    rating_level_ids = {rating_level_id for (rating_level_id,) in session.query(RatingLevel.id)}
+    for kind, id_fields, level_field in OVERRIDE_FIELDS:
+        items = overrides.get(kind) or []
+        kind_name = f'overrides.{JSONHandler.camel_case(kind)}'
+        if not isinstance(items, list):
+            errors.append(build_error(Message.ERR_INVALID_VALUE_TYPE, field_name=kind_name))
+            continue
+
+        for i, item in enumerate(items):
+            item_i = f'{kind_name}[{i}]'
+            if not isinstance(item, dict):
+                errors.append(build_error(Message.ERR_INVALID_VALUE_TYPE, field_name=item_i))
+                continue
+
+            # Ids are combined into keys of 32 bits each (see ``simulation.combine_keys``)
+            for field in id_fields:
+                field_name = f'{item_i}.{JSONHandler.camel_case(field)}'
+                error = validate_number(field_name, item.get(field), is_mandatory=True, min_value=1,
+                                        max_value=simulation.MAX_ID)
+                if error:
+                    errors.append(error)
+                elif not isinstance(item.get(field), int) or isinstance(item.get(field), bool):
+                    errors.append(build_error(Message.ERR_INVALID_VALUE_TYPE, field_name=field_name))
+
+            # Level 0 means not rated, as in the other resources
+            level_name = f'{item_i}.{JSONHandler.camel_case(level_field)}'
+            error = validate_number(level_name, item.get(level_field), is_mandatory=True)
+            if error:
+                errors.append(error)
+            elif item.get(level_field) and item.get(level_field) not in rating_level_ids:
+                errors.append(build_error(Message.ERR_FIELD_VALUE_INVALID, field_name=level_name))
+
+    # Remove None's before returning
+    return [err for err in errors if err is not None]
+
+
+def get_overrides(request_overrides):
+    """Gets the overrides of request as expected by ``simulation.apply_overrides``."""
+    request_overrides = request_overrides or {}
+    return {
+        kind: [(tuple(item[field] for field in id_fields), item[level_field])
+               for item in request_overrides.get(kind) or []]
+        for kind, id_fields, level_field in OVERRIDE_FIELDS
+    }
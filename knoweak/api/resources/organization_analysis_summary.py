@@ -0,0 +1,50 @@
+import falcon
+
+from knoweak.analysis import rollups
+from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources.organization_analysis import find_organization_analysis
+from knoweak.db import Session
+from knoweak.db.models.organization import OrganizationAnalysisRollup
+
+
+class Item:
+    """GET the summary of an analysis."""
+
+    @falcon.before(check_scope, 'read:analyses')
+    def on_get(self, req, resp, organization_code, analysis_id):
+        """GETs the risk of an analysis rolled up per level (department, macroprocess, process,
+        IT service, IT asset and security threat). Items of each level are sorted by their max risk.
+
+        :param req: See Falcon Request documentation.
+        :param resp: See Falcon Response documentation.
+        :param organization_code: The code of the organization.
+        :param analysis_id: The id of the analysis for which the summary should be retrieved.
+        """
+        session = Session()
+        try:
+            analysis = find_organization_analysis(analysis_id, organization_code, session)
+            if analysis is None:
+                raise falcon.HTTPNotFound()
+
+            if rollups.has_rollups(session, analysis.id):
+                query = session \
+                    .query(OrganizationAnalysisRollup) \
+                    .filter(OrganizationAnalysisRollup.organization_analysis_id == analysis.id) \
+                    .order_by(OrganizationAnalysisRollup.max_risk.desc(),
+                              OrganizationAnalysisRollup.mean_risk.desc(),
+                              OrganizationAnalysisRollup.name)
+            else:
+                # Analyses created before rollups existed are summarized from their details
+                query = rollups.aggregate_rollups(session, analysis)
+
+            summary = {level: [] for level, _, _ in rollups.LEVELS}
+            for rollup in query:
+                summary[rollup.level].append(custom_asdict(rollup))
+
+            resp.media = {'data': summary}
+        finally:
+            session.close()
+
+
+def custom_asdict(dictable_model):
+    return dictable_model.asdict(exclude=['id', 'organization_analysis_id', 'level'])
@@ -1,14 +1,23 @@
 import falcon
 from sqlalchemy.orm import joinedload
 
+from knoweak.analysis import graph
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import Message, build_error
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
 from knoweak.api.utils import get_collection_page
 from knoweak.db import Session
 from knoweak.db.models.organization import Organization, OrganizationDepartment, BusinessDepartment
 
 
+# Indexed columns that departments can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'department_id': OrganizationDepartment.department_id
+}
+
+
 class Collection:
     """GET and POST departments of an organization."""
 
@@ -22,6 +31,8 @@ class Collection:
         """
         session = Session()
         try:
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationDepartment)
             organization = session.query(Organization).get(organization_code)
             if organization is None:
                 raise falcon.HTTPNotFound()
@@ -33,7 +44,8 @@ class Collection:
                 .order_by(OrganizationDepartment.created_on)\
                 .options(joinedload(OrganizationDepartment.department, innerjoin=True))
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, criteria=criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -63,6 +75,7 @@ class Collection:
             item.organization_id = organization_code
             item.department_id = req.media['id']
             session.add(item)
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_CREATED
@@ -86,11 +99,12 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, OrganizationDepartment)
             item = find_organization_department(department_id, organization_code, session)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': custom_asdict(item)}
+            resp.media = {'data': custom_asdict(item, fieldset)}
         finally:
             session.close()
 
@@ -110,6 +124,7 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(item)
+            graph.invalidate(session, organization_code)
             session.commit()
         finally:
             session.close()
@@ -143,6 +158,6 @@ def find_organization_department(department_id, organization_code, session):
     return query.first()
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     follow = {'department': {'only': ['id', 'name']}}
-    return dictable_model.asdict(follow=follow, exclude=['department_id'])
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=['department_id'])
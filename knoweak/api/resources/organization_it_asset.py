@@ -1,14 +1,42 @@
 import falcon
 from sqlalchemy import func
 
+from knoweak.analysis import graph
 from knoweak.api import constants as constants
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import Message, build_error
+from knoweak.api.expansions import Expand, Expansion
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources import organization_it_asset_control, organization_it_asset_vulnerability
 from knoweak.api.utils import get_collection_page, patch_item, validate_str
 from knoweak.db import Session
-from knoweak.db.models.catalog import ITAsset
-from knoweak.db.models.organization import Organization, OrganizationITAsset
+from knoweak.db.models.catalog import ITAsset, MitigationControl, SecurityThreat
+from knoweak.db.models.organization import (
+    Organization, OrganizationITAsset, OrganizationITAssetVulnerability, OrganizationItAssetControl, OrganizationSecurityThreat
+)
+
+
+# Children that can be embedded in IT assets (see expansions)
+EXPANSIONS = {
+    'vulnerabilities': Expansion(
+        OrganizationITAssetVulnerability.it_asset_instance_id, 'instance_id',
+        organization_it_asset_vulnerability.custom_asdict,
+        joins=[OrganizationSecurityThreat, SecurityThreat], order_by=[SecurityThreat.name]
+    ),
+    'controls': Expansion(
+        OrganizationItAssetControl.organization_it_asset_id, 'instance_id',
+        organization_it_asset_control.custom_asdict,
+        joins=[MitigationControl], order_by=[MitigationControl.name]
+    )
+}
+
+# Indexed columns that IT assets can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'it_asset_id': OrganizationITAsset.it_asset_id,
+    'created_on': OrganizationITAsset.created_on
+}
 
 
 class Collection:
@@ -24,6 +52,9 @@ class Collection:
         """
         session = Session()
         try:
+            expand = Expand.from_request(req, EXPANSIONS)
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationITAsset)
             organization = session.query(Organization).get(organization_code)
             if organization is None:
                 raise falcon.HTTPNotFound()
@@ -35,7 +66,8 @@ class Collection:
                 .filter(OrganizationITAsset.organization_id == organization_code)\
                 .order_by(ITAsset.name, OrganizationITAsset.external_identifier, OrganizationITAsset.created_on)
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, expand, criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -65,6 +97,7 @@ class Collection:
             item = OrganizationITAsset().fromdict(req.media, only=accepted_fields)
             item.organization_id = organization_code
             session.add(item)
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_CREATED
@@ -88,11 +121,16 @@ class Item:
         """
         session = Session()
         try:
+            expand = Expand.from_request(req, EXPANSIONS)
+            fieldset = Fieldset.from_request(req, OrganizationITAsset)
             item = find_it_asset_instance(it_asset_instance_id, organization_code, session)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': custom_asdict(item)}
+            data = custom_asdict(item, fieldset)
+            if expand is not None:
+                expand.embed(session, [item], [data])
+            resp.media = {'data': data}
         finally:
             session.close()
 
@@ -117,6 +155,7 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(it_asset_instance, req.media, only=['external_identifier'])
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_OK
@@ -140,6 +179,7 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(item)
+            graph.invalidate(session, organization_code)
             session.commit()
         finally:
             session.close()
@@ -220,9 +260,9 @@ def exists_other_it_asset(session, organization_code, it_asset_instance, externa
     return query.scalar()
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     exclude = ['organization_id', 'it_asset_id']
     follow = {
         'it_asset': {'only': ['id', 'name']}
     }
-    return dictable_model.asdict(follow=follow, exclude=exclude)
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=exclude)
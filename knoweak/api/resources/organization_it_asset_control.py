@@ -1,15 +1,24 @@
 import falcon
 
 from knoweak.api import constants as constants
+from knoweak.api import paging
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import build_error, Message
 from knoweak.api.middlewares.auth import check_scope
 from knoweak.api.utils import validate_str, get_collection_page
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.db import Session
 from knoweak.db.models.catalog import MitigationControl
 from knoweak.db.models.organization import OrganizationItAssetControl, OrganizationITAsset
 
 
+# Indexed columns that controls can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'mitigation_control_id': OrganizationItAssetControl.mitigation_control_id
+}
+
+
 class Collection:
     """GET and POST mitigation controls for organization IT assets."""
 
@@ -24,6 +33,8 @@ class Collection:
         """
         session = Session()
         try:
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationItAssetControl)
             organization_it_asset = find_organization_it_asset(it_asset_instance_id, organization_code, session)
             if organization_it_asset is None:
                 raise falcon.HTTPNotFound()
@@ -37,7 +48,8 @@ class Collection:
                 .filter(OrganizationITAsset.instance_id == it_asset_instance_id) \
                 .order_by(MitigationControl.name)
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, criteria=criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -69,6 +81,7 @@ class Collection:
             item = OrganizationItAssetControl().fromdict(req.media, only=accepted_fields)
             item.organization_it_asset_id = it_asset_instance_id
             session.add(item)
+            paging.invalidate_totals(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_CREATED
@@ -98,6 +111,7 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(item)
+            paging.invalidate_totals(session, organization_code)
             session.commit()
         finally:
             session.close()
@@ -157,7 +171,7 @@ def find_organization_it_asset(it_asset_instance_id, organization_code, session)
     return query.first()
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     exclude = [
         'organization_it_asset_id',
         'mitigation_control_id'
@@ -165,4 +179,4 @@ def custom_asdict(dictable_model):
     follow = {
         'mitigation_control': {'only': ['id', 'name']}
     }
-    return dictable_model.asdict(follow=follow, exclude=exclude)
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=exclude)
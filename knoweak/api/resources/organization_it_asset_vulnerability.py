@@ -1,7 +1,10 @@
 import falcon
 
+from knoweak.analysis import graph
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import Message, build_error
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
 from knoweak.api.utils import get_collection_page, patch_item
 from knoweak.db import Session
@@ -11,6 +14,13 @@ from knoweak.db.models.organization import (
 )
 
 
+# Indexed columns that vulnerabilities can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'organization_security_threat_id': OrganizationITAssetVulnerability.organization_security_threat_id,
+    'vulnerability_level_id': OrganizationITAssetVulnerability.vulnerability_level_id
+}
+
+
 class Collection:
     """GET and POST IT assets vulnerabilities in an organization."""
 
@@ -25,6 +35,8 @@ class Collection:
         """
         session = Session()
         try:
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationITAssetVulnerability)
             it_asset_instance = find_it_asset_instance(it_asset_instance_id, organization_code, session)
             if it_asset_instance is None:
                 raise falcon.HTTPNotFound()
@@ -39,7 +51,8 @@ class Collection:
                 .filter(OrganizationITAsset.instance_id == it_asset_instance_id) \
                 .order_by(SecurityThreat.name)
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, criteria=criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -82,6 +95,7 @@ class Collection:
             item.it_asset_instance_id = it_asset_instance_id
             item.vulnerability_level_id = req.media['vulnerability_level_id']
             session.add(item)
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_CREATED
@@ -106,6 +120,7 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, OrganizationITAssetVulnerability)
             item = find_it_asset_instance_security_threat(
                 security_threat_id,
                 it_asset_instance_id,
@@ -115,7 +130,7 @@ class Item:
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': custom_asdict(item)}
+            resp.media = {'data': custom_asdict(item, fieldset)}
         finally:
             session.close()
 
@@ -147,6 +162,7 @@ class Item:
 
             accepted_fields = ['vulnerability_level_id']
             patch_item(vulnerability, req.media, only=accepted_fields)
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_OK
@@ -176,6 +192,7 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(item)
+            graph.invalidate(session, organization_code)
             session.commit()
         finally:
             session.close()
@@ -254,9 +271,9 @@ def find_organization_security_threat(security_threat_id, organization_id, sessi
     return query.first()
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     exclude = ['organization_security_threat_id']
     follow = {
         'security_threat': {'only': ['id', 'name']}
     }
-    return dictable_model.asdict(follow=follow, exclude=exclude)
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=exclude)
@@ -1,14 +1,38 @@
 import falcon
 
+from knoweak.analysis import graph
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import build_error, Message
+from knoweak.api.expansions import Expand, Expansion
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources import organization_it_asset_vulnerability
 from knoweak.api.utils import get_collection_page, patch_item
 from knoweak.db import Session
-from knoweak.db.models.organization import OrganizationITServiceITAsset, OrganizationITService, OrganizationITAsset
+from knoweak.db.models.catalog import SecurityThreat
+from knoweak.db.models.organization import (
+    OrganizationITServiceITAsset, OrganizationITService, OrganizationITAsset, OrganizationITAssetVulnerability, OrganizationSecurityThreat
+)
 from knoweak.db.models.system import RatingLevel
 
 
+# Children that can be embedded in IT assets of an IT service (see expansions)
+EXPANSIONS = {
+    'vulnerabilities': Expansion(
+        OrganizationITAssetVulnerability.it_asset_instance_id, 'it_asset_instance_id',
+        organization_it_asset_vulnerability.custom_asdict,
+        joins=[OrganizationSecurityThreat, SecurityThreat], order_by=[SecurityThreat.name]
+    )
+}
+
+# Indexed columns that IT assets of IT services can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'it_asset_instance_id': OrganizationITServiceITAsset.it_asset_instance_id,
+    'relevance_level_id': OrganizationITServiceITAsset.relevance_level_id
+}
+
+
 class Collection:
     """GET and POST instances of IT assets from/into an organization's IT service."""
 
@@ -23,6 +47,9 @@ class Collection:
         """
         session = Session()
         try:
+            expand = Expand.from_request(req, EXPANSIONS)
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationITServiceITAsset)
             it_service_instance = find_it_service_instance(it_service_instance_id, organization_code, session)
             if it_service_instance is None:
                 raise falcon.HTTPNotFound()
@@ -35,7 +62,8 @@ class Collection:
                 .filter(OrganizationITService.instance_id == it_service_instance_id) \
                 .order_by(OrganizationITServiceITAsset.created_on)
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, expand, criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -66,6 +94,7 @@ class Collection:
             item = OrganizationITServiceITAsset().fromdict(req.media, only=accepted_fields)
             item.it_service_instance = it_service_instance
             session.add(item)
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_CREATED
@@ -104,6 +133,7 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(it_service_asset, req.media, only=['relevance_level_id'])
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_OK
@@ -133,6 +163,7 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(it_service_asset)
+            graph.invalidate(session, organization_code)
             session.commit()
         finally:
             session.close()
@@ -202,11 +233,11 @@ def find_it_service_it_asset(it_asset_instance_id, it_service_instance_id, sessi
         .get((it_service_instance_id, it_asset_instance_id))
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     exclude = None
     follow = {
         'it_asset_instance': {'only': ['external_identifier'], 'follow': {
             'it_asset': {'only': ['id', 'name']}
         }}
     }
-    return dictable_model.asdict(follow=follow, exclude=exclude)
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=exclude)
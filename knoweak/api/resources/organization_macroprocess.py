@@ -1,12 +1,36 @@
 import falcon
 
+from knoweak.analysis import graph
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import Message, build_error
+from knoweak.api.expansions import Expand, Expansion
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources import organization_process
 from knoweak.api.utils import get_collection_page
 from knoweak.db import Session
 from knoweak.db.models.catalog import BusinessMacroprocess
-from knoweak.db.models.organization import Organization, OrganizationMacroprocess, OrganizationDepartment
+from knoweak.db.models.organization import (
+    Organization, OrganizationMacroprocess, OrganizationDepartment, OrganizationProcess
+)
+
+
+# Children that can be embedded in macroprocesses (see expansions)
+EXPANSIONS = {
+    'processes': Expansion(
+        OrganizationProcess.macroprocess_instance_id, 'instance_id',
+        organization_process.custom_asdict,
+        order_by=[OrganizationProcess.created_on], expansions=organization_process.EXPANSIONS
+    )
+}
+
+# Indexed columns that macroprocesses can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'department_id': OrganizationMacroprocess.department_id,
+    'macroprocess_id': OrganizationMacroprocess.macroprocess_id,
+    'created_on': OrganizationMacroprocess.created_on
+}
 
 
 class Collection:
@@ -22,6 +46,9 @@ class Collection:
         """
         session = Session()
         try:
+            expand = Expand.from_request(req, EXPANSIONS)
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationMacroprocess)
             organization = session.query(Organization).get(organization_code)
             if organization is None:
                 raise falcon.HTTPNotFound()
@@ -37,7 +64,8 @@ class Collection:
             if department_id:
                 query = query.filter(OrganizationMacroprocess.department_id == department_id)
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, expand, criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -68,6 +96,7 @@ class Collection:
             item.department_id = req.media['department_id']
             item.macroprocess_id = req.media['macroprocess_id']
             session.add(item)
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_CREATED
@@ -91,6 +120,8 @@ class Item:
         """
         session = Session()
         try:
+            expand = Expand.from_request(req, EXPANSIONS)
+            fieldset = Fieldset.from_request(req, OrganizationMacroprocess)
             item = session\
                 .query(OrganizationMacroprocess)\
                 .filter(OrganizationMacroprocess.instance_id == macroprocess_instance_id) \
@@ -99,7 +130,10 @@ class Item:
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': custom_asdict(item)}
+            data = custom_asdict(item, fieldset)
+            if expand is not None:
+                expand.embed(session, [item], [data])
+            resp.media = {'data': data}
         finally:
             session.close()
 
@@ -123,6 +157,7 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(item)
+            graph.invalidate(session, organization_code)
             session.commit()
         finally:
             session.close()
@@ -171,10 +206,10 @@ def find_organization_macroprocess(macroprocess_id, department_id, organization_
     return query.first()
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     exclude = ['organization_id', 'department_id', 'macroprocess_id']
     follow = {
         'department': {'only': ['id', 'name']},
         'macroprocess': {'only': ['id', 'name']}
     }
-    return dictable_model.asdict(follow=follow, exclude=exclude)
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=exclude)
@@ -1,15 +1,40 @@
 import falcon
 
+from knoweak.analysis import graph
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import Message, build_error
+from knoweak.api.expansions import Expand, Expansion
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api.resources import organization_it_service
 from knoweak.api.utils import get_collection_page, patch_item
 from knoweak.db import Session
 from knoweak.db.models.catalog import BusinessProcess
-from knoweak.db.models.organization import Organization, OrganizationProcess, OrganizationMacroprocess
+from knoweak.db.models.organization import (
+    Organization, OrganizationProcess, OrganizationMacroprocess, OrganizationITService
+)
 from knoweak.db.models.system import RatingLevel
 
 
+# Children that can be embedded in processes (see expansions)
+EXPANSIONS = {
+    'it_services': Expansion(
+        OrganizationITService.process_instance_id, 'instance_id',
+        organization_it_service.custom_asdict,
+        order_by=[OrganizationITService.created_on], expansions=organization_it_service.EXPANSIONS
+    )
+}
+
+# Indexed columns that processes can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'macroprocess_instance_id': OrganizationProcess.macroprocess_instance_id,
+    'process_id': OrganizationProcess.process_id,
+    'relevance_level_id': OrganizationProcess.relevance_level_id,
+    'created_on': OrganizationProcess.created_on
+}
+
+
 class Collection:
     """GET and POST processes of an organization."""
 
@@ -23,6 +48,9 @@ class Collection:
         """
         session = Session()
         try:
+            expand = Expand.from_request(req, EXPANSIONS)
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationProcess)
             organization = session.query(Organization).get(organization_code)
             if organization is None:
                 raise falcon.HTTPNotFound()
@@ -38,7 +66,8 @@ class Collection:
             if macroprocess_instance_id:
                 query = query.filter(OrganizationProcess.macroprocess_instance_id == macroprocess_instance_id)
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, expand, criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -68,6 +97,7 @@ class Collection:
             item = OrganizationProcess().fromdict(req.media, only=accepted_fields)
             item.organization_id = organization_code
             session.add(item)
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_CREATED
@@ -91,11 +121,16 @@ class Item:
         """
         session = Session()
         try:
+            expand = Expand.from_request(req, EXPANSIONS)
+            fieldset = Fieldset.from_request(req, OrganizationProcess)
             item = find_process_instance(process_instance_id, organization_code, session)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': custom_asdict(item)}
+            data = custom_asdict(item, fieldset)
+            if expand is not None:
+                expand.embed(session, [item], [data])
+            resp.media = {'data': data}
         finally:
             session.close()
 
@@ -120,6 +155,7 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(process_instance, req.media, only=['relevance_level_id'])
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_OK
@@ -143,6 +179,7 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(item)
+            graph.invalidate(session, organization_code)
             session.commit()
         finally:
             session.close()
@@ -224,9 +261,9 @@ def find_process_instance(process_instance_id, organization_id, session):
     return query.first()
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     exclude = ['organization_id', 'process_id']
     follow = {
         'process': {'only': ['id', 'name']}
     }
-    return dictable_model.asdict(follow=follow, exclude=exclude)
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=exclude)
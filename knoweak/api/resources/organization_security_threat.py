@@ -1,7 +1,10 @@
 import falcon
 
+from knoweak.analysis import graph
+from knoweak.api.criteria import Criteria
 from knoweak.api.errors import Message, build_error
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
 from knoweak.api.utils import get_collection_page, patch_item
 from knoweak.db import Session
@@ -10,6 +13,13 @@ from knoweak.db.models.organization import Organization, OrganizationSecurityThr
 from knoweak.db.models.system import RatingLevel
 
 
+# Indexed columns that security threats can be filtered and sorted by (see criteria)
+FILTER_COLUMNS = {
+    'security_threat_id': OrganizationSecurityThreat.security_threat_id,
+    'threat_level_id': OrganizationSecurityThreat.threat_level_id
+}
+
+
 class Collection:
     """GET and POST security threats of an organization."""
 
@@ -23,6 +33,8 @@ class Collection:
         """
         session = Session()
         try:
+            criteria = Criteria.from_request(req, FILTER_COLUMNS)
+            fieldset = Fieldset.from_request(req, OrganizationSecurityThreat)
             organization = session.query(Organization).get(organization_code)
             if organization is None:
                 raise falcon.HTTPNotFound()
@@ -34,7 +46,8 @@ class Collection:
                 .filter(OrganizationSecurityThreat.organization_id == organization_code)\
                 .order_by(SecurityThreat.name)\
 
-            data, paging = get_collection_page(req, query, custom_asdict)
+            data, paging = get_collection_page(req, query, lambda item: custom_asdict(item, fieldset),
+                                               organization_code, fieldset, criteria=criteria)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -65,6 +78,7 @@ class Collection:
             item.security_threat_id = req.media.get('security_threat_id')
             item.threat_level_id = req.media.get('threat_level_id')
             session.add(item)
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_CREATED
@@ -87,11 +101,12 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, OrganizationSecurityThreat)
             item = find_organization_security_threat(security_threat_id, organization_code, session)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': custom_asdict(item)}
+            resp.media = {'data': custom_asdict(item, fieldset)}
         finally:
             session.close()
 
@@ -116,6 +131,7 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(security_threat, req.media, only=['threat_level_id'])
+            graph.invalidate(session, organization_code)
             session.commit()
 
             resp.status = falcon.HTTP_OK
@@ -139,6 +155,7 @@ class Item:
                 raise falcon.HTTPNotFound()
 
             session.delete(item)
+            graph.invalidate(session, organization_code)
             session.commit()
         finally:
             session.close()
@@ -194,7 +211,7 @@ def find_organization_security_threat(security_threat_id, organization_code, ses
     return query.first()
 
 
-def custom_asdict(dictable_model):
+def custom_asdict(dictable_model, fieldset=None):
     exclude = ['organization_id', 'security_threat_id']
     follow = {'security_threat': {'only': ['id', 'name']}}
-    return dictable_model.asdict(follow=follow, exclude=exclude)
+    return fieldset_asdict(dictable_model, fieldset, follow=follow, exclude=exclude)
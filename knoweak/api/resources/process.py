@@ -3,7 +3,9 @@ import falcon
 from knoweak.api import constants as constants
 from knoweak.api.errors import Message, build_error
 from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.api.fieldsets import Fieldset, fieldset_asdict
 from knoweak.api.middlewares.auth import check_scope
+from knoweak.api import search
 from knoweak.api.utils import get_collection_page, validate_str, patch_item
 from knoweak.db import Session
 from knoweak.db.models.catalog import BusinessProcess
@@ -21,9 +23,11 @@ class Collection:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, BusinessProcess)
             query = session.query(BusinessProcess).order_by(BusinessProcess.name)
+            query = search.filter_by_name(req, query, BusinessProcess)
 
-            data, paging = get_collection_page(req, query)
+            data, paging = get_collection_page(req, query, fieldset=fieldset)
             resp.media = {
                 'data': data,
                 'paging': paging
@@ -48,6 +52,7 @@ class Collection:
             item = BusinessProcess().fromdict(req.media, only=['name'])
 
             session.add(item)
+            search.invalidate(session, BusinessProcess)
             session.commit()
             resp.status = falcon.HTTP_CREATED
             resp.location = req.relative_uri + f'/{item.id}'
@@ -69,11 +74,12 @@ class Item:
         """
         session = Session()
         try:
+            fieldset = Fieldset.from_request(req, BusinessProcess)
             item = session.query(BusinessProcess).get(process_id)
             if item is None:
                 raise falcon.HTTPNotFound()
 
-            resp.media = {'data': item.asdict()}
+            resp.media = {'data': fieldset_asdict(item, fieldset)}
         finally:
             session.close()
 
@@ -97,6 +103,8 @@ class Item:
                 raise HTTPUnprocessableEntity(errors)
 
             patch_item(process, req.media, only=['name'])
+            if 'name' in req.media:
+                search.invalidate(session, BusinessProcess)
             session.commit()
 
             resp.status = falcon.HTTP_OK
@@ -0,0 +1,137 @@
+"""
+Search of catalog items by name.
+
+Catalog collections accept the text to search in the 'q' query string parameter.
+By default items whose names contain the text are found ('match=substring');
+with 'match=prefix' only those whose names start with it. Names and text are
+compared in lower case and without accents ('seguranca' finds 'Segurança').
+
+Names of each catalog are kept in an index of this process, built from its table
+on first use: a sorted array of every suffix of every name (so a substring is the
+prefix of some suffix) and a sorted array of names. A search is then two binary
+searches, whatever the size of the catalog, and the matching items are selected
+by id. The index is valid while the version of the catalog is the same. The
+version is increased by writes in the catalog (see ``invalidate``) and read from
+the database (a single row by primary key), so writes made by any process
+refresh it.
+"""
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from sqlalchemy import false
+
+from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import HTTPUnprocessableEntity
+from knoweak.db.models.catalog import CatalogVersion
+
+MATCH_PREFIX = 'prefix'
+MATCH_SUBSTRING = 'substring'
+
+# Greater than any character, so (text + END) is after every string that starts with text
+END = chr(0x10ffff)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class NameIndex:
+    """Names of the items of a catalog (see module docs)."""
+
+    def __init__(self, names_by_id, version):
+        self.version = version
+        names = sorted((normalize(name), item_id) for item_id, name in names_by_id.items())
+        self.names = [name for name, _ in names]
+        self.name_ids = [item_id for _, item_id in names]
+        suffixes = sorted((name[start:], item_id) for name, item_id in names for start in range(len(name)))
+        self.suffixes = [suffix for suffix, _ in suffixes]
+        self.suffix_ids = [item_id for _, item_id in suffixes]
+
+    def search(self, text, match=MATCH_SUBSTRING):
+        """Gets the ids of the items whose names match a text.
+
+        :param text: The text to search.
+        :param match: (Optional) MATCH_SUBSTRING or MATCH_PREFIX.
+        :return: A set of ids.
+        """
+        text = normalize(text)
+        keys, ids = (self.names, self.name_ids) if match == MATCH_PREFIX else (self.suffixes, self.suffix_ids)
+        start = bisect_left(keys, text)
+        end = bisect_left(keys, text + END, start)
+        return set(ids[start:end])
+
+
+def normalize(text):
+    """Gets a text in lower case, without accents and with single spaces."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+def get_version(session, model):
+    version = session \
+        .query(CatalogVersion.version) \
+        .filter(CatalogVersion.catalog == model.__tablename__) \
+        .scalar()
+    return version or 0
+
+
+def invalidate(session, model):
+    """Marks the index of names of a catalog as outdated. Must be called by write operations
+    in the catalog before they commit, so the new version is committed with the changes.
+
+    :param session: The database session.
+    :param model: The model of the catalog.
+    """
+    total = session \
+        .query(CatalogVersion) \
+        .filter(CatalogVersion.catalog == model.__tablename__) \
+        .update({CatalogVersion.version: CatalogVersion.version + 1}, synchronize_session=False)
+    if not total:
+        session.add(CatalogVersion(catalog=model.__tablename__, version=1))
+    with _indexes_lock:
+        _indexes.pop(model, None)
+
+
+def get_index(session, model):
+    """Gets the index of names of a catalog, built again when the catalog changed.
+
+    :param session: The database session.
+    :param model: The model of the catalog (with 'id' and 'name').
+    :return: A ``NameIndex``.
+    """
+    version = get_version(session, model)
+    with _indexes_lock:
+        index = _indexes.get(model)
+    if index is not None and index.version == version:
+        return index
+
+    names_by_id = dict(session.query(model.id, model.name))
+    index = NameIndex(names_by_id, version)
+    with _indexes_lock:
+        _indexes[model] = index
+    return index
+
+
+def filter_by_name(req, query, model):
+    """Filters a query of a catalog by the names that match the 'q' parameter, if informed.
+
+    :param req: The request object. See Falcon Request documentation.
+    :param query: Session query from SQL Alchemy of the model.
+    :param model: The model of the catalog.
+    :return: The query filtered.
+    :raises HTTPUnprocessableEntity: When 'match' is not valid.
+    """
+    # Texts with commas are split by Falcon as lists
+    texts = req.get_param_as_list('q')
+    if texts is None:
+        return query
+
+    match = req.get_param('match') or MATCH_SUBSTRING
+    if match not in (MATCH_PREFIX, MATCH_SUBSTRING):
+        raise HTTPUnprocessableEntity([build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='match')])
+
+    item_ids = get_index(query.session, model).search(','.join(texts), match)
+    if not item_ids:
+        return query.filter(false())
+    return query.filter(model.id.in_(sorted(item_ids)))
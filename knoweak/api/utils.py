@@ -1,15 +1,26 @@
 """
 Utility and helper methods to be used in controllers.
 """
+import csv
+import io
 import math
 import numbers
+import zlib
 from datetime import datetime
+from itertools import islice
 from dictalchemy import asdict
+from sqlalchemy.orm import Query
 from knoweak.api import constants
 from knoweak.api.errors import build_error, Message
+from knoweak.api.extensions import JSONHandler, HTTPUnprocessableEntity
+from knoweak.api.fieldsets import fieldset_asdict
+from knoweak.api.paging import (
+    Keyset, fetch_page, count_records, supports_window_count, get_totals_key, get_cached_total, cache_total
+)
 
 
-def get_collection_page(req, query, asdict_func=None):
+def get_collection_page(req, query, asdict_func=None, organization_id=None, fieldset=None, expand=None,
+                        criteria=None):
     """
     Common implementation used by controllers to fetch collection of an entity.
     The result is paged. Paging params can be informed in URL query string.
@@ -18,14 +29,191 @@ def get_collection_page(req, query, asdict_func=None):
             Default is DEFAULT_RECORDS_PER_PAGE.
         'page': desired page number.
             Default is 1.
+        'cursor': The 'nextCursor' of the previous page. When informed, the page
+            after that cursor is fetched seeking its position (see ``paging.Keyset``)
+            and 'page' is ignored. The total of records is not counted in this mode.
+        'includeTotal': When false, records are not counted. The total is then the
+            cached one, if any, or an estimate (at least the records up to this page).
+            Default is true.
 
     :param req: The request object. See Falcon Request documentation.
         Query string arguments are extracted from this object.
     :param query: Session query from SQL Alchemy to fetch records.
     :param asdict_func: (Optional) Custom function to make a dict from a model.
         When informed, overrides the default behavior.
+    :param organization_id: (Optional) The organization of the collection. When informed,
+        the total of records is cached until the next write in the organization.
+    :param fieldset: (Optional) The ``fieldsets.Fieldset`` requested. When informed, only its
+        fields are fetched (asdict_func must include only them too).
+    :param expand: (Optional) The ``expansions.Expand`` requested. When informed, its children
+        are embedded in the dict of each record.
+    :param criteria: (Optional) The ``criteria.Criteria`` requested. When informed, records
+        are filtered and sorted by it.
     :return: A dict with 'data' and 'paging' keys.
     """
+    page, records_per_page = get_paging_params(req)
+    cursor = req.get_param('cursor')
+    if criteria is not None:
+        query = criteria.apply(query)
+    keyset = Keyset.from_query(query)
+    if cursor is not None and keyset is None:
+        raise HTTPUnprocessableEntity([build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='cursor')])
+
+    # Go fetch data (the shape of query that totals are cached for doesn't depend on fields)
+    totals_query = query
+    if fieldset is not None:
+        query = fieldset.apply(query)
+
+    if cursor is not None:
+        try:
+            records, _, next_cursor, _, _ = fetch_page(query, records_per_page, keyset=keyset, cursor=cursor)
+        except ValueError:
+            raise HTTPUnprocessableEntity([build_error(Message.ERR_FIELD_VALUE_INVALID, field_name='cursor')])
+        paging = {
+            'records_per_page': records_per_page,
+            'next_cursor': next_cursor
+        }
+    else:
+        include_total = req.get_param_as_bool('includeTotal') is not False
+        totals_key = get_totals_key(totals_query, organization_id)
+        cached_version, cached_total = get_cached_total(totals_key) or (None, None)
+
+        # Records counted along with the page cost no other statement, else a cached total is
+        # used as long as the versions read with the page show it's still valid
+        count_total = include_total and (cached_total is None or supports_window_count(query.session))
+        records, current_page, total_records, has_next_page, next_cursor, version = query_page(
+            query, page, records_per_page, None if count_total else cached_total, keyset, count_total,
+            organization_id)
+
+        total_type = constants.PAGING_TOTAL_COUNTED
+        if not count_total:
+            if cached_total is not None and version == cached_version:
+                total_type = constants.PAGING_TOTAL_CACHED
+            else:
+                total_records = None
+                if current_page != page:
+                    # The page was limited by an outdated total, so it's fetched as requested
+                    records, current_page, _, has_next_page, next_cursor, _ = query_page(
+                        query, page, records_per_page, None, keyset)
+                if include_total or (not records and current_page > 1):
+                    # Records are counted as the cached total is outdated (or, past the last
+                    # page, to return the last page instead)
+                    count_total = True
+                    total_records, version = count_records(query, organization_id)
+                    if current_page != min(page, math.ceil(total_records / records_per_page) or 1):
+                        records, current_page, _, has_next_page, next_cursor, _ = query_page(
+                            query, page, records_per_page, total_records, keyset)
+        page = current_page
+
+        if count_total:
+            cache_total(totals_key, version, total_records)
+        elif total_records is None:
+            total_records = (page - 1) * records_per_page + len(records) + int(has_next_page)
+            total_type = constants.PAGING_TOTAL_ESTIMATED
+
+        paging = build_paging_info(page, records_per_page, total_records, total_type)
+        if keyset is not None:
+            paging['next_cursor'] = next_cursor
+
+    # Setup asdict_proxy to get a dict from each result item and build response
+    asdict_proxy = asdict_func or (lambda record: fieldset_asdict(record, fieldset))
+    data = [asdict_proxy(record) for record in records]
+    if expand is not None:
+        expand.embed(query.session, records, data)
+
+    return data, paging
+
+
+def stream_ndjson(session, query, asdict_func=None):
+    """
+    Generates all records of a query as JSON lines (NDJSON), with keys in camel case
+    as in other responses. Records are fetched in batches of STREAM_BATCH_SIZE while
+    the response is sent, so the whole collection is never held in memory.
+
+    :param session: The session of the query. It's closed when the generation ends.
+    :param query: Session query from SQL Alchemy to fetch records (or an iterable of records).
+    :param asdict_func: (Optional) Custom function to make a dict from a model.
+    :return: A generator of bytes (one chunk per batch) to be used as response stream.
+    """
+    json_handler = JSONHandler(contract_in_camel_case=True)
+    asdict_proxy = asdict_func or asdict
+    try:
+        for records in fetch_in_batches(query):
+            yield b''.join(json_handler.serialize(asdict_proxy(record)) + b'\n' for record in records)
+    finally:
+        session.close()
+
+
+def stream_csv(session, query, fields, asdict_func=None):
+    """
+    Generates all records of a query as CSV with a header of fields in camel case.
+    Records are fetched as in ``stream_ndjson``.
+
+    :param session: The session of the query. It's closed when the generation ends.
+    :param query: Session query from SQL Alchemy to fetch records (or an iterable of records).
+    :param fields: The fields (keys of the dict made from each record) to be written, in order.
+    :param asdict_func: (Optional) Custom function to make a dict from a model.
+    :return: A generator of bytes (one chunk per batch) to be used as response stream.
+    """
+    asdict_proxy = asdict_func or asdict
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    try:
+        writer.writerow([JSONHandler.camel_case(field) for field in fields])
+        for records in fetch_in_batches(query):
+            for record in records:
+                obj = asdict_proxy(record)
+                writer.writerow([obj.get(field) for field in fields])
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    finally:
+        session.close()
+
+
+def fetch_in_batches(query):
+    """
+    Generates the records of a query in lists of STREAM_BATCH_SIZE. Records are read
+    through a server-side cursor (see ``Query.yield_per``) where the database supports it.
+    Any other iterable of records is split in lists the same way.
+    """
+    if isinstance(query, Query):
+        query = query.yield_per(constants.STREAM_BATCH_SIZE)
+    records = iter(query)
+    while True:
+        batch = list(islice(records, constants.STREAM_BATCH_SIZE))
+        if not batch:
+            break
+        yield batch
+
+
+def gzip_stream(stream):
+    """
+    Compresses a stream (generator of bytes) with gzip as it's consumed.
+
+    :param stream: A generator of bytes.
+    :return: A generator of compressed bytes.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    try:
+        for chunk in stream:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        # Make sure the source stream is finished (e.g. to close its session)
+        stream.close()
+
+
+def get_paging_params(req):
+    """Gets the page and the records per page requested, adjusted to allowed values.
+
+    :param req: The request object. See Falcon Request documentation.
+    :return: A tuple with page and records per page.
+    """
     # Get (or adjust) page
     page = req.get_param_as_int('page')
     if page is None or page < 1:
@@ -37,41 +225,64 @@ def get_collection_page(req, query, asdict_func=None):
         records_per_page = constants.DEFAULT_RECORDS_PER_PAGE
     records_per_page = min(records_per_page, constants.MAX_RECORDS_PER_PAGE)
 
-    # Go fetch data
-    records, page, total_records = query_page(query, page, records_per_page)
-
-    # Setup asdict_proxy to get a dict from each result item and build response
-    asdict_proxy = asdict_func or asdict
-    data = [asdict_proxy(record) for record in records]
-    paging = build_paging_info(page, records_per_page, total_records)
+    return page, records_per_page
 
-    return data, paging
 
+def query_page(query, page, records_per_page, total_records=None, keyset=None, count_total=False,
+               organization_id=None):
+    """Fetches a page of records skipping the records of previous pages.
 
-def query_page(query, page, records_per_page):
-    total_records = query.count()
-    total_pages = math.ceil(total_records / records_per_page) or 1
+    :param query: Session query from SQL Alchemy to fetch records.
+    :param page: The page requested.
+    :param records_per_page: Number of records of the page.
+    :param total_records: (Optional) The total of records, used to return the last
+        page when the page requested is too high. Not checked when None.
+    :param keyset: (Optional) The ``paging.Keyset`` of query, to get the cursor of the next page.
+    :param count_total: (Optional) When true, records are counted. It's done in the same
+        statement as the page where the database supports it, else in another statement
+        before the page (so the last page is returned when the page requested is too high).
+    :param organization_id: (Optional) The organization of the collection. When informed, its
+        versions are read in the same statement as the records or their count.
+    :return: A tuple with the records, the page, the total of records (None when unknown),
+        whether there's a next page, the cursor of the next page (None without keyset) and
+        the versions of the organization (None when not read or there are no records).
+    """
+    version = None
+    if count_total and not supports_window_count(query.session):
+        total_records, version = count_records(query, organization_id)
+        count_total = False
 
-    # Adjust page and offset after fetching the actual number of records
-    # that would be returned from database. This ensures safe limits
-    # and return the last page when requested page is too high.
-    page = min(page, total_pages)
+    if total_records is not None:
+        page = min(page, math.ceil(total_records / records_per_page) or 1)
     offset = (page - 1) * records_per_page
 
-    result = query \
-        .limit(records_per_page) \
-        .offset(offset) \
-        .all()
+    records, has_next_page, next_cursor, counted_records, page_version = fetch_page(
+        query, records_per_page, offset, keyset, count_total=count_total,
+        organization_id=organization_id if version is None else None)
+    version = version or page_version
+    if count_total:
+        if records or page == 1:
+            total_records = counted_records or 0
+        else:
+            # Past the last page there's no row to count with, so they are counted apart
+            total_records, version = count_records(query, organization_id)
+            return query_page(query, page, records_per_page, total_records, keyset)[:-1] + (version,)
 
-    return result, page, total_records
+    return records, page, total_records, has_next_page, next_cursor, version
 
 
-def build_paging_info(page, records_per_page, total_records):
+def build_paging_info(page, records_per_page, total_records, total_type=constants.PAGING_TOTAL_COUNTED):
+    """Builds the paging info of a response.
+
+    :param total_type: (Optional) How the total of records was taken: counted,
+        cached (counted since the last write) or estimated.
+    """
     return {
         'current_page': page,
         'records_per_page': records_per_page,
         'total_pages': math.ceil(total_records / records_per_page) or 1,
-        'total_records': total_records
+        'total_records': total_records,
+        'total_records_type': total_type
     }
 
 
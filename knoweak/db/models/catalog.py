@@ -5,6 +5,13 @@ from sqlalchemy.orm import relationship
 from knoweak.db.models import DbModel
 
 
+class CatalogVersion(DbModel):
+    __tablename__ = "catalog_version"
+
+    catalog = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
 class BusinessDepartment(DbModel):
     __tablename__ = "business_department"
 
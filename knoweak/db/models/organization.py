@@ -1,6 +1,8 @@
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, ForeignKeyConstraint
+from sqlalchemy import (
+    Column, Integer, String, Text, DateTime, ForeignKey, Float, ForeignKeyConstraint, LargeBinary
+)
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import relationship
 
@@ -18,6 +20,9 @@ class Organization(DbModel):
     tax_id = Column(String, nullable=False)
     legal_name = Column(String, nullable=False)
     trade_name = Column(String)
+    risk_formula = Column(Text)
+    graph_version = Column(Integer, nullable=False, default=0)
+    totals_version = Column(Integer, nullable=False, default=0)
     created_on = Column(DateTime, nullable=False, default=datetime.utcnow)
     last_modified_on = Column(DateTime, nullable=False, default=datetime.utcnow)
 
@@ -161,28 +166,90 @@ class OrganizationAnalysis(DbModel):
     id = Column("organization_analysis_id", Integer, primary_key=True)
     organization_id = Column(Integer, ForeignKey(Organization.id), nullable=False)
     description = Column(String)
+    scopes = Column(Text)
+    fingerprint = Column(String)
+    details_format = Column(String)
+    risk_formula = Column(Text)
+    peak_rss_kb = Column(Integer)
+    total_details = Column(Integer)
+    archived_on = Column(DateTime)
     created_on = Column(DateTime, nullable=False, default=datetime.utcnow)
     last_modified_on = Column(DateTime, nullable=False, default=datetime.utcnow)
 
     details = relationship("OrganizationAnalysisDetail", passive_deletes=True)
 
 
+class OrganizationAnalysisArchive(DbModel):
+    __tablename__ = "organization_analysis_archive"
+
+    organization_analysis_id = Column(Integer, ForeignKey(OrganizationAnalysis.id), primary_key=True)
+    total_details = Column(Integer, nullable=False)
+    content = Column(LargeBinary, nullable=False)
+    created_on = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 class OrganizationAnalysisDetail(DbModel):
     __tablename__ = "organization_analysis_detail"
 
     id = Column("organization_analysis_detail_id", Integer, primary_key=True)
     organization_analysis_id = Column(Integer, ForeignKey(OrganizationAnalysis.id), nullable=False)
-    department_name = Column(String, nullable=False)
-    macroprocess_name = Column(String, nullable=False)
-    process_name = Column(String, nullable=False)
+    it_service_instance_id = Column("organization_it_service_id", Integer)
+    it_asset_instance_id = Column("organization_it_asset_id", Integer)
+    organization_security_threat_id = Column(Integer)
+    department_name = Column(String)
+    department_name_id = Column(Integer)
+    macroprocess_name = Column(String)
+    macroprocess_name_id = Column(Integer)
+    process_name = Column(String)
+    process_name_id = Column(Integer)
     process_relevance = Column(Integer, nullable=False)
-    it_service_name = Column(String, nullable=False)
+    it_service_name = Column(String)
+    it_service_name_id = Column(Integer)
     it_service_relevance = Column(Integer, nullable=False)
-    it_asset_name = Column(String, nullable=False)
+    it_asset_name = Column(String)
+    it_asset_name_id = Column(Integer)
     it_asset_relevance = Column(Integer, nullable=False)
     calculated_impact = Column(Float, nullable=False)
-    security_threat_name = Column(String, nullable=False)
+    security_threat_name = Column(String)
+    security_threat_name_id = Column(Integer)
     security_threat_level = Column(Integer, nullable=False)
     it_asset_vulnerability_level = Column(Integer, nullable=False)
     calculated_probability = Column(Float, nullable=False)
     calculated_risk = Column(Float, nullable=False)
+    risk_rank = Column(Integer)
+
+
+class OrganizationAnalysisName(DbModel):
+    __tablename__ = "organization_analysis_name"
+
+    organization_analysis_id = Column(Integer, ForeignKey(OrganizationAnalysis.id), primary_key=True)
+    id = Column("organization_analysis_name_id", Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+
+
+class OrganizationAnalysisRollup(DbModel):
+    __tablename__ = "organization_analysis_rollup"
+
+    id = Column("organization_analysis_rollup_id", Integer, primary_key=True)
+    organization_analysis_id = Column(Integer, ForeignKey(OrganizationAnalysis.id), nullable=False)
+    level = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    max_risk = Column(Float, nullable=False)
+    sum_risk = Column(Float, nullable=False)
+    mean_risk = Column(Float, nullable=False)
+    total_details = Column(Integer, nullable=False)
+
+
+class OrganizationAnalysisJob(DbModel):
+    __tablename__ = "organization_analysis_job"
+
+    id = Column("organization_analysis_job_id", Integer, primary_key=True)
+    organization_id = Column(Integer, ForeignKey(Organization.id), nullable=False)
+    analysis_id = Column("organization_analysis_id", Integer, ForeignKey(OrganizationAnalysis.id))
+    status = Column(String, nullable=False)
+    total_processed_items = Column(Integer)
+    errors = Column(Text)
+    created_on = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_on = Column(DateTime)
+    finished_on = Column(DateTime)
+    last_modified_on = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -13,3 +13,25 @@ AUTH = {
     'disabled': bool(strtobool(os.environ.get('AUTH_DISABLED', 'No'))),
     'secret_key': os.environ.get('ACCESS_TOKEN_SECRET_KEY', '')
 }
+
+ANALYSIS = {
+    'engine': os.environ.get('ANALYSIS_ENGINE', 'vectorized'),
+    'persistence': os.environ.get('ANALYSIS_PERSISTENCE', 'bulk'),
+    'bulk_insert_batch_size': int(os.environ.get('ANALYSIS_BULK_INSERT_BATCH_SIZE', 5000)),
+    'job_workers': int(os.environ.get('ANALYSIS_JOB_WORKERS', 2)),
+    'job_heartbeat_seconds': int(os.environ.get('ANALYSIS_JOB_HEARTBEAT_SECONDS', 30)),
+    'job_timeout_seconds': int(os.environ.get('ANALYSIS_JOB_TIMEOUT_SECONDS', 300)),
+    'streaming': bool(strtobool(os.environ.get('ANALYSIS_STREAMING', 'No'))),
+    'stream_chunk_size': int(os.environ.get('ANALYSIS_STREAM_CHUNK_SIZE', 10000)),
+    'details_format': os.environ.get('ANALYSIS_DETAILS_FORMAT', 'dictionary'),
+    'graph_cache': bool(strtobool(os.environ.get('ANALYSIS_GRAPH_CACHE', 'Yes'))),
+    'graph_cache_size': int(os.environ.get('ANALYSIS_GRAPH_CACHE_SIZE', 64)),
+    'archive_after_days': int(os.environ.get('ANALYSIS_ARCHIVE_AFTER_DAYS', 180)),
+    'archive_cache_mb': int(os.environ.get('ANALYSIS_ARCHIVE_CACHE_MB', 256)),
+    'diff_cache_mb': int(os.environ.get('ANALYSIS_DIFF_CACHE_MB', 128)),
+    'formula_cache_size': int(os.environ.get('ANALYSIS_FORMULA_CACHE_SIZE', 128))
+}
+
+PAGING = {
+    'totals_cache_size': int(os.environ.get('PAGING_TOTALS_CACHE_SIZE', 1024))
+}
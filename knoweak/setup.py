@@ -8,8 +8,9 @@ from .api.resources import (
     organization, organization_department, organization_macroprocess, organization_process, organization_it_asset,
     organization_it_service, organization_it_service_it_asset, organization_security_threat,
     organization_it_asset_vulnerability, organization_it_asset_control,
-    organization_analysis, organization_analysis_details, system, system_user, system_role, system_user_role,
-    user_session
+    organization_analysis, organization_analysis_details, organization_analysis_diff, organization_analysis_job,
+    organization_analysis_simulation, organization_analysis_summary,
+    system, system_user, system_role, system_user_role, user_session
 )
 
 
@@ -78,8 +79,13 @@ def configure_routes(api):
     api.add_route('/organizations/{organization_code}/securityThreats', organization_security_threat.Collection())
     api.add_route('/organizations/{organization_code}/securityThreats/{security_threat_id}', organization_security_threat.Item())
     api.add_route('/organizations/{organization_code}/analyses', organization_analysis.Collection())
+    api.add_route('/organizations/{organization_code}/analyses/jobs/{job_id}', organization_analysis_job.Item())
+    api.add_route('/organizations/{organization_code}/analyses/simulate', organization_analysis_simulation.Simulation())
     api.add_route('/organizations/{organization_code}/analyses/{analysis_id}', organization_analysis.Item())
     api.add_route('/organizations/{organization_code}/analyses/{analysis_id}/details', organization_analysis_details.Collection())
+    api.add_route('/organizations/{organization_code}/analyses/{analysis_id}/details/export', organization_analysis_details.Export())
+    api.add_route('/organizations/{organization_code}/analyses/{analysis_id}/summary', organization_analysis_summary.Item())
+    api.add_route('/organizations/{organization_code}/analyses/{analysis_id}/diff/{other_analysis_id}', organization_analysis_diff.Collection())
 
     # Routes for system user and access control
     api.add_route('/system/roles', system_role.Collection())